@@ -0,0 +1,115 @@
+"""
+Benchmark of the availability engine on large synthetic calendars.
+
+Generates a calendar with a given number of busy events over a long horizon
+and times the previous get_available_slots loop (step through the horizon in
+meeting-length increments, re-parsing every busy block at each step) against
+BusySchedule: building the merged intervals, listing slots, free gaps within
+working hours with buffers, bulk capacity for many meeting lengths and
+point availability checks. The previous loop is only run up to --legacy-days
+because it grows with horizon length times calendar size.
+
+Usage:
+    python -m benchmarks.bench_availability --events 20000 --days 365
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from email_assistant.availability import BusySchedule
+
+
+def make_busy(events: int, days: int, seed: int = 0) -> list:
+    """Return freebusy-style busy blocks spread over days, as ISO strings."""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 6, tzinfo=timezone.utc)
+    busy = []
+    for _ in range(events):
+        begin = start + timedelta(minutes=15 * rng.randrange(days * 24 * 4))
+        end = begin + timedelta(minutes=rng.choice([15, 30, 30, 45, 60, 60, 90, 120, 240]))
+        busy.append({"start": begin.isoformat().replace("+00:00", "Z"), "end": end.isoformat().replace("+00:00", "Z")})
+    return busy
+
+
+def legacy_slots(busy: list, start: datetime, days: int, duration_minutes: int) -> list:
+    """The get_available_slots loop this engine replaced."""
+    end_time = start + timedelta(days=days)
+    available_slots = []
+    current_time = start
+    while current_time < end_time:
+        slot_end = current_time + timedelta(minutes=duration_minutes)
+        is_available = True
+        for block in busy:
+            busy_start = datetime.fromisoformat(block["start"].replace("Z", "+00:00"))
+            busy_end = datetime.fromisoformat(block["end"].replace("Z", "+00:00"))
+            if current_time < busy_end and slot_end > busy_start:
+                is_available = False
+                current_time = busy_end
+                break
+        if is_available:
+            available_slots.append({"start": current_time, "end": slot_end})
+        current_time = slot_end
+    return available_slots
+
+
+def timed_ms(function, repeat: int = 3):
+    """Run function repeat times and return (best milliseconds, last result)."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, (time.perf_counter() - started) * 1000)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the availability engine.")
+    parser.add_argument("--events", type=int, default=20000, help="Busy events in the calendar.")
+    parser.add_argument("--days", type=int, default=365, help="Horizon in days.")
+    parser.add_argument("--duration", type=int, default=30, help="Meeting length in minutes.")
+    parser.add_argument("--legacy-days", type=int, default=7, help="Longest horizon the previous loop is run on.")
+    parser.add_argument("--queries", type=int, default=10000, help="Point availability checks.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    busy = make_busy(args.events, args.days)
+    start = datetime(2025, 1, 6, tzinfo=timezone.utc)
+    end = start + timedelta(days=args.days)
+    print(f"{args.events} busy events over {args.days} days, {args.duration}-minute meetings\n")
+
+    legacy_days = min(args.days, args.legacy_days)
+    legacy_busy = [block for block in busy if block["start"] < (start + timedelta(days=legacy_days)).isoformat()]
+    ms, slots = timed_ms(lambda: legacy_slots(legacy_busy, start, legacy_days, args.duration), 1)
+    print(f"{'previous loop (' + str(legacy_days) + ' days)':<40} {ms:>10.1f} ms  {len(slots)} slots")
+
+    ms, schedule = timed_ms(lambda: BusySchedule.from_freebusy(busy), args.repeat)
+    print(f"{'build (parse + merge)':<40} {ms:>10.1f} ms  {len(schedule)} merged intervals")
+
+    legacy_end = start + timedelta(days=legacy_days)
+    ms, slots = timed_ms(lambda: schedule.slots(start, legacy_end, args.duration), args.repeat)
+    print(f"{'slots (' + str(legacy_days) + ' days)':<40} {ms:>10.1f} ms  {len(slots)} slots")
+
+    ms, slots = timed_ms(lambda: schedule.slots(start, end, args.duration), args.repeat)
+    print(f"{'slots (' + str(args.days) + ' days)':<40} {ms:>10.1f} ms  {len(slots)} slots")
+
+    ms, (gap_starts, _) = timed_ms(lambda: schedule.free_gaps(
+        start, end, working_hours=(9, 17), tz="America/New_York", buffer_minutes=10,
+        min_minutes=args.duration, weekdays_only=True), args.repeat)
+    print(f"{'free gaps (hours, buffers, min length)':<40} {ms:>10.1f} ms  {len(gap_starts)} gaps")
+
+    durations = list(range(15, 8 * 60 + 1, 15))
+    ms, capacity = timed_ms(lambda: schedule.capacity(start, end, durations, working_hours=(9, 17)), args.repeat)
+    print(f"{'capacity (' + str(len(durations)) + ' durations)':<40} {ms:>10.1f} ms  "
+          f"{capacity['slots'][0]} x 15 min ... {capacity['slots'][-1]} x 8 h")
+
+    rng = random.Random(1)
+    probes = [start.timestamp() + 900 * rng.randrange(args.days * 96) for _ in range(args.queries)]
+    ms, free = timed_ms(lambda: sum(schedule.is_free(probe, probe + args.duration * 60) for probe in probes),
+                        args.repeat)
+    print(f"{'is_free x ' + str(args.queries):<40} {ms:>10.1f} ms  "
+          f"{ms * 1000 / args.queries:.1f} us each, {free} free")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Benchmark of the meeting and draft paths against the fake Google APIs.
+
+Drives process_meeting_email end to end (date parsing, attendee freebusy
+query, organizer availability from the synced event cache, event insert)
+for many synthetic meetings, sequentially and from several threads, then
+the batched process_meeting_emails, a second pass over the same emails
+(every event already exists), the asyncio pipeline process_meeting_emails_async
+(with a generous deadline and with one shorter than the simulated latency)
+and Gmail drafts through save_draft_if_needed.
+The fake server's latency is fixed, so changes in the numbers reflect our
+own overhead and the number of round trips per meeting.
+
+The calendar event cache is kept in memory only.
+
+Usage:
+    python -m benchmarks.bench_calendar_path --meetings 200 --threads 8 --concurrency 50 --latency 0.02
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fake_google import build_service, start_fake_google
+
+
+def make_meetings(count: int, attendees: int, prefix: str, seed: int = 0) -> list:
+    """Return meeting details as extract_meeting_details hands them to process_meeting_email."""
+    rng = random.Random(seed)
+    today = datetime.now(timezone.utc).date()
+    pool = [f"person{n}@example.com" for n in range(40)]
+    meetings = []
+    for n in range(count):
+        day = today + timedelta(days=1 + rng.randrange(7))
+        start = datetime(day.year, day.month, day.day, 9) + timedelta(minutes=30 * rng.randrange(16))
+        end = start + timedelta(minutes=rng.choice([30, 60]))
+        meetings.append({
+            "summary": f"Sync #{n}",
+            "location": "Room B",
+            "description": "Benchmark meeting",
+            "start_date": start.strftime("%d-%m-%Y"),
+            "start_time": start.strftime("%I:%M %p"),
+            "end_date": end.strftime("%d-%m-%Y"),
+            "end_time": end.strftime("%I:%M %p"),
+            "attendees": ", ".join(rng.sample(pool, attendees)),
+            "source_id": f"<{prefix}-{n}@example.com>",
+        })
+    return meetings
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))] if values else 0.0
+
+
+def report(name: str, timings: list, results: list, elapsed: float) -> None:
+    statuses = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    summary = ", ".join(f"{status} {count}" for status, count in sorted(statuses.items()))
+    print(f"{name:<34} {len(results) / elapsed:>8.1f}/s {percentile(timings, 0.5) * 1000:>9.1f} "
+          f"{percentile(timings, 0.95) * 1000:>9.1f}   {summary}")
+
+
+def run(function, items, threads: int = 1):
+    """Call function on every item, returning (per-item seconds, results, wall seconds)."""
+    timings, results, lock = [], [], threading.Lock()
+
+    def one(item):
+        started = time.perf_counter()
+        result = function(item)
+        with lock:
+            timings.append(time.perf_counter() - started)
+            results.append(result)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if threads == 1:
+            for item in items:
+                one(item)
+        else:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(one, items))
+    return timings, results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the calendar and draft paths against fake Google APIs.")
+    parser.add_argument("--meetings", type=int, default=200)
+    parser.add_argument("--attendees", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=50, help="Meetings in flight in the asyncio pipeline.")
+    parser.add_argument("--drafts", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--busy-per-day", type=int, default=3)
+    args = parser.parse_args()
+
+    server, url = start_fake_google(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        error_status=args.error_status, busy_per_day=args.busy_per_day,
+    )
+    backend = server.RequestHandlerClass.backend
+
+    from email_assistant import calendar_cache, calendar_service, process_meeting_email
+    from email_assistant.async_calendar import AsyncCalendarService
+    from email_assistant.save_draft_email import save_draft_if_needed
+
+    logging.getLogger("email_assistant").setLevel(logging.WARNING)
+    # Point the assistant at the fake server, with an in-memory event cache.
+    service = build_service("calendar", "v3", url)
+    calendar_cache._event_caches["primary"] = calendar_cache.CalendarEventCache(service, path=None)
+    calendar_service._calendar_service = calendar_service.CalendarService(service=service)
+    gmail = build_service("gmail", "v1", url)
+
+    started = time.perf_counter()
+    calendar_service._calendar_service.event_cache.sync()
+    print(f"Initial calendar sync in {(time.perf_counter() - started) * 1000:.1f} ms, "
+          f"{args.latency * 1000:.0f} ms simulated latency per request\n")
+
+    print(f"{'scenario':<34} {'throughput':>10} {'p50 ms':>9} {'p95 ms':>9}   statuses")
+    sequential = make_meetings(args.meetings, args.attendees, "sequential", seed=1)
+    report("process_meeting_email", *run(process_meeting_email.process_meeting_email, sequential))
+
+    threaded = make_meetings(args.meetings, args.attendees, "threaded", seed=2)
+    report(f"process_meeting_email x{args.threads} threads",
+           *run(process_meeting_email.process_meeting_email, threaded, args.threads))
+
+    batched = make_meetings(args.meetings, args.attendees, "batched", seed=3)
+    timings, results, elapsed = run(process_meeting_email.process_meeting_emails, [batched])
+    report("process_meeting_emails (batch)", [elapsed / len(batched)] * len(batched), results[0], elapsed)
+
+    timings, results, elapsed = run(process_meeting_email.process_meeting_emails, [batched])
+    report("process_meeting_emails (again)", [elapsed / len(batched)] * len(batched), results[0], elapsed)
+
+    async def pipeline(meetings, deadline):
+        async with AsyncCalendarService(base_url=f"{url}/calendar/v3/",
+                                        event_cache=calendar_service._calendar_service.event_cache) as service:
+            return await process_meeting_email.process_meeting_emails_async(
+                meetings, service, concurrency=args.concurrency, deadline=deadline)
+
+    pipelined = make_meetings(args.meetings, args.attendees, "async", seed=4)
+    timings, results, elapsed = run(lambda meetings: asyncio.run(pipeline(meetings, 30)), [pipelined])
+    report(f"process_meeting_emails_async x{args.concurrency}", [elapsed / len(pipelined)] * len(pipelined),
+           results[0], elapsed)
+
+    late = make_meetings(args.meetings, args.attendees, "late", seed=5)
+    timings, results, elapsed = run(lambda meetings: asyncio.run(pipeline(meetings, args.latency / 2)), [late])
+    report("  with a deadline of latency / 2", [elapsed / len(late)] * len(late), results[0], elapsed)
+
+    def draft(n):
+        save_draft_if_needed(f"Re: Sync #{n}", "Thanks, that time works for me.", "person1@example.com",
+                             service=gmail)
+        return {"status": "success"}
+
+    report(f"save_draft_if_needed x{args.threads} threads", *run(draft, range(args.drafts), args.threads))
+
+    print(f"\nFake API requests: {backend.requests}")
+    print(f"Event cache: {calendar_service._calendar_service.event_cache.stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark of rule-based date and time extraction on meeting phrasing.
+
+Times the previous parse_datetime_with_dateutil (regexes joined and compiled
+on every call, then dateutil.parser on each match) against extract_datetime
+cold (memo cleared before every call), warm (memo hits) and in batch, and
+reports how many texts each one reads, how many results the extractor is
+confident enough to schedule without the model, and accuracy against the
+expected start times for a fixed reference time.
+
+Usage:
+    python -m benchmarks.bench_datetime_extract --repeat 200
+"""
+import argparse
+import re
+import time
+from datetime import datetime
+
+import pytz
+from dateutil import parser
+
+from email_assistant.datetime_extract import clear_cache, extract_datetime, extract_datetimes
+
+# Wednesday 14 October 2026, 10:00 UTC
+REFERENCE = datetime(2026, 10, 14, 10, 0, tzinfo=pytz.UTC)
+
+# (text, expected start in UTC as "YYYY-MM-DD HH:MM", or None when there is no meeting time)
+CORPUS = [
+    ("Can we meet next Friday at 3pm?", "2026-10-16 15:00"),
+    ("tomorrow at 10:30 am works for me", "2026-10-15 10:30"),
+    ("Meeting on 05-04-2025 at 3:00 pm", "2025-04-05 15:00"),
+    ("Proposed slot: 2025-04-05 15:00", "2025-04-05 15:00"),
+    ("How about Friday 3-4pm?", "2026-10-16 15:00"),
+    ("Call on April 5th, 2025 from 2:00 to 3:30 PM IST", "2025-04-05 08:30"),
+    ("Lunch on 5 December at noon?", "2026-12-05 12:00"),
+    ("Are you free Monday morning at 9?", "2026-10-19 09:00"),
+    ("in 3 days at 11am", "2026-10-17 11:00"),
+    ("Let's do it in two weeks at 4 pm PST", "2026-10-28 23:00"),
+    ("Deadline review 12/31/2026 9am", "2026-12-31 09:00"),
+    ("Dec 1 2026 4.30pm in room 4", "2026-12-01 16:30"),
+    ("Interview scheduled for March 3, 2027 at 10:00 AM", "2027-03-03 10:00"),
+    ("Standup today 11-11:15am", "2026-10-14 11:00"),
+    ("Fri 10am?", "2026-10-16 10:00"),
+    ("Could we move the sync to Thursday, 22 October 2026 at 14:30?", "2026-10-22 14:30"),
+    ("Please join the webinar on 10/11/2026 at 6 pm", "2026-11-10 18:00"),
+    ("Let's meet tomorrow at 3pm.\n\nOn Mon, Oct 12, 2026 at 9:04 AM Bob wrote:\n> Any news?", "2026-10-15 15:00"),
+    ("Next Tuesday at 2pm. The report deadline is 30/10/2026", "2026-10-20 14:00"),
+    ("May I ask about the 5 reports?", None),
+    ("Revenue grew 4% in Q3", None),
+    ("Thanks for your help with the migration!", None),
+]
+
+_LEGACY_PATTERNS = [
+    r'\b\d{1,2}[-/]\d{1,2}[-/]\d{2,4}\b',
+    r'\b\d{1,2} \w+ \d{2,4}\b',
+    r'\b\w+ \d{1,2}, \d{2,4}\b',
+    r'\b\d{1,2}:\d{2} ?[APap][mM]?\b',
+    r'\b\d{1,2}:\d{2}:\d{2} ?[APap][mM]?\b',
+]
+
+
+def legacy_parse(text: str):
+    """The parse_datetime_with_dateutil this extractor replaced."""
+    for match in re.findall('|'.join(_LEGACY_PATTERNS), text):
+        try:
+            return parser.parse(match)
+        except ValueError:
+            continue
+    raise ValueError(f"No valid date or time found in the text: {text}")
+
+
+def legacy_or_none(text: str):
+    try:
+        return legacy_parse(text)
+    except (ValueError, OverflowError):
+        return None
+
+
+def timed_us(function, texts, repeat: int) -> float:
+    """Return the best microseconds per text of function over repeat passes."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in texts:
+            function(text)
+        best = min(best, (time.perf_counter() - started) * 1e6 / len(texts))
+    return best
+
+
+def cold_extract(text: str):
+    clear_cache()
+    return extract_datetime(text, REFERENCE, tz="UTC")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark date and time extraction.")
+    arg_parser.add_argument("--repeat", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    texts = [text for text, _ in CORPUS]
+    print(f"{len(texts)} texts, reference {REFERENCE:%a %Y-%m-%d %H:%M %Z}\n")
+
+    legacy = [legacy_or_none(text) for text in texts]
+    results = extract_datetimes(texts, REFERENCE, tz="UTC")
+    correct = 0
+    for (text, expected), result in zip(CORPUS, results):
+        got = result.start.astimezone(pytz.UTC).strftime("%Y-%m-%d %H:%M") if result and result.has_time else None
+        correct += got == expected
+        if got != expected:
+            print(f"  mismatch: {text!r}: expected {expected}, got {got}")
+
+    meetings = sum(expected is not None for _, expected in CORPUS)
+    print(f"{'previous parser reads':<40} {sum(value is not None for value in legacy):>4} / {len(texts)}")
+    print(f"{'extractor reads':<40} {sum(result is not None for result in results):>4} / {len(texts)}")
+    print(f"{'confident (model skipped)':<40} {sum(bool(result and result.confident) for result in results):>4}"
+          f" / {meetings}")
+    print(f"{'correct start':<40} {correct:>4} / {len(texts)}\n")
+
+    print(f"{'previous parser':<40} {timed_us(legacy_or_none, texts, args.repeat):>8.1f} us/text")
+    print(f"{'extractor, cold':<40} {timed_us(cold_extract, texts, args.repeat):>8.1f} us/text")
+    extract_datetimes(texts, REFERENCE, tz="UTC")
+    print(f"{'extractor, warm (memo)':<40} "
+          f"{timed_us(lambda text: extract_datetime(text, REFERENCE, tz='UTC'), texts, args.repeat):>8.1f} us/text")
+    best = float("inf")
+    for _ in range(args.repeat):
+        clear_cache()
+        started = time.perf_counter()
+        extract_datetimes(texts, REFERENCE, tz="UTC")
+        best = min(best, (time.perf_counter() - started) * 1e6 / len(texts))
+    print(f"{'extractor, batch (cold)':<40} {best:>8.1f} us/text")
+
+
+if __name__ == "__main__":
+    main()
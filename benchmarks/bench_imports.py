@@ -0,0 +1,119 @@
+"""
+Import-time benchmark for the Streamlit app, the CLI entry point and the
+feature modules.
+
+Each target runs in a fresh interpreter with `python -X importtime`; the
+report shows the total import time, the wall-clock start time, the packages
+that cost the most and whether any heavy dependency (LLM stack, Google or
+Slack clients, BeautifulSoup) was loaded. With --check the script fails when
+a light target (the Home page, the CLI start, models, store_emails) loads one
+of them or does not import at all.
+
+Usage:
+    python -m benchmarks.bench_imports --repeat 5
+    python -m benchmarks.bench_imports --check
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_PACKAGES = (
+    "langchain", "langchain_core", "langchain_community", "langchain_ollama", "faiss", "numpy",
+    "googleapiclient", "google_auth_oauthlib", "slack_sdk", "bs4", "sklearn", "torch", "transformers",
+)
+
+# (name, command arguments after the interpreter, whether heavy packages are forbidden)
+TARGETS = [
+    ("streamlit_app (Home page)", ["streamlit_app.py"], True),
+    ("python -m email_assistant (imports)", ["-c", "import email_assistant.__main__"], True),
+    ("email_assistant.models", ["-c", "import email_assistant.models"], True),
+    ("email_assistant.store_emails", ["-c", "import email_assistant.store_emails"], True),
+    ("email_assistant.rag_setup", ["-c", "import email_assistant.rag_setup"], False),
+    ("email_assistant.enrichment", ["-c", "import email_assistant.enrichment"], False),
+    ("email_assistant.process_meeting_email", ["-c", "import email_assistant.process_meeting_email"], False),
+    ("email_assistant.slack_operations", ["-c", "import email_assistant.slack_operations"], False),
+    ("email_assistant.web_search_service", ["-c", "import email_assistant.web_search_service"], False),
+]
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Parse `-X importtime` output.
+
+    Returns:
+        Tuple of (total import seconds, self seconds per top-level package).
+    """
+    total = 0.0
+    per_package = defaultdict(float)
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        per_package[module.split(".")[0]] += int(self_us) / 1e6
+        if len(indent) == 1:  # top-level import: its cumulative time includes every nested import
+            total += int(cumulative_us) / 1e6
+    return total, dict(per_package)
+
+
+def measure(args: List[str]) -> Tuple[float, float, Dict[str, float], str]:
+    """
+    Run one target in a fresh interpreter.
+
+    Returns:
+        Tuple of (import seconds, wall seconds, self seconds per package, error output or "").
+    """
+    env = dict(os.environ, STREAMLIT_GLOBAL_SHOW_WARNING_ON_DIRECT_EXECUTION="false")
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *args], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    total, per_package = parse_importtime(process.stderr)
+    error = ""
+    if process.returncode != 0:
+        error = [line for line in process.stderr.splitlines() if not line.startswith("import time:")][-1:]
+        error = error[0] if error else f"exit status {process.returncode}"
+    return total, wall, per_package, error
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time of the app entry points.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per target; the fastest run is reported.")
+    parser.add_argument("--top", type=int, default=5, help="Number of most expensive packages to list.")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit with status 1 if a light target loads a heavy package.")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'target':<42} {'import ms':>10} {'wall ms':>9}  heavy packages loaded")
+    for name, command, light in TARGETS:
+        runs = [measure(command) for _ in range(max(1, args.repeat))]
+        total, wall, per_package, error = min(runs, key=lambda run: run[0])
+        heavy = sorted(package for package in per_package if package in HEAVY_PACKAGES)
+        print(f"{name:<42} {total * 1000:>10.1f} {wall * 1000:>9.1f}  {', '.join(heavy) or '-'}")
+        if error:
+            print(f"{'':<42} failed: {error}")
+            failures.append(f"{name} failed to import")
+        top = sorted(per_package.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        print(f"{'':<42} slowest: " + ", ".join(f"{package} {seconds * 1000:.0f}ms" for package, seconds in top))
+        if light and heavy:
+            failures.append(f"{name} loads {', '.join(heavy)}")
+
+    if failures:
+        print("\nProblems:\n  " + "\n  ".join(failures))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark of the LLM path against the fake Ollama server.
+
+Drives chat_model, extract_meeting_details and chatbot_interaction over a
+temporary SQLite mailbox and reports end-to-end latency per entry point and
+per-stage latency (embedding, index build, retrieval, first token,
+generation, post-processing). The fake server's token rate and time to first
+token are fixed, so changes in the numbers reflect our own overhead.
+
+The response cache is disabled and the calendar step of meeting extraction
+is replaced by a no-op so only the LLM path is measured.
+
+Usage:
+    python -m benchmarks.bench_llm_path --emails 200 --runs 20 --token-rate 200 --ttft 0.05
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+
+from benchmarks.fake_ollama import start_fake_ollama
+
+SUBJECTS = ["Quarterly planning", "Invoice overdue", "Team offsite", "Weekly report", "Design review"]
+BODIES = [
+    "Hi team,\n\nCan we schedule a meeting on Friday at 3:00 pm in conference room B to review the roadmap?\n\nThanks",
+    "Hello,\n\nThe invoice #{n} is overdue. Please process the payment as soon as possible.\n\nRegards",
+    "Hi all,\n\nFYI the offsite is confirmed for next month. No reply needed.\n\nCheers",
+    "Team,\n\nAttached is the weekly report. Revenue grew 4% and churn fell slightly.\n\nBest",
+    "Hey,\n\nCould you review the new design before Thursday and let me know what you think?\n\nThanks",
+]
+
+
+def seed_mailbox(session, count: int) -> list:
+    """Insert count synthetic emails and return their IDs."""
+    from email_assistant.models import Email
+
+    rng = random.Random(0)
+    now = datetime(2026, 10, 1, 9, 0)
+    ids = []
+    for n in range(count):
+        kind = rng.randrange(len(SUBJECTS))
+        email = Email(
+            thread_id=f"<thread-{n % 50}@example.com>",
+            message_id=f"<bench-{n}@example.com>",
+            sender=f"user{n % 20}@example.com",
+            recipient="me@example.com",
+            subject=f"{SUBJECTS[kind]} #{n}",
+            timestamp=now - timedelta(hours=n),
+            body=BODIES[kind].format(n=n),
+        )
+        session.add(email)
+        session.flush()
+        ids.append(email.id)
+    session.commit()
+    return ids
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LLM path against a fake Ollama server.")
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--token-rate", type=float, default=200.0)
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--think-tokens", type=int, default=40)
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    server, url = start_fake_ollama(
+        token_rate=args.token_rate, ttft=args.ttft, think_tokens=args.think_tokens,
+        embedding_dim=args.embedding_dim,
+    )
+
+    from email_assistant import llm_cache, metrics, models, process_meeting_email, rag_setup
+    from email_assistant.llm_scheduler import get_scheduler
+    from email_assistant.mailbox_search import MailboxIndex
+    from email_assistant.stream_filter import YES_NO
+    from langchain_ollama import OllamaEmbeddings
+
+    # Point the assistant at a throwaway database and the fake server.
+    database = os.path.join(tempfile.mkdtemp(prefix="bench_llm_"), "bench.db")
+    engine = create_engine(f"sqlite:///{database}")
+    models.session_factory.configure(bind=engine)
+    models.db.remove()
+    models.Base.metadata.create_all(engine)
+    rag_setup.OLLAMA_BASE_URL = url
+    rag_setup._mailbox_index = MailboxIndex(OllamaEmbeddings(model=rag_setup.MODEL_NAME, base_url=url), directory=None)
+    process_meeting_email.process_meeting_email = lambda meeting_details: {"status": "skipped"}
+    llm_cache.set_response_cache(llm_cache.ResponseCache(path=None, max_entries=0))
+
+    email_ids = seed_mailbox(models.db, args.emails)
+    started = time.perf_counter()
+    rag_setup.get_mailbox_index().refresh(models.db)
+    print(f"Indexed {args.emails} emails in {time.perf_counter() - started:.2f}s\n")
+    metrics.reset()
+
+    rng = random.Random(1)
+    cases = {
+        "chat_model (summary)": lambda email_id: rag_setup.chat_model(email_id, "Summarize the email content"),
+        "chat_model (yes/no)": lambda email_id: rag_setup.chat_model(
+            email_id, "Is this email important? Respond with 'Yes' or 'No'.", stop=YES_NO),
+        "extract_meeting_details": lambda email_id: rag_setup.extract_meeting_details(
+            models.db.get(models.Email, email_id).body),
+        "chatbot_interaction": lambda email_id: rag_setup.chatbot_interaction(
+            "What did the invoice emails ask for?"),
+    }
+    timings = {name: [] for name in cases}
+    for _ in range(args.runs):
+        email_id = rng.choice(email_ids)
+        for name, case in cases.items():
+            case_started = time.perf_counter()
+            case(email_id)
+            timings[name].append(time.perf_counter() - case_started)
+
+    print(f"{'entry point':<26} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, values in timings.items():
+        print(f"{name:<26} {sum(values) / len(values) * 1000:>9.1f} {percentile(values, 0.5) * 1000:>9.1f} "
+              f"{percentile(values, 0.95) * 1000:>9.1f}")
+
+    print(f"\n{'stage':<26} {'count':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'total ms':>10}")
+    for stage, stats in sorted(metrics.stage_stats().items()):
+        print(f"{stage:<26} {stats['count']:>6} {stats['mean_ms']:>9.2f} {stats['p50_ms']:>9.2f} "
+              f"{stats['p95_ms']:>9.2f} {stats['total_ms']:>10.1f}")
+
+    print(f"\nFake Ollama requests: {server.RequestHandlerClass.config.requests}")
+    print(f"LLM scheduler: {get_scheduler().stats()['per_priority']}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Benchmark of the Slack path against the fake Slack Web API.
+
+Compares sending messages the previous way (a new WebClient and an
+auth.test round trip per SlackOperations instance, a new connection per
+call) with the shared pooled client, SlackOperations.send_message through
+the outbox, several threads on the shared client and the AsyncWebClient
+variant. Then replays a backfill burst of important-email notifications
+into a rate-limited fake and drains it with SlackDeliveryWorker, one message
+per email and in digest mode.
+
+The outbox lives in a temporary SQLite database. The fake server's latency
+is fixed, so changes in the numbers reflect our own overhead and the number
+of round trips and connections per message.
+
+Usage:
+    python -m benchmarks.bench_slack_path --messages 200 --threads 8 --latency 0.01
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine
+
+from benchmarks.fake_slack import start_fake_slack
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))] if values else 0.0
+
+
+def report(name: str, backend, before: dict, timings: list, elapsed: float) -> None:
+    calls = sum(backend.requests[method] - before.get(method, 0) for method in ("auth.test", "chat.postMessage"))
+    connections = backend.requests["connections"] - before.get("connections", 0)
+    print(f"{name:<40} {len(timings) / elapsed:>8.1f}/s {percentile(timings, 0.5) * 1000:>8.2f} "
+          f"{percentile(timings, 0.95) * 1000:>8.2f} {calls:>7} {connections:>7}")
+
+
+def run(function, items, threads: int = 1):
+    """Call function on every item, returning (per-item seconds, wall seconds)."""
+    timings, lock = [], threading.Lock()
+
+    def one(item):
+        started = time.perf_counter()
+        function(item)
+        with lock:
+            timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    if threads == 1:
+        for item in items:
+            one(item)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, items))
+    return timings, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Slack path against a fake Slack Web API.")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=10, help="Connections of the async client.")
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--backfill", type=int, default=200, help="Important emails in the backfill burst.")
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--post-interval", type=float, default=0.05,
+                        help="Seconds per message per channel in the backfill's rate limit.")
+    parser.add_argument("--digest-window", type=float, default=0.5)
+    args = parser.parse_args()
+
+    server, url = start_fake_slack(latency=args.latency, rate_limits=False)
+    backend = server.RequestHandlerClass.backend
+
+    from slack_sdk import WebClient
+
+    from email_assistant import models, slack_client, slack_outbox
+    from email_assistant.config import settings
+    from email_assistant.slack_operations import SlackOperations
+
+    logging.getLogger("email_assistant").setLevel(logging.WARNING)
+    logging.getLogger("slack_sdk").setLevel(logging.CRITICAL)
+    # Point the assistant at a throwaway outbox and the fake server.
+    database = os.path.join(tempfile.mkdtemp(prefix="bench_slack_"), "bench.db")
+    engine = create_engine(f"sqlite:///{database}")
+    models.session_factory.configure(bind=engine)
+    models.db.remove()
+    models.Base.metadata.create_all(engine)
+    settings.SLACK_BOT_TOKEN = backend.token
+    settings.SLACK_CHANNEL = "#bench"
+    slack_client.SLACK_API_URL = url
+    slack_outbox.POST_MESSAGE_INTERVAL = 0.0
+
+    print(f"{args.latency * 1000:.0f} ms simulated latency per request\n")
+    print(f"{'scenario':<40} {'throughput':>10} {'p50 ms':>8} {'p95 ms':>8} {'calls':>7} {'conns':>7}")
+
+    def previous(n):
+        client = WebClient(token=settings.SLACK_BOT_TOKEN, base_url=url)
+        client.auth_test()
+        client.chat_postMessage(channel=settings.SLACK_CHANNEL, text=f"previous #{n}")
+
+    before = dict(backend.requests)
+    report("new client + auth.test per send", backend, before, *run(previous, range(args.messages)))
+
+    shared = slack_client.get_slack_client()
+    before = dict(backend.requests)
+    report("shared pooled client", backend, before,
+           *run(lambda n: shared.chat_postMessage(channel="#bench", text=f"shared #{n}"), range(args.messages)))
+
+    before = dict(backend.requests)
+    report("SlackOperations().send_message (outbox)", backend, before,
+           *run(lambda n: SlackOperations().send_message(f"outbox #{n}"), range(args.messages)))
+    print(f"  auth.test answered from cache: {slack_client.slack_auth() is not None}, "
+          f"{backend.requests['auth.test'] - before['auth.test']} calls")
+
+    before = dict(backend.requests)
+    report(f"shared pooled client x{args.threads} threads", backend, before,
+           *run(lambda n: shared.chat_postMessage(channel="#bench", text=f"threaded #{n}"),
+                range(args.messages), args.threads))
+
+    async def post_async(count):
+        timings = []
+        async with slack_client.open_async_slack_client(args.concurrency) as client:
+            async def one(n):
+                started = time.perf_counter()
+                await client.chat_postMessage(channel="#bench", text=f"async #{n}")
+                timings.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            await asyncio.gather(*(one(n) for n in range(count)))
+            return timings, time.perf_counter() - started
+
+    before = dict(backend.requests)
+    report(f"AsyncWebClient x{args.concurrency} connections", backend, before,
+           *asyncio.run(post_async(args.messages)))
+    server.shutdown()
+
+    # Backfill burst into Slack-like per-channel rate limits
+    print(f"\nBackfill of {args.backfill} important emails over {args.channels} channels, "
+          f"{args.post_interval * 1000:.0f} ms per message per channel")
+    print(f"{'mode':<40} {'seconds':>10} {'posted':>8} {'429s':>8} {'sent':>7} {'failed':>7}")
+    for mode, window in (("one message per email", 0), (f"digest ({args.digest_window}s window)", args.digest_window)):
+        server, url = start_fake_slack(latency=args.latency, post_interval=args.post_interval)
+        backend = server.RequestHandlerClass.backend
+        slack_client.SLACK_API_URL = url
+        slack_outbox.POST_MESSAGE_INTERVAL = args.post_interval
+        models.db.query(models.SlackOutbox).delete()
+        models.db.commit()
+
+        started = time.perf_counter()
+        for n in range(args.backfill):
+            slack_outbox.notify_important_email(models.db, n, f"Backfilled email #{n}", "Needs a decision this week.",
+                                                channel=f"#team-{n % args.channels}")
+
+        async def drain():
+            worker = slack_outbox.SlackDeliveryWorker(digest_window=window, max_wait=1.0)
+            async with slack_client.open_async_slack_client(args.concurrency) as client:
+                while models.db.query(models.SlackOutbox).filter_by(status=slack_outbox.PENDING).count():
+                    outcomes = await worker.run_once_async(models.db, client, limit=args.backfill)
+                    if not outcomes.get(slack_outbox.SENT):
+                        await asyncio.sleep(0.05)
+
+        asyncio.run(drain())
+        elapsed = time.perf_counter() - started
+        stats = slack_outbox.SlackDeliveryWorker().stats(models.db)
+        print(f"{mode:<40} {elapsed:>10.2f} {len(backend.messages):>8} {backend.requests['rate_limited']:>8} "
+              f"{stats.get(slack_outbox.SENT, 0):>7} {stats.get(slack_outbox.FAILED, 0):>7}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""
+Local stand-in for the Google Calendar and Gmail APIs.
+
+Implements the subset of endpoints the assistant uses: Calendar
+events.list (time windows, paging, incremental sync tokens), events.insert
+(409 on a duplicate ID), freebusy.query and Gmail drafts.create, plus the
+multipart batch endpoints of both APIs. No OAuth is needed: services built
+with build_service send plain HTTP to the fake server.
+
+Every calendar, including attendees' calendars seen only through freebusy,
+starts with deterministic busy blocks (busy_per_day meetings in working
+hours). Events inserted with attendees also block the attendees' calendars.
+Latency, jitter and error injection (a fraction of requests, including
+individual batch items, answered with a Google-style error) are
+configurable, so retry and backoff paths can be exercised offline.
+
+Usage:
+    python -m benchmarks.fake_google --port 8085 --latency 0.05 --error-rate 0.02
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+ERROR_REASONS = {
+    403: ("rateLimitExceeded", "Rate Limit Exceeded"),
+    404: ("notFound", "Not Found"),
+    409: ("duplicate", "The requested identifier already exists."),
+    410: ("fullSyncRequired", "Sync token is no longer valid, a full sync is required."),
+    429: ("rateLimitExceeded", "Rate Limit Exceeded"),
+    500: ("backendError", "Backend Error"),
+    503: ("backendError", "Backend Error"),
+}
+
+
+def _rfc3339(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _parse_time(value: str) -> datetime:
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def _event_times(event: Dict) -> Tuple[datetime, datetime]:
+    start, end = event["start"], event["end"]
+    return (_parse_time(start.get("dateTime") or start["date"]),
+            _parse_time(end.get("dateTime") or end["date"]))
+
+
+class FakeGoogleBackend:
+    """State and behaviour of the fake APIs, usable in-process or behind the HTTP server."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, busy_per_day: int = 3, seed_days: int = 14, page_size: int = 250,
+                 seed: int = 0):
+        """
+        Args:
+            latency: Seconds added to every HTTP request (a batch counts once).
+            jitter: Up to this many extra seconds, uniformly random.
+            error_rate: Fraction of requests and batch items answered with error_status.
+            error_status: HTTP status of injected errors (403 and 429 are rate limits).
+            busy_per_day: Seeded busy blocks per calendar per day, in 09:00-17:00 UTC.
+            seed_days: Days from today the primary calendar is seeded for.
+            page_size: Largest events.list page, whatever maxResults asks for.
+            seed: Seed of latency jitter and error injection.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.busy_per_day = busy_per_day
+        self.page_size = page_size
+        self.requests = {"events.list": 0, "events.insert": 0, "freebusy.query": 0, "drafts.create": 0,
+                         "batch": 0, "batch_items": 0, "injected_errors": 0}
+        self.lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._sequence = 0
+        self._token_generation = 0
+        self._events = {}  # calendar id -> {event id: event}
+        self._extra_busy = {}  # calendar id -> [(start, end)] from events others invited it to
+        self.drafts = {}
+        today = datetime.now(timezone.utc).date()
+        for offset in range(seed_days):
+            for start, end in self._seeded_blocks("primary", today + timedelta(days=offset)):
+                self._store("primary", {
+                    "id": uuid.uuid5(uuid.NAMESPACE_URL, f"seed/{start.isoformat()}").hex,
+                    "status": "confirmed", "summary": "Busy",
+                    "start": {"dateTime": _rfc3339(start)}, "end": {"dateTime": _rfc3339(end)},
+                })
+
+    def delay(self) -> None:
+        """Sleep for one request's latency."""
+        with self.lock:
+            extra = self._rng.uniform(0, self.jitter) if self.jitter else 0.0
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+
+    def expire_sync_tokens(self) -> None:
+        """Make every issued sync token invalid, so the next incremental sync gets a 410."""
+        with self.lock:
+            self._token_generation += 1
+
+    def handle(self, method: str, path: str, body: Optional[Dict] = None) -> Tuple[int, Dict]:
+        """
+        Answer one API call.
+
+        Args:
+            method: HTTP method.
+            path: Request path with query string, e.g. "/calendar/v3/freeBusy?alt=json".
+            body: Decoded JSON body.
+
+        Returns:
+            Tuple of (HTTP status, JSON payload).
+        """
+        parts = urlsplit(path)
+        segments = [unquote(segment) for segment in parts.path.strip("/").split("/")]
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        route = self._route(method, segments)
+        if route is None:
+            return self._error(404)
+        name, handler, arguments = route
+        with self.lock:
+            self.requests[name] += 1
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.requests["injected_errors"] += 1
+                return self._error(self.error_status)
+            return handler(*arguments, query=query, body=body or {})
+
+    def _route(self, method: str, segments: List[str]):
+        if segments[:2] == ["calendar", "v3"]:
+            rest = segments[2:]
+            if method == "POST" and rest == ["freeBusy"]:
+                return "freebusy.query", self._freebusy, ()
+            if len(rest) == 3 and rest[0] == "calendars" and rest[2] == "events":
+                if method == "GET":
+                    return "events.list", self._list_events, (rest[1],)
+                if method == "POST":
+                    return "events.insert", self._insert_event, (rest[1],)
+        if method == "POST" and segments[:3] == ["gmail", "v1", "users"] and segments[4:] == ["drafts"]:
+            return "drafts.create", self._create_draft, (segments[3],)
+        return None
+
+    def _error(self, status: int) -> Tuple[int, Dict]:
+        reason, message = ERROR_REASONS.get(status, ("unknown", "Error"))
+        return status, {"error": {"code": status, "message": f"{message} ({reason})",
+                                  "errors": [{"domain": "global", "reason": reason, "message": message}]}}
+
+    def _seeded_blocks(self, calendar_id: str, day: date) -> List[Tuple[datetime, datetime]]:
+        digest = hashlib.sha256(f"{calendar_id}/{day.isoformat()}".encode("utf-8")).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big"))
+        opening = datetime(day.year, day.month, day.day, 9, tzinfo=timezone.utc)
+        blocks = []
+        for _ in range(self.busy_per_day):
+            start = opening + timedelta(minutes=30 * rng.randrange(16))
+            blocks.append((start, start + timedelta(minutes=rng.choice([30, 30, 60, 60, 90]))))
+        return blocks
+
+    def _store(self, calendar_id: str, event: Dict) -> None:
+        self._sequence += 1
+        event["updated"] = _rfc3339(datetime.now(timezone.utc))
+        event["_sequence"] = self._sequence
+        self._events.setdefault(calendar_id, {})[event["id"]] = event
+
+    def _public(self, event: Dict) -> Dict:
+        return {key: value for key, value in event.items() if not key.startswith("_")}
+
+    def _list_events(self, calendar_id: str, query: Dict, body: Dict) -> Tuple[int, Dict]:
+        events = sorted(self._events.get(calendar_id, {}).values(), key=lambda event: event["_sequence"])
+        if "syncToken" in query:
+            generation, _, since = query["syncToken"].partition("-")
+            if not since.isdigit() or generation != str(self._token_generation):
+                return self._error(410)
+            events = [event for event in events if event["_sequence"] > int(since)]
+        else:
+            if query.get("showDeleted") != "true":
+                events = [event for event in events if event.get("status") != "cancelled"]
+            if "timeMin" in query:
+                events = [event for event in events if _event_times(event)[1] > _parse_time(query["timeMin"])]
+            if "timeMax" in query:
+                events = [event for event in events if _event_times(event)[0] < _parse_time(query["timeMax"])]
+        if query.get("orderBy") == "startTime":
+            events.sort(key=lambda event: _event_times(event)[0])
+
+        offset = int(query.get("pageToken") or 0)
+        size = min(int(query.get("maxResults") or self.page_size), self.page_size)
+        page = events[offset:offset + size]
+        response = {"kind": "calendar#events", "items": [self._public(event) for event in page]}
+        if offset + size < len(events):
+            response["nextPageToken"] = str(offset + size)
+        else:
+            response["nextSyncToken"] = f"{self._token_generation}-{self._sequence}"
+        return 200, response
+
+    def _insert_event(self, calendar_id: str, query: Dict, body: Dict) -> Tuple[int, Dict]:
+        event = dict(body)
+        event_id = event.get("id") or uuid.uuid4().hex
+        if event_id in self._events.get(calendar_id, {}):
+            return self._error(409)
+        try:
+            start, end = _event_times(event)
+        except (KeyError, ValueError):
+            return 400, {"error": {"code": 400, "message": "Invalid start or end",
+                                   "errors": [{"reason": "invalid", "message": "Invalid start or end"}]}}
+        event.update(id=event_id, status="confirmed",
+                     htmlLink=f"https://calendar.google.com/calendar/event?eid={event_id}")
+        self._store(calendar_id, event)
+        for attendee in event.get("attendees", []):
+            self._extra_busy.setdefault(attendee.get("email"), []).append((start, end))
+        return 200, self._public(event)
+
+    def _busy(self, calendar_id: str, start: datetime, end: datetime) -> List[Dict[str, str]]:
+        blocks = []
+        if calendar_id == "primary":
+            blocks.extend(_event_times(event) for event in self._events.get("primary", {}).values()
+                          if event.get("status") != "cancelled" and event.get("transparency") != "transparent")
+        else:
+            day = start.date()
+            while day <= end.date():
+                blocks.extend(self._seeded_blocks(calendar_id, day))
+                day += timedelta(days=1)
+            blocks.extend(self._extra_busy.get(calendar_id, []))
+        blocks = sorted((max(s, start), min(e, end)) for s, e in blocks if s < end and e > start)
+        return [{"start": _rfc3339(s), "end": _rfc3339(e)} for s, e in blocks]
+
+    def _freebusy(self, query: Dict, body: Dict) -> Tuple[int, Dict]:
+        start, end = _parse_time(body["timeMin"]), _parse_time(body["timeMax"])
+        calendars = {item["id"]: {"busy": self._busy(item["id"], start, end)} for item in body.get("items", [])}
+        return 200, {"kind": "calendar#freeBusy", "timeMin": _rfc3339(start), "timeMax": _rfc3339(end),
+                     "calendars": calendars}
+
+    def _create_draft(self, user_id: str, query: Dict, body: Dict) -> Tuple[int, Dict]:
+        draft_id = f"r{uuid.uuid4().int % 10 ** 19}"
+        message_id = uuid.uuid4().hex[:16]
+        draft = {"id": draft_id, "message": {"id": message_id, "threadId": message_id, "labelIds": ["DRAFT"]}}
+        self.drafts[draft_id] = {"user": user_id, "raw": body.get("message", {}).get("raw", "")}
+        return 200, draft
+
+
+class FakeGoogleHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this, delayed ACKs add ~40 ms per response.
+    disable_nagle_algorithm = True
+    backend = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.backend.delay()
+        self._json(*self.backend.handle("GET", self.path))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        self.backend.delay()
+        if urlsplit(self.path).path.startswith("/batch"):
+            self._batch(raw)
+            return
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            body = {}
+        self._json(*self.backend.handle("POST", self.path, body))
+
+    def _batch(self, raw: bytes) -> None:
+        """Answer a multipart/mixed batch: each part is an HTTP request, answered by an HTTP response part."""
+        with self.backend.lock:
+            self.backend.requests["batch"] += 1
+        content_type = self.headers.get("Content-Type", "")
+        message = message_from_bytes(b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + raw)
+        boundary = f"batch_{uuid.uuid4().hex}"
+        out = []
+        for part in message.get_payload() if message.is_multipart() else []:
+            with self.backend.lock:
+                self.backend.requests["batch_items"] += 1
+            head, _, body = part.get_payload().replace("\r\n", "\n").partition("\n\n")
+            method, path = head.split("\n", 1)[0].split(" ")[:2]
+            try:
+                payload = json.loads(body) if body.strip() else {}
+            except ValueError:
+                payload = {}
+            status, response = self.backend.handle(method, path, payload)
+            content_id = (part.get("Content-ID") or "").strip("<>")
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(response)}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        data = "".join(out).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/mixed; boundary={boundary}")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _json(self, status: int, payload: Dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        if status in (403, 429):
+            self.send_header("Retry-After", "1")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeGoogleServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Concurrent clients open many connections at once; the default backlog of 5 drops them.
+    request_queue_size = 256
+
+
+def start_fake_google(port: int = 0, **config) -> Tuple[FakeGoogleServer, str]:
+    """
+    Start the fake server in a background thread.
+
+    Args:
+        port: Port to listen on, 0 for any free port.
+        **config: FakeGoogleBackend arguments.
+
+    Returns:
+        Tuple of (server, base_url). The backend is server.RequestHandlerClass.backend;
+        call server.shutdown() to stop it.
+    """
+    handler = type("ConfiguredFakeGoogleHandler", (FakeGoogleHandler,), {"backend": FakeGoogleBackend(**config)})
+    server = FakeGoogleServer(("127.0.0.1", port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def build_service(api: str, version: str, base_url: str):
+    """
+    Build a googleapiclient service for the fake server.
+
+    The bundled discovery document is used with its root URL replaced, so
+    regular and batch requests both go to base_url. Each thread gets its own
+    unauthenticated connection.
+
+    Args:
+        api: "calendar" or "gmail".
+        version: "v3" or "v1".
+        base_url: URL returned by start_fake_google.
+
+    Returns:
+        A service object, as googleapiclient.discovery.build would return.
+    """
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+
+    from email_assistant.calendar_service import ThreadLocalHttp
+
+    document = json.loads(get_static_doc(api, version))
+    document["rootUrl"] = base_url.rstrip("/") + "/"
+    document.pop("mtlsRootUrl", None)
+    http = ThreadLocalHttp(None)
+    return build_from_document(document, http=http.get(), requestBuilder=http.request_builder)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Google Calendar and Gmail API server.")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--busy-per-day", type=int, default=3)
+    args = parser.parse_args()
+
+    server, url = start_fake_google(
+        args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        error_status=args.error_status, busy_per_day=args.busy_per_day,
+    )
+    print(f"Fake Google APIs listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Deterministic stand-in for the Ollama HTTP API.
+
+Implements the endpoints the assistant uses (/api/chat, /api/generate,
+/api/embed, /api/embeddings, /api/tags, /api/show, /api/ps, /api/version)
+with a configurable token rate, time to first token, <think> content and
+embedding dimension. Answers are chosen from the prompt so the assistant's
+code paths behave as they would with a real model: JSON for the meeting
+extraction prompt, "Yes." for yes/no questions and filler text otherwise.
+
+Usage:
+    python -m benchmarks.fake_ollama --port 11435 --token-rate 50 --ttft 0.2
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+MEETING_JSON = json.dumps({
+    "summary": "Quarterly planning",
+    "location": "Conference room B",
+    "description": "Review roadmap and budget",
+    "start_date": "15-11-2026",
+    "start_time": "3:00 pm",
+    "end_date": "15-11-2026",
+    "end_time": "4:00 pm",
+    "attendees": "alice@example.com, bob@example.com",
+})
+FILLER = ("The email asks the team to review the attached plan and confirm the schedule "
+          "before Friday, and mentions that the budget numbers were updated last week.")
+
+
+class FakeOllamaConfig:
+    """Behaviour of the fake server."""
+
+    def __init__(self, token_rate: float = 50.0, ttft: float = 0.2, think_tokens: int = 40,
+                 embedding_dim: int = 1536, embed_latency: float = 0.01, model: str = "deepseek-r1:1.5b"):
+        """
+        Args:
+            token_rate: Generated tokens per second (0 for no delay).
+            ttft: Seconds before the first token (model load plus prompt evaluation).
+            think_tokens: Number of tokens inside the <think> block (0 to omit it).
+            embedding_dim: Dimension of returned embeddings.
+            embed_latency: Seconds per embedding request.
+            model: Model name reported by /api/tags.
+        """
+        self.token_rate = token_rate
+        self.ttft = ttft
+        self.think_tokens = think_tokens
+        self.embedding_dim = embedding_dim
+        self.embed_latency = embed_latency
+        self.model = model
+        self.requests = {"chat": 0, "generate": 0, "embed": 0, "cancelled": 0}
+        self.lock = threading.Lock()
+
+
+def answer_for(prompt: str) -> str:
+    """Pick a deterministic answer for a prompt."""
+    if "JSON object" in prompt:
+        return MEETING_JSON
+    if "'Yes' or 'No'" in prompt or "say yes or no" in prompt.lower():
+        return "Yes. The email clearly needs attention."
+    if "one word only, one of:" in prompt:
+        return "meeting_request"
+    return FILLER
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into word-sized tokens, keeping the separators."""
+    tokens = []
+    current = ""
+    for char in text:
+        current += char
+        if char in " \n":
+            tokens.append(current)
+            current = ""
+    if current:
+        tokens.append(current)
+    return tokens
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Return a deterministic unit vector for text."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = sum(value * value for value in vector) ** 0.5 or 1.0
+    return [value / norm for value in vector]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = FakeOllamaConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._json({"models": [{"name": self.config.model, "model": self.config.model, "size": 0}]})
+        elif self.path == "/api/ps":
+            self._json({"models": [{"name": self.config.model, "model": self.config.model}]})
+        elif self.path in ("/api/version", "/"):
+            self._json({"version": "0.0.0-fake"})
+        else:
+            self._json({"error": "not found"}, status=404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path == "/api/chat":
+            prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+            self._count("chat")
+            self._generate(body, prompt, chat=True)
+        elif self.path == "/api/generate":
+            self._count("generate")
+            self._generate(body, body.get("prompt", ""), chat=False)
+        elif self.path == "/api/embed":
+            self._count("embed")
+            inputs = body.get("input", "")
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            time.sleep(self.config.embed_latency)
+            self._json({
+                "model": body.get("model", self.config.model),
+                "embeddings": [fake_embedding(text, self.config.embedding_dim) for text in inputs],
+            })
+        elif self.path == "/api/embeddings":
+            self._count("embed")
+            time.sleep(self.config.embed_latency)
+            self._json({"embedding": fake_embedding(body.get("prompt", ""), self.config.embedding_dim)})
+        elif self.path == "/api/show":
+            self._json({"modelfile": "", "parameters": "", "template": "", "details": {"family": "fake"}})
+        else:
+            self._json({"error": "not found"}, status=404)
+
+    def _generate(self, body: dict, prompt: str, chat: bool) -> None:
+        model = body.get("model", self.config.model)
+        # An empty prompt only loads the model (used for warm-up / keep-alive).
+        if not prompt and not chat:
+            self._json({"model": model, "created_at": _now(), "response": "", "done": True, "done_reason": "load"})
+            return
+
+        tokens = []
+        if self.config.think_tokens:
+            tokens.append("<think>\n")
+            tokens.extend(["thinking "] * self.config.think_tokens)
+            tokens.append("</think>\n\n")
+        tokens.extend(tokenize(answer_for(prompt)))
+        num_predict = (body.get("options") or {}).get("num_predict")
+        if num_predict:
+            tokens = tokens[:num_predict]
+
+        started = time.perf_counter()
+        if not body.get("stream", True):
+            time.sleep(self.config.ttft + (len(tokens) / self.config.token_rate if self.config.token_rate else 0))
+            self._json(self._chunk(model, "".join(tokens), chat, done=True, started=started, count=len(tokens)))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(self.config.ttft)
+        delay = 1.0 / self.config.token_rate if self.config.token_rate else 0.0
+        try:
+            for token in tokens:
+                self._write_chunk(self._chunk(model, token, chat, done=False))
+                if delay:
+                    time.sleep(delay)
+            self._write_chunk(self._chunk(model, "", chat, done=True, started=started, count=len(tokens)))
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early: the generation is cancelled.
+            self._count("cancelled")
+            self.close_connection = True
+
+    def _chunk(self, model: str, content: str, chat: bool, done: bool, started: Optional[float] = None,
+               count: int = 0) -> dict:
+        payload = {"model": model, "created_at": _now(), "done": done}
+        if chat:
+            payload["message"] = {"role": "assistant", "content": content}
+        else:
+            payload["response"] = content
+        if done:
+            duration = int((time.perf_counter() - (started or time.perf_counter())) * 1e9)
+            payload.update({"done_reason": "stop", "total_duration": duration, "eval_count": count,
+                            "eval_duration": duration, "prompt_eval_count": 0, "load_duration": 0})
+        return payload
+
+    def _write_chunk(self, payload: dict) -> None:
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def _json(self, payload: dict, status: int = 200) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _count(self, kind: str) -> None:
+        with self.config.lock:
+            self.config.requests[kind] += 1
+
+
+def start_fake_ollama(port: int = 0, **config) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start the fake server in a background thread.
+
+    Args:
+        port: Port to listen on, 0 for any free port.
+        **config: FakeOllamaConfig arguments.
+
+    Returns:
+        Tuple of (server, base_url). Call server.shutdown() to stop it.
+    """
+    handler = type("ConfiguredFakeOllamaHandler", (FakeOllamaHandler,), {"config": FakeOllamaConfig(**config)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server.")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--think-tokens", type=int, default=40)
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--embed-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    server, url = start_fake_ollama(
+        args.port, token_rate=args.token_rate, ttft=args.ttft, think_tokens=args.think_tokens,
+        embedding_dim=args.embedding_dim, embed_latency=args.embed_latency,
+    )
+    print(f"Fake Ollama listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
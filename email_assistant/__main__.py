@@ -4,12 +4,15 @@ Main module for the email assistant application.
 
 import logging
 from email_assistant.config import settings
-from email_assistant.models import db
-from email_assistant.rag_setup import rag_model
+from email_assistant.models import Email, db
+from email_assistant.llm_scheduler import BACKGROUND, get_scheduler, llm_context
+from email_assistant.ollama_models import start_model_warmup
 import time
 from datetime import datetime
-from sqlalchemy.sql import text  # Import the text function
 from .store_emails import store_emails , start_email_monitor
+# The classifier, enrichment and RAG modules (langchain, FAISS, numpy) are
+# imported by process_stored_emails so the models start warming up first, and
+# the Slack outbox (slack_sdk, httpx) only where Slack is used.
 
 
 
@@ -25,37 +28,80 @@ def process_stored_emails():
     Process stored emails one by one, starting from the last stored email.
     """
     try:
-
+        from email_assistant.attachments import extract_pending_attachments
+        from email_assistant.classifier import get_cascade
+        from email_assistant.enrichment import enrich_email, get_stored_analysis, pending_email_ids
+        from email_assistant.near_duplicates import backfill_signatures, duplicate_stats
+        from email_assistant.thread_summaries import update_thread_summaries
+        from email_assistant.rag_setup import get_mailbox_index
+        from email_assistant.slack_outbox import SLACK_NOTIFY_IMPORTANT, notify_important_email
 
         # Use the scoped session directly
         session = db  # Use the scoped_session object
 
-        # Retrieve all stored email IDs from the database in descending order
-        email_ids = session.execute(text("SELECT id FROM emails ORDER BY id DESC")).fetchall()
+        # Fingerprint emails stored before near-duplicate detection existed
+        backfill_signatures(session)
+
+        # Extract the text of new attachments in worker processes
+        extract_pending_attachments(session)
+
+        # Retrieve the IDs of emails not analysed yet, newest first
+        email_ids = pending_email_ids(session)
 
         # Process each email ID
-        for email_id_tuple in email_ids:
-            email_id = email_id_tuple[0]  # Extract the email ID from the tuple
+        for email_id in email_ids:
             logger.info(f"Processing email with ID: {email_id}")
             try:
-               rag_model(email_id)  # Send email_id to AIService
-               time .sleep(60)  # Sleep for 1 second between processing emails
+               enrich_email(session, email_id)  # Store summary, importance, intent, needs-reply and has-meeting
+               if SLACK_NOTIFY_IMPORTANT:
+                   # Queued in the Slack outbox, so a backfill burst is paced (or digested) instead of dropped
+                   analysis = get_stored_analysis(session, email_id)
+                   if analysis and analysis["is_important"]:
+                       email = session.get(Email, email_id)
+                       notify_important_email(session, email_id, email.subject or "", analysis["summary"] or "")
+               time.sleep(1)  # Sleep for 1 second between processing emails
             except Exception as e:
                 logger.error(f"Error processing email with ID {email_id}: {str(e)}")
+
+        # Index new emails for the chatbot, after enrichment has set their priority,
+        # and re-tag the ones indexed earlier whose priority changed
+        mailbox_index = get_mailbox_index()
+        if mailbox_index.refresh(session) + mailbox_index.update_priorities(session, email_ids):
+            mailbox_index.save()
+
+        # Retrain the local classifiers once enough new LLM labels were stored, and report how many LLM calls they saved
+        cascade = get_cascade()
+        if email_ids:
+            cascade.train(session)
+
+        # Fold the new emails into the rolling summaries of their threads
+        if email_ids:
+            logger.info(f"Thread summaries: {update_thread_summaries(session, email_ids)}")
+        logger.info(f"Classification cascade: {cascade.stats()}")
+        logger.info(f"Near-duplicates: {duplicate_stats(session)}")
     except Exception as e:
         logger.error(f"Error in processing stored emails: {str(e)}")
 
 def main():
     """Main function to run the email assistant."""
+    # Load the models while the mailbox is being fetched
+    warmup = start_model_warmup()
     store_emails()
 
     # Start the email monitor
     start_email_monitor()
+    if getattr(settings, "SLACK_BOT_TOKEN", None):
+        from email_assistant.slack_outbox import start_slack_worker
+        start_slack_worker()
+    if not warmup.wait_until_ready(timeout=60):
+        logger.warning(f"⚠️ Models not warm yet, continuing: {warmup.readiness()}")
     try:
         # Process emails
         while True:
-            # Process stored emails from last to first
-            process_stored_emails()
+            # Process stored emails from last to first, behind interactive requests
+            with llm_context(priority=BACKGROUND):
+                process_stored_emails()
+            logger.info(f"LLM scheduler: {get_scheduler().stats()}")
 
             # Sleep for 5 minutes before checking again
             time.sleep(300)
@@ -0,0 +1,320 @@
+"""
+Asynchronous Google Calendar operations.
+
+AsyncCalendarService talks to the Calendar REST API over one pooled
+httpx.AsyncClient, so a single event loop can keep many meeting emails in
+flight. Availability lookups fan out concurrently: attendees are split into
+freebusy queries of FREEBUSY_MAX_CALENDARS calendars and long windows into
+CALENDAR_FREEBUSY_WINDOW_DAYS slices, and all of them run at once (at most
+CALENDAR_ASYNC_CONCURRENCY requests in flight per service). The organizer's
+calendar comes from the event cache when the service has one, and is part
+of the same fan-out ("primary") otherwise.
+
+Meetings in flight on one service cannot double-book the organizer: the
+time of every event the service is about to create is kept in an accepted
+list, and schedule re-checks the slot against it (and the event cache)
+under a lock just before inserting, as CalendarService.schedule_events does
+within a batch.
+
+Event bodies, freebusy parsing and slot ranking are shared with the blocking
+CalendarService. Work given a deadline is cancelled when it runs out,
+including requests still in flight.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import pytz
+from google.auth.transport.requests import Request
+
+from email_assistant.calendar_service import (
+    CALENDAR_HTTP_TIMEOUT,
+    RETRYABLE_STATUSES,
+    CalendarService,
+    _serialize_refresh,
+    load_credentials,
+)
+from email_assistant.config import settings
+from email_assistant.scheduling import common_slots, freebusy_bodies, parse_freebusy
+
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+CALENDAR_API_URL = getattr(settings, "CALENDAR_API_URL", "https://www.googleapis.com/calendar/v3/")
+# Requests (and pooled connections) in flight per service. More meetings than this can be in
+# flight: their requests queue here, and httpx's pool gets slower with many connections.
+CALENDAR_ASYNC_CONCURRENCY = getattr(settings, "CALENDAR_ASYNC_CONCURRENCY", 10)
+CALENDAR_FREEBUSY_WINDOW_DAYS = getattr(settings, "CALENDAR_FREEBUSY_WINDOW_DAYS", 7)
+CALENDAR_REQUEST_RETRIES = getattr(settings, "CALENDAR_REQUEST_RETRIES", 3)
+
+
+class CalendarAPIError(Exception):
+    """An error answer from the Calendar API."""
+
+    def __init__(self, status: int, message: str, reason: str = ""):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.reason = reason
+
+    @property
+    def retryable(self) -> bool:
+        """Rate-limit and server errors (403 only for rate limits)."""
+        if self.status == 403:
+            return self.reason in ("rateLimitExceeded", "userRateLimitExceeded")
+        return self.status in RETRYABLE_STATUSES
+
+
+class AsyncCalendarService:
+    """Asynchronous counterpart of CalendarService for availability checks and event creation."""
+
+    def __init__(self, credentials=None, base_url: str = CALENDAR_API_URL, client: Optional[httpx.AsyncClient] = None,
+                 max_concurrency: int = CALENDAR_ASYNC_CONCURRENCY, event_cache=None):
+        """
+        Args:
+            credentials: OAuth credentials, or None for unauthenticated requests (local API stand-ins).
+            base_url: Calendar API root, ending with "calendar/v3/".
+            client: httpx.AsyncClient to use; one is created (and closed by aclose) otherwise.
+            max_concurrency: Most requests this service has in flight at once.
+            event_cache: Optional CalendarEventCache of the primary calendar, updated with
+                created events and used to recognize emails scheduled before.
+        """
+        self.credentials = credentials
+        self.base_url = base_url.rstrip("/") + "/"
+        self._own_client = client is None
+        self.client = client or httpx.AsyncClient(
+            timeout=CALENDAR_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        self.event_cache = event_cache
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._accepted = []  # (start, end) of events being created or created by this service
+        self._booking_lock = asyncio.Lock()
+        self._refresh_lock = asyncio.Lock()
+
+    @classmethod
+    def from_settings(cls, **kwargs) -> "AsyncCalendarService":
+        """Build a service with the stored OAuth credentials (see calendar_service.load_credentials)."""
+        return cls(credentials=_serialize_refresh(load_credentials()), **kwargs)
+
+    async def __aenter__(self) -> "AsyncCalendarService":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the HTTP client if this service created it."""
+        if self._own_client:
+            await self.client.aclose()
+
+    async def _headers(self) -> Dict[str, str]:
+        if self.credentials is None:
+            return {}
+        if not self.credentials.valid:
+            async with self._refresh_lock:
+                if not self.credentials.valid:
+                    # google-auth refreshes with a blocking request, kept off the event loop
+                    await asyncio.to_thread(self.credentials.refresh, Request())
+        return {"Authorization": f"Bearer {self.credentials.token}"}
+
+    async def request(self, method: str, path: str, retries: int = CALENDAR_REQUEST_RETRIES, **kwargs) -> Dict:
+        """
+        Send one API request, retrying rate-limit and server errors with exponential backoff.
+
+        Args:
+            method: HTTP method.
+            path: Path below base_url, e.g. "freeBusy".
+            retries: Number of retries.
+            **kwargs: httpx request arguments (params, json).
+
+        Returns:
+            The decoded JSON answer.
+
+        Raises:
+            CalendarAPIError: On an error answer that is final or still failing after the retries.
+            httpx.HTTPError: On a network error after the retries.
+        """
+        for attempt in range(retries + 1):
+            retry_after = None
+            try:
+                async with self._slots:
+                    response = await self.client.request(method, self.base_url + path,
+                                                         headers=await self._headers(), **kwargs)
+                if response.status_code < 300:
+                    return response.json()
+                error = self._error(response)
+                if not error.retryable or attempt == retries:
+                    raise error
+                retry_after = response.headers.get("Retry-After")
+            except httpx.TransportError:
+                if attempt == retries:
+                    raise
+            delay = min(2 ** attempt, 8) * (0.5 + random.random() / 2)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _error(response: httpx.Response) -> CalendarAPIError:
+        try:
+            error = response.json().get("error", {})
+        except ValueError:
+            error = {}
+        reasons = [detail.get("reason", "") for detail in error.get("errors", [])]
+        return CalendarAPIError(response.status_code, error.get("message", response.reason_phrase),
+                                reasons[0] if reasons else "")
+
+    async def query_busy(self, calendar_ids: List[str], start: datetime,
+                         end: datetime) -> Tuple[List[Tuple[float, float]], Dict[str, str]]:
+        """
+        Fetch the busy blocks of several calendars with concurrent freebusy queries.
+
+        The calendars are split into groups of FREEBUSY_MAX_CALENDARS and the window
+        into slices of CALENDAR_FREEBUSY_WINDOW_DAYS; every (group, slice) query runs at once.
+
+        Args:
+            calendar_ids: Calendars to query ("primary" for the organizer).
+            start: Start of the window.
+            end: End of the window.
+
+        Returns:
+            Tuple of (busy intervals as timestamps, mapping of calendar ID to error reason).
+        """
+        bodies = []
+        slice_start = start
+        while slice_start < end:
+            slice_end = min(slice_start + timedelta(days=CALENDAR_FREEBUSY_WINDOW_DAYS), end)
+            bodies.extend(freebusy_bodies(calendar_ids, slice_start, slice_end))
+            slice_start = slice_end
+        responses = await asyncio.gather(*(self.request("POST", "freeBusy", json=body) for body in bodies))
+        busy, errors = [], {}
+        for response in responses:
+            parse_freebusy(response, busy, errors)
+        return busy, errors
+
+    async def check_attendees_availability(self, start_time: datetime, duration_hours: float = 1,
+                                           attendees: Optional[List[str]] = None, num_options: int = 3,
+                                           days_ahead: int = 7,
+                                           attendee_timezones: Optional[Dict[str, str]] = None
+                                           ) -> Tuple[bool, List[Dict], List[str]]:
+        """
+        Check a time slot against the organizer and every attendee, proposing common alternatives if it is taken.
+
+        Attendee calendars are read with the concurrent freebusy fan-out; events
+        this service has accepted count as busy for the organizer.
+
+        Args:
+            start_time: The proposed start time (timezone-aware)
+            duration_hours: Duration of the meeting in hours
+            attendees: Attendee email addresses
+            num_options: Number of alternative slots to propose
+            days_ahead: Number of days after the proposed day to search for alternatives
+            attendee_timezones: Optional mapping of attendee to time zone name
+
+        Returns:
+            Tuple of (is_available, alternative_slots, unknown_attendees), where
+            unknown_attendees could not be checked (their calendar could not be read)
+        """
+        attendees = list(attendees or [])
+        lookup = await self._fetch_busy(start_time, attendees, days_ahead)
+        result = await self._check(lookup, start_time, duration_hours, attendees, num_options, attendee_timezones)
+        return bool(result["available"]), result["slots"], result["unknown"]
+
+    async def _fetch_busy(self, start_time: datetime, attendees: List[str], days_ahead: int) -> Tuple:
+        """Return (busy, errors, window_start, window_end) of the attendees (and organizer without event cache)."""
+        window_start, window_end = CalendarService._search_window(start_time.astimezone(pytz.UTC), days_ahead)
+        calendars = attendees if self.event_cache is not None else ["primary"] + attendees
+        busy, errors = await self.query_busy(calendars, window_start, window_end)
+        return busy, errors, window_start, window_end
+
+    async def _check(self, lookup: Tuple, start_time: datetime, duration_hours: float, attendees: List[str],
+                     num_options: int, attendee_timezones: Optional[Dict[str, str]] = None) -> Dict:
+        """Check fetched availability plus the organizer's cached and accepted events (see common_slots)."""
+        busy, errors, window_start, window_end = lookup
+        extra_busy = list(self._accepted)
+        if self.event_cache is not None:
+            # The cache may sync over the network when stale, kept off the event loop
+            extra_busy += await asyncio.to_thread(self.event_cache.busy_intervals, window_start, window_end)
+        return common_slots(busy, errors, attendees, duration_hours * 60, window_start, window_end,
+                            extra_busy=extra_busy, attendee_timezones=attendee_timezones,
+                            preferred_start=start_time.astimezone(pytz.UTC), num_options=num_options)
+
+    async def create_event(self, event_details: Dict) -> str:
+        """
+        Create a calendar event, or return the existing one if this source email was already scheduled.
+
+        Args:
+            event_details: Event details as for CalendarService.create_event.
+
+        Returns:
+            The event ID.
+
+        Raises:
+            CalendarAPIError: If the API refuses the event.
+        """
+        body = CalendarService._event_body(event_details)
+        try:
+            event = await self.request("POST", "calendars/primary/events", json=body)
+        except CalendarAPIError as e:
+            if e.status != 409 or "id" not in body:
+                raise
+            logger.info(f"Event {body['id']} already exists")
+            return body["id"]
+        if self.event_cache is not None:
+            self.event_cache.apply(event)
+        logger.info(f"✅ Event created: {event.get('htmlLink')}")
+        return event["id"]
+
+    async def schedule(self, event_details: Dict, num_options: int = 3, days_ahead: int = 7,
+                       deadline: Optional[float] = None) -> Dict:
+        """
+        Check availability and create one event, giving up when the deadline passes.
+
+        Args:
+            event_details: Event details as for CalendarService.create_event.
+            num_options: Number of alternative slots proposed on a conflict.
+            days_ahead: Number of days searched for alternatives.
+            deadline: Seconds allowed for the whole operation, None for no limit.
+
+        Returns:
+            {'status': 'success' | 'exists' | 'conflict' | 'timeout' | 'error', 'event_id',
+            'alternative_slots', 'unknown_attendees', 'message'}; unknown_attendees (after a
+            check) are the attendees whose calendar could not be read
+        """
+        source_id = event_details.get("source_id")
+        if source_id and self.event_cache is not None:
+            event_id = CalendarService.event_id_for(source_id)
+            if event_id in self.event_cache:
+                return {"status": "exists", "event_id": event_id, "message": f"Event {event_id} already exists"}
+        try:
+            async with asyncio.timeout(deadline):
+                start, end = event_details["start_time"], event_details["end_time"]
+                attendees = list(event_details.get("attendees") or [])
+                duration_hours = (end - start).total_seconds() / 3600
+                lookup = await self._fetch_busy(start, attendees, days_ahead)
+                # Check and accept under the lock, so two meetings in flight cannot take the same slot
+                async with self._booking_lock:
+                    result = await self._check(lookup, start, duration_hours, attendees, num_options)
+                    if not result["available"]:
+                        return {"status": "conflict", "alternative_slots": result["slots"],
+                                "unknown_attendees": result["unknown"],
+                                "message": "The requested time slot is not available."}
+                    interval = (start.astimezone(pytz.UTC), end.astimezone(pytz.UTC))
+                    self._accepted.append(interval)
+                try:
+                    event_id = await self.create_event(event_details)
+                except CalendarAPIError:
+                    # Refused, so the slot is free again (after a timeout the event may exist, so it stays taken)
+                    self._accepted.remove(interval)
+                    raise
+                return {"status": "success", "event_id": event_id, "unknown_attendees": result["unknown"],
+                        "message": f"Event created successfully with ID: {event_id}"}
+        except TimeoutError:
+            logger.warning(f"⚠️ Scheduling '{event_details.get('title')}' ran past its {deadline}s deadline")
+            return {"status": "timeout", "message": f"Calendar operations did not finish within {deadline}s"}
+        except (CalendarAPIError, httpx.HTTPError) as e:
+            logger.error(f"❌ Error scheduling event: {str(e)}")
+            return {"status": "error", "message": f"Calendar API error: {str(e)}"}
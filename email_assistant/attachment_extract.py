@@ -0,0 +1,151 @@
+"""
+Text extraction from attachment files.
+
+This module runs inside the extraction worker processes, so it only imports
+the standard library at module level; parser libraries are imported by the
+extractor that needs them. Every call is bounded by a per-file timeout
+(SIGALRM) and the worker's address space by a memory cap (RLIMIT_AS) where
+the platform supports them.
+"""
+import os
+import re
+import signal
+import zipfile
+from typing import Any, Dict, Optional
+from xml.etree import ElementTree
+
+try:
+    import resource
+except ImportError:  # Windows: no memory cap
+    resource = None
+
+OK = "ok"
+FAILED = "failed"
+TIMEOUT = "timeout"
+TOO_LARGE = "too_large"
+UNSUPPORTED = "unsupported"
+
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_SPACES = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+
+class ExtractionTimeout(Exception):
+    """Raised inside a worker when a file takes longer than its timeout."""
+
+
+def init_worker(memory_limit_bytes: Optional[int]) -> None:
+    """Pool initializer: cap the worker's address space."""
+    if memory_limit_bytes and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+
+
+def kind_of(filename: str, content_type: str) -> Optional[str]:
+    """Return "pdf", "docx", "html" or "text" for a supported attachment, None otherwise."""
+    extension = os.path.splitext(filename or "")[1].lower()
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type == "application/pdf" or extension == ".pdf":
+        return "pdf"
+    if (content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            or extension == ".docx"):
+        return "docx"
+    if content_type in ("text/html", "application/xhtml+xml") or extension in (".html", ".htm"):
+        return "html"
+    if content_type.startswith("text/") or extension in (".txt", ".md", ".csv", ".ics"):
+        return "text"
+    return None
+
+
+def _decode(data: bytes) -> str:
+    for encoding in ("utf-8", "cp1252"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace")
+
+
+def _extract_pdf(path: str) -> str:
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def _extract_docx(path: str) -> str:
+    with zipfile.ZipFile(path) as archive:
+        root = ElementTree.fromstring(archive.read("word/document.xml"))
+    paragraphs = []
+    for paragraph in root.iter(f"{_WORD_NS}p"):
+        parts = []
+        for node in paragraph.iter():
+            if node.tag == f"{_WORD_NS}t" and node.text:
+                parts.append(node.text)
+            elif node.tag == f"{_WORD_NS}tab":
+                parts.append("\t")
+            elif node.tag in (f"{_WORD_NS}br", f"{_WORD_NS}cr"):
+                parts.append("\n")
+        paragraphs.append("".join(parts))
+    return "\n".join(paragraphs)
+
+
+def _extract_html(path: str) -> str:
+    from bs4 import BeautifulSoup
+
+    with open(path, "rb") as f:
+        soup = BeautifulSoup(f.read(), "html.parser")
+    for tag in soup(["script", "style", "head"]):
+        tag.decompose()
+    return soup.get_text("\n")
+
+
+def _extract_text(path: str) -> str:
+    with open(path, "rb") as f:
+        return _decode(f.read())
+
+
+EXTRACTORS = {"pdf": _extract_pdf, "docx": _extract_docx, "html": _extract_html, "text": _extract_text}
+
+
+def _on_alarm(signum, frame):
+    raise ExtractionTimeout()
+
+
+def extract_file(path: str, filename: str, content_type: str, timeout: float, max_chars: int) -> Dict[str, Any]:
+    """
+    Extract the text of one attachment file.
+
+    Args:
+        path: Where the attachment is stored.
+        filename: Original file name, used to detect the type.
+        content_type: MIME type from the email.
+        timeout: Seconds allowed for this file.
+        max_chars: Maximum number of characters kept.
+
+    Returns:
+        Dictionary with status, text, error and extractor.
+    """
+    kind = kind_of(filename, content_type)
+    if kind is None:
+        return {"status": UNSUPPORTED, "text": "", "error": f"Unsupported type {content_type}", "extractor": None}
+
+    use_alarm = hasattr(signal, "SIGALRM")
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        text = EXTRACTORS[kind](path)
+        text = _BLANK_LINES.sub("\n\n", _SPACES.sub(" ", text)).strip()
+        return {"status": OK, "text": text[:max_chars], "error": None, "extractor": kind}
+    except ExtractionTimeout:
+        return {"status": TIMEOUT, "text": "", "error": f"Took longer than {timeout}s", "extractor": kind}
+    except MemoryError:
+        return {"status": TOO_LARGE, "text": "", "error": "Exceeded the worker memory limit", "extractor": kind}
+    except ImportError as e:
+        return {"status": UNSUPPORTED, "text": "", "error": f"Parser not installed: {str(e)}", "extractor": kind}
+    except Exception as e:
+        return {"status": FAILED, "text": "", "error": f"{type(e).__name__}: {str(e)}", "extractor": kind}
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
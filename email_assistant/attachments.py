@@ -0,0 +1,269 @@
+"""
+Attachment storage and text extraction.
+
+store_emails saves attachment files under ATTACHMENT_DIR, named by their
+SHA-256, and records Attachment rows; nothing is parsed on the ingest thread.
+extract_pending_attachments then hands the files to a pool of worker
+processes, each with a per-file timeout and a memory cap, and stores the text
+in AttachmentText. Files with the same content hash are extracted once: a
+successful (or unsupported) result is reused for later copies, while a
+timeout or failure may be transient and is retried for the next copy. The
+mailbox index chunks and embeds the extracted text like email bodies.
+"""
+import atexit
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from email_assistant.attachment_extract import (
+    FAILED,
+    OK,
+    TIMEOUT,
+    TOO_LARGE,
+    UNSUPPORTED,
+    extract_file,
+    init_worker,
+    kind_of,
+)
+from email_assistant.config import settings
+from email_assistant.models import Attachment, AttachmentText
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_DIR = getattr(settings, "ATTACHMENT_DIR", "attachments")
+ATTACHMENT_MAX_BYTES = getattr(settings, "ATTACHMENT_MAX_BYTES", 25 * 1024 * 1024)
+ATTACHMENT_MAX_CHARS = getattr(settings, "ATTACHMENT_MAX_CHARS", 200_000)
+ATTACHMENT_TIMEOUT = getattr(settings, "ATTACHMENT_TIMEOUT", 30)
+ATTACHMENT_MEMORY_MB = getattr(settings, "ATTACHMENT_MEMORY_MB", 1024)
+ATTACHMENT_WORKERS = getattr(settings, "ATTACHMENT_WORKERS", 2)
+
+# Extra seconds a worker gets past the per-file timeout before it is killed.
+HARD_TIMEOUT_GRACE = 5
+# Outcomes that depend only on the file content, so they are reused by content hash
+REUSABLE_STATUSES = (OK, UNSUPPORTED)
+
+
+def save_attachment(session, email_id: int, filename: str, content_type: str, data: bytes) -> Optional[Attachment]:
+    """
+    Store an attachment file and record it; the caller commits the session.
+
+    Files are named by their SHA-256, so the same file attached to many emails
+    is stored once. Files above ATTACHMENT_MAX_BYTES are recorded without
+    being stored.
+
+    Args:
+        session: The database session to use.
+        email_id: ID of the email the attachment belongs to.
+        filename: Original file name.
+        content_type: MIME type from the email.
+        data: File content.
+
+    Returns:
+        The Attachment row, or None if it could not be saved.
+    """
+    try:
+        storage_path = None
+        if len(data) <= ATTACHMENT_MAX_BYTES:
+            digest = hashlib.sha256(data).hexdigest()
+            storage_path = os.path.join(ATTACHMENT_DIR, digest[:2], digest)
+            if not os.path.exists(storage_path):
+                os.makedirs(os.path.dirname(storage_path), exist_ok=True)
+                temporary = f"{storage_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temporary, "wb") as f:
+                    f.write(data)
+                os.replace(temporary, storage_path)
+        attachment = Attachment(
+            email_id=email_id,
+            filename=(filename or "attachment")[:255],
+            content_type=(content_type or "application/octet-stream")[:100],
+            size=len(data),
+            storage_path=storage_path,
+        )
+        session.add(attachment)
+        return attachment
+    except Exception as e:
+        logger.error(f"❌ Error saving attachment {filename}: {str(e)}")
+        return None
+
+
+def file_hash(path: str) -> str:
+    """Return the SHA-256 of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class AttachmentExtractor:
+    """Runs extract_file in a pool of worker processes with hard per-file timeouts."""
+
+    def __init__(self, workers: int = ATTACHMENT_WORKERS, timeout: float = ATTACHMENT_TIMEOUT,
+                 memory_limit_mb: Optional[int] = ATTACHMENT_MEMORY_MB, max_chars: int = ATTACHMENT_MAX_CHARS):
+        """
+        Args:
+            workers: Number of worker processes.
+            timeout: Seconds allowed per file.
+            memory_limit_mb: Address-space cap of each worker in MB, or None.
+            max_chars: Maximum number of characters kept per file.
+        """
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memory_limit_bytes = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self.max_chars = max_chars
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def extract(self, jobs: List[Tuple[str, str, str, str]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Extract several files.
+
+        At most `workers` files are handed to the pool at once, so every file
+        starts as soon as it is submitted and its deadline can be enforced. A
+        worker that overruns its deadline (e.g. stuck in native code that
+        ignores the timeout signal) is killed with the rest of the pool, its
+        file is reported as timed out and the other files are resubmitted.
+
+        Args:
+            jobs: List of (key, path, filename, content_type).
+
+        Returns:
+            Mapping of key to the extract_file result.
+        """
+        results = {}
+        with self._lock:
+            queue = deque(jobs)
+            in_flight = {}
+            while queue or in_flight:
+                pool = self._get_pool()
+                while queue and len(in_flight) < self.workers:
+                    key, path, filename, content_type = job = queue.popleft()
+                    async_result = pool.apply_async(
+                        extract_file, (path, filename, content_type, self.timeout, self.max_chars)
+                    )
+                    in_flight[key] = (job, async_result, time.monotonic() + self.timeout + HARD_TIMEOUT_GRACE)
+
+                overrun = None
+                for key, (job, async_result, deadline) in list(in_flight.items()):
+                    if async_result.ready():
+                        del in_flight[key]
+                        try:
+                            results[key] = async_result.get()
+                        except Exception as e:
+                            results[key] = {"status": FAILED, "text": "", "error": str(e), "extractor": None}
+                    elif time.monotonic() > deadline:
+                        overrun = key
+                if overrun is not None:
+                    job = in_flight.pop(overrun)[0]
+                    logger.warning(f"⚠️ Killing attachment workers: {job[2]} exceeded {self.timeout}s")
+                    results[overrun] = {"status": TIMEOUT, "text": "", "extractor": kind_of(job[2], job[3]),
+                                        "error": f"Worker killed after {self.timeout + HARD_TIMEOUT_GRACE}s"}
+                    self._terminate()
+                    queue.extendleft(entry[0] for entry in in_flight.values())
+                    in_flight.clear()
+                elif in_flight:
+                    time.sleep(0.02)
+        return results
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        with self._lock:
+            self._terminate()
+
+    def _get_pool(self):
+        if self._pool is None:
+            # Spawn instead of fork: the app has threads and open connections that must not be copied.
+            context = multiprocessing.get_context("spawn")
+            self._pool = context.Pool(
+                self.workers, initializer=init_worker, initargs=(self.memory_limit_bytes,), maxtasksperchild=100
+            )
+        return self._pool
+
+    def _terminate(self) -> None:
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def get_attachment_extractor() -> AttachmentExtractor:
+    """Return the process-wide attachment extractor."""
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = AttachmentExtractor()
+            atexit.register(_extractor.close)
+        return _extractor
+
+
+def extract_pending_attachments(session, limit: Optional[int] = None) -> Dict[str, int]:
+    """
+    Extract the text of every attachment that has not been processed yet.
+
+    Args:
+        session: The database session to use.
+        limit: Maximum number of attachments to process.
+
+    Returns:
+        Counts of attachments per outcome ("extracted", "cached" and each failure status).
+    """
+    query = session.query(Attachment).filter(~Attachment.extracted.has()).order_by(Attachment.id)
+    if limit:
+        query = query.limit(limit)
+    attachments = query.all()
+    counts = {}
+    if not attachments:
+        return counts
+
+    def store(attachment, content_hash, result, outcome):
+        session.add(AttachmentText(
+            attachment_id=attachment.id, content_hash=content_hash, status=result["status"],
+            extractor=result.get("extractor"), text=result.get("text"), error=result.get("error"),
+        ))
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+    by_hash = {}
+    jobs = []
+    try:
+        for attachment in attachments:
+            if not attachment.storage_path or not os.path.exists(attachment.storage_path):
+                status = TOO_LARGE if (attachment.size or 0) > ATTACHMENT_MAX_BYTES else FAILED
+                store(attachment, "", {"status": status, "error": "File not stored"}, status)
+                continue
+            if kind_of(attachment.filename, attachment.content_type) is None:
+                store(attachment, "", {"status": UNSUPPORTED, "error": f"Unsupported type {attachment.content_type}"},
+                      UNSUPPORTED)
+                continue
+
+            content_hash = file_hash(attachment.storage_path)
+            cached = session.query(AttachmentText).filter(
+                AttachmentText.content_hash == content_hash, AttachmentText.status.in_(REUSABLE_STATUSES)).first()
+            if cached:
+                store(attachment, content_hash, {"status": cached.status, "extractor": cached.extractor,
+                                                 "text": cached.text, "error": cached.error}, "cached")
+                continue
+            if content_hash not in by_hash:
+                jobs.append((content_hash, attachment.storage_path, attachment.filename, attachment.content_type))
+            by_hash.setdefault(content_hash, []).append(attachment)
+
+        results = get_attachment_extractor().extract(jobs)
+        for content_hash, result in results.items():
+            for position, attachment in enumerate(by_hash[content_hash]):
+                outcome = "extracted" if result["status"] == OK else result["status"]
+                store(attachment, content_hash, result, outcome if position == 0 else "cached")
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Error extracting attachments: {str(e)}")
+        return {}
+    logger.info(f"✅ Processed {len(attachments)} attachments: {counts}")
+    return counts
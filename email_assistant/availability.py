@@ -0,0 +1,230 @@
+"""
+Availability engine over busy intervals.
+
+Busy intervals are parsed once into POSIX timestamps, sorted and merged into
+two numpy arrays. Non-working hours are added as busy time, so the free gaps
+of a whole horizon come out of a single merge: gap i runs from the end of
+merged interval i to the start of merged interval i + 1. Buffers around
+meetings and a minimum slot length are applied during that sweep, and slot
+counts or earliest starts for many meeting durations are computed together
+with array operations.
+"""
+from datetime import datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pytz
+
+from email_assistant.config import settings
+
+CALENDAR_TIMEZONE = getattr(settings, "CALENDAR_TIMEZONE", "UTC")
+
+TimeLike = Union[datetime, str, float, int]
+
+
+def to_timestamp(value: TimeLike) -> float:
+    """
+    Convert a datetime, an ISO 8601 string or a timestamp to a POSIX timestamp.
+
+    Naive datetimes are taken as UTC.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def to_datetime(timestamp: float) -> datetime:
+    """Convert a POSIX timestamp to an aware UTC datetime."""
+    return datetime.fromtimestamp(float(timestamp), timezone.utc)
+
+
+def merge_intervals(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge overlapping or touching intervals.
+
+    Args:
+        starts: Interval starts.
+        ends: Interval ends, same length as starts.
+
+    Returns:
+        Tuple of (starts, ends) of disjoint intervals sorted by start.
+    """
+    if len(starts) == 0:
+        return np.empty(0), np.empty(0)
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    # An interval opens a new group when it starts after everything before it has ended.
+    opens = np.empty(len(starts), dtype=bool)
+    opens[0] = True
+    opens[1:] = starts[1:] > reach[:-1]
+    group_starts = np.flatnonzero(opens)
+    group_ends = np.append(group_starts[1:], len(starts)) - 1
+    return starts[group_starts], reach[group_ends]
+
+
+def off_hours(start: float, end: float, working_hours: Tuple[int, int], tz,
+              weekdays_only: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the intervals outside working hours between two timestamps.
+
+    Args:
+        start: Start of the horizon.
+        end: End of the horizon.
+        working_hours: (first hour, last hour) of the working day in tz.
+        tz: pytz time zone the working hours are in.
+        weekdays_only: Treat Saturdays and Sundays as non-working days.
+
+    Returns:
+        Tuple of (starts, ends) arrays.
+    """
+    first_day = to_datetime(start).astimezone(tz).date() - timedelta(days=1)
+    last_day = to_datetime(end).astimezone(tz).date() + timedelta(days=1)
+    opens, closes = [], []
+    day = first_day
+    while day <= last_day:
+        if not (weekdays_only and day.weekday() >= 5):
+            opens.append(tz.localize(datetime.combine(day, time(working_hours[0]))).timestamp())
+            closes.append(tz.localize(datetime.combine(day, time(working_hours[1]))).timestamp())
+        day += timedelta(days=1)
+    # Off hours run from each closing time to the next opening time.
+    bounds_start = np.array([start - 1.0] + closes)
+    bounds_end = np.array(opens + [end + 1.0])
+    keep = bounds_end > bounds_start
+    return bounds_start[keep], bounds_end[keep]
+
+
+class BusySchedule:
+    """Merged busy intervals of one or more calendars."""
+
+    def __init__(self, starts: Iterable[float] = (), ends: Iterable[float] = ()):
+        """
+        Args:
+            starts: Busy interval starts as POSIX timestamps.
+            ends: Busy interval ends as POSIX timestamps.
+        """
+        self.raw_starts = np.asarray(list(starts), dtype="float64")
+        self.raw_ends = np.asarray(list(ends), dtype="float64")
+        self.starts, self.ends = merge_intervals(self.raw_starts, self.raw_ends)
+
+    @classmethod
+    def from_intervals(cls, intervals: Iterable[Tuple[TimeLike, TimeLike]]) -> "BusySchedule":
+        """Build a schedule from (start, end) pairs of datetimes, ISO strings or timestamps."""
+        pairs = [(to_timestamp(start), to_timestamp(end)) for start, end in intervals]
+        return cls([start for start, _ in pairs], [end for _, end in pairs])
+
+    @classmethod
+    def from_freebusy(cls, busy: Iterable[Dict[str, str]]) -> "BusySchedule":
+        """Build a schedule from the "busy" list of a freebusy().query response."""
+        return cls.from_intervals((entry["start"], entry["end"]) for entry in busy)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def is_free(self, start: TimeLike, end: TimeLike) -> bool:
+        """Return True if no busy interval overlaps [start, end)."""
+        start, end = to_timestamp(start), to_timestamp(end)
+        # The last merged interval starting before end is the only one that can overlap.
+        index = np.searchsorted(self.starts, end, side="left") - 1
+        return index < 0 or self.ends[index] <= start
+
+    def free_gaps(self, start: TimeLike, end: TimeLike, working_hours: Optional[Tuple[int, int]] = None,
+                  tz: Optional[str] = None, buffer_minutes: float = 0, min_minutes: float = 0,
+                  weekdays_only: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compute the free gaps in a horizon.
+
+        Args:
+            start: Start of the horizon.
+            end: End of the horizon.
+            working_hours: (first hour, last hour) to restrict gaps to, or None for any time.
+            tz: Time zone of the working hours, defaults to CALENDAR_TIMEZONE.
+            buffer_minutes: Free time kept before and after every busy interval.
+            min_minutes: Shortest gap returned.
+            weekdays_only: Exclude Saturdays and Sundays (only with working_hours).
+
+        Returns:
+            Tuple of (starts, ends) arrays of the free gaps, sorted.
+        """
+        low, high = to_timestamp(start), to_timestamp(end)
+        buffer = buffer_minutes * 60.0
+        if buffer:
+            # Buffers can join intervals that were apart, so merge again from the raw intervals.
+            busy_starts, busy_ends = self.raw_starts - buffer, self.raw_ends + buffer
+        else:
+            busy_starts, busy_ends = self.starts, self.ends
+        inside = (busy_ends > low) & (busy_starts < high)
+        busy_starts, busy_ends = busy_starts[inside], busy_ends[inside]
+        if working_hours is not None:
+            closed_starts, closed_ends = off_hours(low, high, working_hours,
+                                                   pytz.timezone(tz or CALENDAR_TIMEZONE), weekdays_only)
+            busy_starts = np.concatenate([busy_starts, closed_starts])
+            busy_ends = np.concatenate([busy_ends, closed_ends])
+        # Sentinels at both ends of the horizon turn "between busy intervals" into the whole answer.
+        merged_starts, merged_ends = merge_intervals(
+            np.concatenate([[-np.inf], busy_starts, [high]]),
+            np.concatenate([[low], busy_ends, [np.inf]]),
+        )
+        gap_starts, gap_ends = merged_ends[:-1], merged_starts[1:]
+        keep = gap_ends - gap_starts >= max(min_minutes * 60.0, 1e-9)
+        return gap_starts[keep], gap_ends[keep]
+
+    def slots(self, start: TimeLike, end: TimeLike, duration_minutes: float,
+              step_minutes: Optional[float] = None, limit: Optional[int] = None, **gap_options) -> List[Dict[str, datetime]]:
+        """
+        List candidate meeting slots in the free gaps.
+
+        Args:
+            start: Start of the horizon.
+            end: End of the horizon.
+            duration_minutes: Meeting length.
+            step_minutes: Distance between candidate starts within a gap, defaults to the duration.
+            limit: Maximum number of slots returned.
+            **gap_options: working_hours, tz, buffer_minutes and weekdays_only, see free_gaps.
+
+        Returns:
+            List of {'start', 'end'} dictionaries with UTC datetimes, earliest first.
+        """
+        duration = duration_minutes * 60.0
+        step = (step_minutes or duration_minutes) * 60.0
+        gap_starts, gap_ends = self.free_gaps(start, end, min_minutes=duration_minutes, **gap_options)
+        counts = np.floor((gap_ends - gap_starts - duration) / step).astype(int) + 1
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        slot_starts = np.repeat(gap_starts, counts) + offsets * step
+        if limit is not None:
+            slot_starts = slot_starts[:limit]
+        return [{"start": to_datetime(slot), "end": to_datetime(slot + duration)} for slot in slot_starts]
+
+    def capacity(self, start: TimeLike, end: TimeLike, durations_minutes: Sequence[float],
+                 **gap_options) -> Dict[str, np.ndarray]:
+        """
+        Answer availability for many meeting durations at once.
+
+        Args:
+            start: Start of the horizon.
+            end: End of the horizon.
+            durations_minutes: Meeting lengths to evaluate.
+            **gap_options: working_hours, tz, buffer_minutes, min_minutes and weekdays_only, see free_gaps.
+
+        Returns:
+            Dictionary of arrays aligned with durations_minutes: "slots" (how many back-to-back
+            meetings fit), "earliest" (timestamp of the first possible start, NaN if none) and
+            "gaps" (number of gaps long enough).
+        """
+        gap_starts, gap_ends = self.free_gaps(start, end, **gap_options)
+        durations = np.asarray(durations_minutes, dtype="float64")[:, None] * 60.0
+        lengths = (gap_ends - gap_starts)[None, :]
+        fits = lengths >= durations
+        first = np.argmax(fits, axis=1)
+        any_fit = fits.any(axis=1)
+        earliest = np.where(any_fit, gap_starts[first] if len(gap_starts) else np.nan, np.nan)
+        return {
+            "slots": np.floor(lengths / durations).sum(axis=1).astype(int),
+            "earliest": earliest,
+            "gaps": fits.sum(axis=1),
+        }
+
@@ -0,0 +1,321 @@
+"""
+Local cache of calendar events for availability checks.
+
+Each calendar's events are kept as busy intervals in memory, sorted by start,
+and in an SQLite file shared across processes and restarts. The cache is
+brought up to date with the Calendar API's incremental sync: the first sync
+lists every event from CALENDAR_SYNC_LOOKBACK_DAYS ago and stores the
+nextSyncToken, later syncs only fetch what changed since that token. A 410
+(token expired) drops the calendar's events and runs a full sync again.
+
+Availability checks sync at most once every CALENDAR_SYNC_INTERVAL seconds
+and otherwise answer from memory with a binary search.
+"""
+import bisect
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from email_assistant.config import settings
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_CACHE_PATH = getattr(settings, "CALENDAR_CACHE_PATH", "calendar_cache.db")
+CALENDAR_SYNC_INTERVAL = getattr(settings, "CALENDAR_SYNC_INTERVAL", 60)
+CALENDAR_SYNC_LOOKBACK_DAYS = getattr(settings, "CALENDAR_SYNC_LOOKBACK_DAYS", 30)
+SYNC_PAGE_SIZE = 2500
+
+
+class SyncTokenExpired(Exception):
+    """Raised when the Calendar API rejects a sync token (HTTP 410)."""
+
+
+def event_interval(event: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    """
+    Return the busy interval of an event as UTC timestamps.
+
+    Cancelled events, events marked "free" (transparent) and events the user
+    declined do not block time and return None.
+
+    Args:
+        event: An event resource from the Calendar API.
+
+    Returns:
+        Tuple of (start, end) POSIX timestamps, or None if the event does not block time.
+    """
+    if event.get("status") == "cancelled" or event.get("transparency") == "transparent":
+        return None
+    for attendee in event.get("attendees", []):
+        if attendee.get("self") and attendee.get("responseStatus") == "declined":
+            return None
+    try:
+        start, end = event["start"], event["end"]
+        # All-day events only have a date, taken as local midnight like the rest of CalendarService
+        start = datetime.fromisoformat(start.get("dateTime", start.get("date")).replace("Z", "+00:00"))
+        end = datetime.fromisoformat(end.get("dateTime", end.get("date")).replace("Z", "+00:00"))
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+    return start.astimezone(timezone.utc).timestamp(), end.astimezone(timezone.utc).timestamp()
+
+
+class CalendarEventCache:
+    """Two-tier (memory + SQLite) cache of one calendar's busy intervals."""
+
+    def __init__(self, service, calendar_id: str = "primary", path: Optional[str] = CALENDAR_CACHE_PATH,
+                 sync_interval: float = CALENDAR_SYNC_INTERVAL):
+        """
+        Args:
+            service: A Calendar API service object (googleapiclient).
+            calendar_id: The calendar to mirror.
+            path: SQLite file for the persistent tier, or None for memory only.
+            sync_interval: Seconds a sync stays fresh for availability checks.
+        """
+        self.service = service
+        self.calendar_id = calendar_id
+        self.path = path
+        self.sync_interval = sync_interval
+        self.sync_token = None
+        self.synced_at = 0.0
+        self._events = {}  # event id -> (start, end)
+        self._intervals = []  # sorted (start, end, event id)
+        self._max_length = 0.0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._conn = None
+        self.counters = {"full_syncs": 0, "incremental_syncs": 0, "changes": 0, "lookups": 0}
+
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS events ("
+                    "calendar_id TEXT NOT NULL, event_id TEXT NOT NULL, start REAL NOT NULL, end REAL NOT NULL, "
+                    "PRIMARY KEY (calendar_id, event_id))"
+                )
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sync_state ("
+                    "calendar_id TEXT PRIMARY KEY, sync_token TEXT, synced_at REAL NOT NULL)"
+                )
+                self._conn.commit()
+                self._load()
+            except sqlite3.Error as e:
+                logger.error(f"❌ Calendar cache disabled on disk ({path}): {str(e)}")
+                self._conn = None
+
+    def sync(self) -> bool:
+        """
+        Fetch changes since the last sync, or every event if there is no valid sync token.
+
+        Returns:
+            True if the cache is up to date, False if the sync failed (the cache keeps its old content).
+        """
+        with self._sync_lock:
+            try:
+                if self.sync_token:
+                    try:
+                        self._incremental_sync()
+                    except SyncTokenExpired:
+                        logger.warning(f"⚠️ Sync token of calendar {self.calendar_id} expired, running a full sync")
+                        self._full_sync()
+                else:
+                    self._full_sync()
+                return True
+            except Exception as e:
+                logger.error(f"❌ Error syncing calendar {self.calendar_id}: {str(e)}")
+                return False
+
+    def ensure_fresh(self) -> None:
+        """
+        Sync if the last sync is older than sync_interval.
+
+        Raises:
+            RuntimeError: If the calendar was never synced and syncing fails.
+        """
+        if time.time() - self.synced_at < self.sync_interval:
+            return
+        if not self.sync() and not self.sync_token:
+            raise RuntimeError(f"Calendar {self.calendar_id} could not be synced")
+
+    def busy_intervals(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """
+        Return the busy intervals overlapping [start, end), sorted by start.
+
+        Args:
+            start: Start of the window (timezone-aware, or naive local time).
+            end: End of the window.
+
+        Returns:
+            List of (start, end) UTC datetimes.
+        """
+        self.ensure_fresh()
+        low, high = start.astimezone(timezone.utc).timestamp(), end.astimezone(timezone.utc).timestamp()
+        with self._lock:
+            self.counters["lookups"] += 1
+            # No interval is longer than _max_length, so earlier starts cannot overlap the window.
+            first = bisect.bisect_left(self._intervals, (low - self._max_length,))
+            last = bisect.bisect_left(self._intervals, (high,))
+            overlapping = [(s, e) for s, e, _ in self._intervals[first:last] if e > low]
+        return [(datetime.fromtimestamp(s, timezone.utc), datetime.fromtimestamp(e, timezone.utc))
+                for s, e in overlapping]
+
+    def __contains__(self, event_id: str) -> bool:
+        """Return True if the event is cached as busy time."""
+        with self._lock:
+            return event_id in self._events
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        """Return True if no busy interval overlaps [start, end)."""
+        return not self.busy_intervals(start, end)
+
+    def apply(self, event: Dict[str, Any]) -> None:
+        """
+        Record an event we created or changed ourselves, without waiting for the next sync.
+
+        Args:
+            event: The event resource returned by the Calendar API.
+        """
+        with self._lock:
+            self._apply_changes([event])
+            self._rebuild()
+            self._commit()
+
+    def clear(self) -> None:
+        """Drop every cached event and the sync token of this calendar."""
+        with self._lock:
+            self._events.clear()
+            self._rebuild()
+            self.sync_token = None
+            self.synced_at = 0.0
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM events WHERE calendar_id = ?", (self.calendar_id,))
+                self._conn.execute("DELETE FROM sync_state WHERE calendar_id = ?", (self.calendar_id,))
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return sync counters, the number of cached events and the age of the last sync."""
+        with self._lock:
+            stats = dict(self.counters)
+            stats["events"] = len(self._events)
+        stats["sync_age"] = time.time() - self.synced_at if self.synced_at else None
+        return stats
+
+    def _list(self, **params) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Page through events().list and return (items, nextSyncToken)."""
+        items = []
+        page_token = None
+        while True:
+            try:
+                response = self.service.events().list(
+                    calendarId=self.calendar_id, singleEvents=True, maxResults=SYNC_PAGE_SIZE,
+                    pageToken=page_token, **params
+                ).execute()
+            except Exception as e:
+                if getattr(getattr(e, "resp", None), "status", None) == 410:
+                    raise SyncTokenExpired() from e
+                raise
+            items.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return items, response.get("nextSyncToken")
+
+    def _full_sync(self) -> None:
+        time_min = datetime.now(timezone.utc) - timedelta(days=CALENDAR_SYNC_LOOKBACK_DAYS)
+        items, sync_token = self._list(timeMin=time_min.isoformat(), showDeleted=False)
+        with self._lock:
+            self._events.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM events WHERE calendar_id = ?", (self.calendar_id,))
+            self._apply_changes(items)
+            self._finish_sync(sync_token)
+            self.counters["full_syncs"] += 1
+        logger.info(f"✅ Synced calendar {self.calendar_id}: {len(self._events)} busy events")
+
+    def _incremental_sync(self) -> None:
+        items, sync_token = self._list(syncToken=self.sync_token)
+        with self._lock:
+            self._apply_changes(items)
+            self._finish_sync(sync_token or self.sync_token)
+            self.counters["incremental_syncs"] += 1
+
+    def _apply_changes(self, items: List[Dict[str, Any]]) -> None:
+        for event in items:
+            event_id = event.get("id")
+            if not event_id:
+                continue
+            interval = event_interval(event)
+            self.counters["changes"] += 1
+            if interval is None:
+                self._events.pop(event_id, None)
+                if self._conn is not None:
+                    self._conn.execute("DELETE FROM events WHERE calendar_id = ? AND event_id = ?",
+                                       (self.calendar_id, event_id))
+            else:
+                self._events[event_id] = interval
+                if self._conn is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO events (calendar_id, event_id, start, end) VALUES (?, ?, ?, ?)",
+                        (self.calendar_id, event_id, interval[0], interval[1]),
+                    )
+
+    def _finish_sync(self, sync_token: Optional[str]) -> None:
+        self.sync_token = sync_token
+        self.synced_at = time.time()
+        self._rebuild()
+        if self._conn is not None:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (calendar_id, sync_token, synced_at) VALUES (?, ?, ?)",
+                (self.calendar_id, self.sync_token, self.synced_at),
+            )
+        self._commit()
+
+    def _commit(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"❌ Error writing calendar cache: {str(e)}")
+
+    def _rebuild(self) -> None:
+        self._intervals = sorted((start, end, event_id) for event_id, (start, end) in self._events.items())
+        self._max_length = max((end - start for start, end, _ in self._intervals), default=0.0)
+
+    def _load(self) -> None:
+        rows = self._conn.execute(
+            "SELECT event_id, start, end FROM events WHERE calendar_id = ?", (self.calendar_id,)
+        ).fetchall()
+        state = self._conn.execute(
+            "SELECT sync_token, synced_at FROM sync_state WHERE calendar_id = ?", (self.calendar_id,)
+        ).fetchone()
+        with self._lock:
+            self._events = {event_id: (start, end) for event_id, start, end in rows}
+            self._rebuild()
+            if state:
+                self.sync_token, self.synced_at = state
+
+
+_event_caches = {}
+_event_caches_lock = threading.Lock()
+
+
+def get_event_cache(service, calendar_id: str = "primary") -> CalendarEventCache:
+    """
+    Return the process-wide event cache of a calendar.
+
+    Args:
+        service: The Calendar API service object used for syncing.
+        calendar_id: The calendar to mirror.
+
+    Returns:
+        The calendar's CalendarEventCache.
+    """
+    with _event_caches_lock:
+        cache = _event_caches.get(calendar_id)
+        if cache is None:
+            cache = _event_caches[calendar_id] = CalendarEventCache(service, calendar_id)
+        elif service is not None:
+            cache.service = service
+        return cache
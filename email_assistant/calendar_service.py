@@ -1,15 +1,45 @@
 """
 Google Calendar integration for meeting scheduling.
+
+Availability checks read the calendar from a local event cache (see
+calendar_cache) that is kept current with incremental syncs, instead of
+listing events from the API for every check.
+
+The service is built once per process (get_calendar_service) from the
+discovery document bundled with google-api-python-client. Each thread gets
+its own authorized HTTP connection, kept open between requests, and token
+refreshes are serialized so concurrent requests refresh once.
+
+Bulk scheduling (schedule_events) sends the attendee availability lookups
+and then the event inserts as Google API batch requests. Events get an ID
+derived from the email they came from, so processing an email twice finds
+the existing event instead of creating a duplicate.
+
+The service is shared by every thread, so booking a slot is check-and-accept
+under a lock: schedule and schedule_events keep the time of each event they
+are about to create in an accepted list that later checks count as busy,
+and two threads cannot both take the same slot.
 """
+import base64
+import hashlib
 import os
 import pickle
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
+import google_auth_httplib2
+import httplib2
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+from email_assistant.availability import BusySchedule
+from email_assistant.calendar_cache import get_event_cache
 from email_assistant.config import settings
+from email_assistant.scheduling import common_slots, find_common_slots, freebusy_bodies, parse_freebusy
+from email_assistant.classifier import MEETING_PHRASES
 import re
 from typing import Dict, List, Optional, Tuple
 import json
@@ -19,35 +49,108 @@ import pytz
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CALENDAR_HTTP_TIMEOUT = getattr(settings, "CALENDAR_HTTP_TIMEOUT", 30)
+# Google recommends at most 50 calls per batch request for the Calendar API
+CALENDAR_BATCH_SIZE = getattr(settings, "CALENDAR_BATCH_SIZE", 50)
+CALENDAR_BATCH_RETRIES = getattr(settings, "CALENDAR_BATCH_RETRIES", 3)
+RETRYABLE_STATUSES = {403, 429, 500, 502, 503, 504}
+
+
+class ThreadLocalHttp:
+    """Hands each thread its own authorized httplib2 connection (httplib2 objects are not thread-safe)."""
+
+    def __init__(self, credentials, timeout: float = CALENDAR_HTTP_TIMEOUT):
+        """
+        Args:
+            credentials: OAuth credentials, or None for unauthenticated connections (local API stand-ins).
+            timeout: Socket timeout in seconds.
+        """
+        self.credentials = credentials
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def get(self):
+        """Return this thread's connection, creating it on first use."""
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = httplib2.Http(timeout=self.timeout)
+            if self.credentials is not None:
+                http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=http)
+            self._local.http = http
+        return http
+
+    def request_builder(self, http, *args, **kwargs):
+        """requestBuilder for build(): send every request over the calling thread's connection."""
+        return HttpRequest(self.get(), *args, **kwargs)
+
+
+_refresh_lock = threading.Lock()
+
+
+def _serialize_refresh(creds):
+    """Make concurrent token refreshes wait for one another and skip a refresh another thread already did."""
+    refresh = creds.refresh
+
+    def locked_refresh(request):
+        token = creds.token
+        with _refresh_lock:
+            if creds.token != token and creds.valid:
+                return
+            refresh(request)
+            try:
+                with open(settings.GOOGLE_TOKEN_FILE, 'w') as token_file:
+                    token_file.write(creds.to_json())
+            except OSError as e:
+                logger.warning(f"⚠️ Could not save refreshed calendar token: {str(e)}")
+
+    creds.refresh = locked_refresh
+    return creds
+
+
+def load_credentials():
+    """Load the calendar OAuth credentials from the token file, refreshing them or logging in as needed."""
+    creds = None
+    # The file token.json stores the user's access and refresh tokens
+    if os.path.exists(settings.GOOGLE_TOKEN_FILE):
+        creds = Credentials.from_authorized_user_file(settings.GOOGLE_TOKEN_FILE, settings.GOOGLE_CALENDAR_SCOPES)
+
+    # If there are no (valid) credentials available, let the user log in
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(
+                settings.GOOGLE_CREDENTIALS_FILE, settings.GOOGLE_CALENDAR_SCOPES)
+            creds = flow.run_local_server(port=0)
+        # Save the credentials for the next run
+        with open(settings.GOOGLE_TOKEN_FILE, 'w') as token:
+            token.write(creds.to_json())
+    return creds
+
+
 class CalendarService:
     """Service for handling Google Calendar operations."""
 
 
 
-    def __init__(self):
-        self.service = self._get_calendar_service()
+    def __init__(self, service=None):
+        """
+        Args:
+            service: A Calendar API service object to use instead of building an authorized
+                one (e.g. one pointed at a local stand-in of the API).
+        """
+        self.service = service or self._get_calendar_service()
+        self.event_cache = get_event_cache(self.service)
+        self._booking_lock = threading.Lock()
+        self._accepted = []  # (start, end) in UTC of events being created by this service
 
     def _get_calendar_service(self):
         """Initialize the Calendar API service."""
         try:
-            creds = None
-            # The file token.json stores the user's access and refresh tokens
-            if os.path.exists(settings.GOOGLE_TOKEN_FILE):
-                creds = Credentials.from_authorized_user_file(settings.GOOGLE_TOKEN_FILE, settings.GOOGLE_CALENDAR_SCOPES)
-
-            # If there are no (valid) credentials available, let the user log in
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    creds.refresh(Request())
-                else:
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        settings.GOOGLE_CREDENTIALS_FILE, settings.GOOGLE_CALENDAR_SCOPES)
-                    creds = flow.run_local_server(port=0)
-                # Save the credentials for the next run
-                with open(settings.GOOGLE_TOKEN_FILE, 'w') as token:
-                    token.write(creds.to_json())
-
-            return build('calendar', 'v3', credentials=creds)
+            http = ThreadLocalHttp(_serialize_refresh(load_credentials()))
+            # static_discovery: use the bundled discovery document instead of fetching it
+            return build('calendar', 'v3', http=http.get(), requestBuilder=http.request_builder,
+                         static_discovery=True, cache_discovery=False)
         except Exception as e:
             logger.error(f"❌ Error initializing calendar service: {str(e)}")
             return None
@@ -63,19 +166,8 @@ class CalendarService:
             Dictionary containing meeting details if found, None otherwise
         """
         try:
-            # Common meeting-related phrases
-            meeting_phrases = [
-                r'(?i)meeting\s+(?:on|at|for)',
-                r'(?i)schedule\s+(?:a\s+)?meeting',
-                r'(?i)let\'s\s+meet',
-                r'(?i)would\s+you\s+like\s+to\s+meet',
-                r'(?i)propose\s+a\s+time',
-                r'(?i)set\s+up\s+a\s+call',
-                r'(?i)arrange\s+a\s+meeting'
-            ]
-
             # Check if email contains meeting-related phrases
-            if not any(re.search(phrase, email_content) for phrase in meeting_phrases):
+            if not any(re.search(phrase, email_content) for phrase in MEETING_PHRASES):
                 return None
 
             # Extract date and time
@@ -130,42 +222,73 @@ class CalendarService:
             logger.error(f"❌ Error detecting meeting request: {str(e)}")
             return None
 
+    @staticmethod
+    def event_id_for(source_id: str) -> str:
+        """
+        Derive a stable calendar event ID from the email an event comes from.
+
+        Event IDs may only use the base32hex alphabet (a-v, 0-9), so the hash
+        of the source is encoded with it.
+
+        Args:
+            source_id: A stable identifier of the source email (its Message-ID).
+
+        Returns:
+            A 32-character event ID.
+        """
+        digest = hashlib.sha1(source_id.encode("utf-8")).digest()
+        return base64.b32hexencode(digest).decode("ascii").lower().rstrip("=")
+
+    @staticmethod
+    def _event_body(event_details):
+        """Build the event resource for event_details."""
+        # Convert string date/time to datetime if needed
+        start_time = event_details['start_time']
+        if isinstance(start_time, str):
+            start_time = datetime.strptime(start_time, '%Y-%m-%d %H:%M')
+
+        end_time = event_details.get('end_time')
+        if not end_time:
+            end_time = start_time + timedelta(hours=1)
+        elif isinstance(end_time, str):
+            end_time = datetime.strptime(end_time, '%Y-%m-%d %H:%M')
+
+        event = {
+            'summary': event_details['title'],
+            'location': event_details.get('location', ''),
+            'description': event_details.get('description', ''),
+            'start': {
+                'dateTime': start_time.isoformat(),
+                'timeZone': 'UTC',
+            },
+            'end': {
+                'dateTime': end_time.isoformat(),
+                'timeZone': 'UTC',
+            },
+            'attendees': [{'email': email} for email in event_details.get('attendees', [])],
+            'reminders': {
+                'useDefault': True
+            },
+        }
+        if event_details.get('source_id'):
+            event['id'] = CalendarService.event_id_for(event_details['source_id'])
+        return event
+
     def create_event(self, event_details):
-        """Create a calendar event."""
+        """Create a calendar event, or return the existing one if this source email was already scheduled."""
         try:
             if not self.service:
                 raise Exception("Calendar service not initialized")
 
-            # Convert string date/time to datetime if needed
-            start_time = event_details['start_time']
-            if isinstance(start_time, str):
-                start_time = datetime.strptime(start_time, '%Y-%m-%d %H:%M')
-
-            end_time = event_details.get('end_time')
-            if not end_time:
-                end_time = start_time + timedelta(hours=1)
-            elif isinstance(end_time, str):
-                end_time = datetime.strptime(end_time, '%Y-%m-%d %H:%M')
-
-            event = {
-                'summary': event_details['title'],
-                'location': event_details.get('location', ''),
-                'description': event_details.get('description', ''),
-                'start': {
-                    'dateTime': start_time.isoformat(),
-                    'timeZone': 'UTC',
-                },
-                'end': {
-                    'dateTime': end_time.isoformat(),
-                    'timeZone': 'UTC',
-                },
-                'attendees': [{'email': email} for email in event_details.get('attendees', [])],
-                'reminders': {
-                    'useDefault': True
-                },
-            }
-
-            event = self.service.events().insert(calendarId='primary', body=event).execute()
+            event = self._event_body(event_details)
+            try:
+                event = self.service.events().insert(calendarId='primary', body=event).execute()
+            except Exception as e:
+                if _http_status(e) != 409 or 'id' not in event:
+                    raise
+                logger.info(f"Event {event['id']} already exists")
+                return event['id']
+            self.event_cache.apply(event)
             logger.info(f"✅ Event created: {event.get('htmlLink')}")
             return event['id']
 
@@ -173,60 +296,254 @@ class CalendarService:
             logger.error(f"❌ Error creating calendar event: {str(e)}")
             return None
 
-    def get_available_slots(self, duration_minutes: int = 60, days_ahead: int = 7) -> List[Dict]:
+    def schedule(self, event_details, num_options=3, days_ahead=7):
         """
-        Get available time slots for scheduling.
+        Check availability and create one event, without double-booking against other threads.
+
+        The attendee check runs unlocked; the organizer's slot is then checked
+        again and accepted under the booking lock before the event is inserted.
 
         Args:
-            duration_minutes: Duration of the meeting in minutes
-            days_ahead: Number of days to look ahead for availability
+            event_details: Event details as for create_event.
+            num_options: Number of alternative slots proposed on a conflict
+            days_ahead: Number of days searched for alternatives
 
         Returns:
-            List of available time slots
+            {'status': 'success' | 'exists' | 'conflict' | 'error', 'event_id', 'alternative_slots',
+            'unknown_attendees', 'message'}
         """
-        try:
-            now = datetime.utcnow()
-            end_time = now + timedelta(days=days_ahead)
+        source_id = event_details.get('source_id')
+        if source_id and self.event_id_for(source_id) in self.event_cache:
+            event_id = self.event_id_for(source_id)
+            return {'status': 'exists', 'event_id': event_id, 'message': f"Event {event_id} already exists"}
+
+        start, end = event_details['start_time'], event_details['end_time']
+        duration_hours = (end - start).total_seconds() / 3600
+        interval = (start.astimezone(pytz.UTC), end.astimezone(pytz.UTC))
+        available, slots, unknown = self.check_attendees_availability(
+            start, duration_hours, event_details.get('attendees'), num_options, days_ahead)
+        if available:
+            with self._booking_lock:
+                # Another thread may have taken the slot since the check
+                available = self._slot_free(*interval)
+                if available:
+                    self._accepted.append(interval)
+            if not available:
+                _, slots, unknown = self.check_attendees_availability(
+                    start, duration_hours, event_details.get('attendees'), num_options, days_ahead)
+        if not available:
+            return {'status': 'conflict', 'alternative_slots': slots, 'unknown_attendees': unknown,
+                    'message': "The requested time slot is not available."}
+
+        event_id = self.create_event(event_details)
+        with self._booking_lock:
+            # Created events are in the event cache now; refused ones free the slot again
+            self._accepted.remove(interval)
+        if not event_id:
+            return {'status': 'error', 'message': "Failed to create calendar event."}
+        return {'status': 'success', 'event_id': event_id, 'unknown_attendees': unknown,
+                'message': f"Event created successfully with ID: {event_id}"}
+
+    def _slot_free(self, start_utc, end_utc):
+        """Check the organizer's cached and accepted events; call with the booking lock held."""
+        if any(start_utc < accepted_end and accepted_start < end_utc
+               for accepted_start, accepted_end in self._accepted):
+            return False
+        return self.event_cache.is_free(start_utc, end_utc)
+
+    def _accepted_busy(self):
+        """Snapshot of the intervals accepted for events still being created."""
+        with self._booking_lock:
+            return list(self._accepted)
+
+    def execute_batch(self, requests, retries: int = CALENDAR_BATCH_RETRIES):
+        """
+        Execute API requests as batch requests, retrying each failed item on its own.
 
-            # Get busy slots
-            freebusy_query = {
-                "timeMin": now.isoformat() + 'Z',
-                "timeMax": end_time.isoformat() + 'Z',
-                "timeZone": 'UTC',
-                "items": [{"id": "primary"}]
-            }
+        Items that fail with a rate-limit or server error are sent again in the
+        next batch after an exponential backoff; other errors are final.
 
-            freebusy = self.service.freebusy().query(body=freebusy_query).execute()
-            busy_slots = freebusy['calendars']['primary']['busy']
+        Args:
+            requests: Mapping of key to a function returning a fresh HttpRequest.
+            retries: Number of retries per item.
 
-            # Generate available slots
-            available_slots = []
-            current_time = now
+        Returns:
+            Mapping of key to (response, exception); exactly one of them is None.
+        """
+        results = {}
+        pending = list(requests)
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(min(2 ** (attempt - 1), 8))
+            failed = []
+            for offset in range(0, len(pending), CALENDAR_BATCH_SIZE):
+                chunk = pending[offset:offset + CALENDAR_BATCH_SIZE]
+                ids = {str(number): key for number, key in enumerate(chunk)}
+
+                def callback(request_id, response, exception):
+                    results[ids[request_id]] = (response, exception)
+
+                batch = self.service.new_batch_http_request(callback=callback)
+                for request_id, key in ids.items():
+                    batch.add(requests[key](), request_id=request_id)
+                try:
+                    batch.execute()
+                except Exception as e:
+                    # The whole batch failed (e.g. network error): every item gets another chance
+                    for key in chunk:
+                        results.setdefault(key, (None, e))
+                failed.extend(key for key in chunk
+                              if results[key][1] is not None and _is_retryable(results[key][1]))
+            if not failed or attempt == retries:
+                break
+            logger.warning(f"⚠️ Retrying {len(failed)} calendar requests")
+            for key in failed:
+                del results[key]
+            pending = failed
+        return results
+
+    def schedule_events(self, events_details, check_availability=True, days_ahead=7, num_options=3):
+        """
+        Check and create many events with batch requests.
 
-            while current_time < end_time:
-                slot_end = current_time + timedelta(minutes=duration_minutes)
+        The attendee availability lookups of all events go out as one batch of
+        freebusy queries, the inserts of the events that fit as a second batch.
+        Events already accepted (in this call or by other threads) count as busy
+        for the next ones.
 
-                # Check if the slot overlaps with any busy times
-                is_available = True
-                for busy in busy_slots:
-                    busy_start = datetime.fromisoformat(busy['start'].replace('Z', '+00:00'))
-                    busy_end = datetime.fromisoformat(busy['end'].replace('Z', '+00:00'))
+        Args:
+            events_details: List of event details as for create_event, with a 'source_id'
+                for idempotent creation
+            check_availability: Check the organizer and attendees before creating events
+            days_ahead: Number of days searched for alternatives
+            num_options: Number of alternative slots proposed on a conflict
 
-                    if (current_time < busy_end and slot_end > busy_start):
-                        is_available = False
-                        current_time = busy_end
-                        break
+        Returns:
+            One result per event, in order: {'status': 'success' | 'exists' | 'conflict' | 'error',
+            'event_id', 'alternative_slots', 'message'}
+        """
+        if not self.service:
+            return [{'status': 'error', 'message': 'Calendar service not initialized'} for _ in events_details]
+
+        results = [None] * len(events_details)
+        bodies = {}
+        for index, details in enumerate(events_details):
+            try:
+                bodies[index] = self._event_body(details)
+            except Exception as e:
+                results[index] = {'status': 'error', 'message': f"Invalid event details: {str(e)}"}
+                continue
+            # An event created from this email earlier would otherwise conflict with itself
+            event_id = bodies[index].get('id')
+            if event_id and event_id in self.event_cache:
+                del bodies[index]
+                results[index] = {'status': 'exists', 'event_id': event_id,
+                                  'message': f"Event {event_id} already exists"}
+
+        if check_availability:
+            self._check_batch(events_details, bodies, results, days_ahead, num_options)
+
+        inserts = {index: (lambda body=body: self.service.events().insert(calendarId='primary', body=body))
+                   for index, body in bodies.items() if results[index] is None}
+        outcomes = self.execute_batch(inserts)
+        for index, (event, error) in outcomes.items():
+            event_id = bodies[index].get('id')
+            if error is None:
+                self.event_cache.apply(event)
+                results[index] = {'status': 'success', 'event_id': event['id'],
+                                  'message': f"Event created successfully with ID: {event['id']}"}
+            elif _http_status(error) == 409 and event_id:
+                results[index] = {'status': 'exists', 'event_id': event_id,
+                                  'message': f"Event {event_id} already exists"}
+            else:
+                results[index] = {'status': 'error', 'message': f"Failed to create calendar event: {str(error)}"}
+        if check_availability:
+            with self._booking_lock:
+                # Created events are in the event cache now; refused ones free their slot again
+                for index in outcomes:
+                    self._accepted.remove(self._interval(bodies[index]))
+        created = sum(1 for result in results if result and result['status'] == 'success')
+        logger.info(f"✅ Scheduled {created} of {len(events_details)} events")
+        return results
+
+    def _check_batch(self, events_details, bodies, results, days_ahead, num_options):
+        """Mark events that conflict for the organizer or an attendee, with alternatives."""
+        windows, lookups = {}, {}
+        for index, body in bodies.items():
+            start = datetime.fromisoformat(body['start']['dateTime']).astimezone(pytz.UTC)
+            windows[index] = self._search_window(start, days_ahead)
+            attendees = [attendee['email'] for attendee in body['attendees']]
+            for number, query in enumerate(freebusy_bodies(attendees, *windows[index])):
+                lookups[(index, number)] = lambda query=query: self.service.freebusy().query(body=query)
+        responses = self.execute_batch(lookups)
+
+        # Check and accept under the lock, so another thread cannot take a slot in between
+        with self._booking_lock:
+            self._accept_batch(events_details, bodies, results, responses, windows, num_options)
+
+    def _accept_batch(self, events_details, bodies, results, responses, windows, num_options):
+        for index, body in bodies.items():
+            busy, errors = [], {}
+            for (lookup_index, _), (response, error) in responses.items():
+                if lookup_index != index:
+                    continue
+                if error is not None:
+                    results[index] = {'status': 'error', 'message': f"Availability check failed: {str(error)}"}
+                    break
+                parse_freebusy(response, busy, errors)
+            if results[index] is not None:
+                continue
+            start, end = self._interval(body)
+            window_start, window_end = windows[index]
+            check = common_slots(
+                busy, errors, [attendee['email'] for attendee in body['attendees']],
+                (end - start).total_seconds() / 60, window_start, window_end,
+                extra_busy=self.event_cache.busy_intervals(window_start, window_end) + self._accepted,
+                preferred_start=start, num_options=num_options,
+            )
+            if check['available']:
+                self._accepted.append((start, end))
+            else:
+                results[index] = {'status': 'conflict', 'alternative_slots': check['slots'],
+                                  'message': "The requested time slot is not available."}
+
+    @staticmethod
+    def _interval(body):
+        """(start, end) in UTC of an event body."""
+        return (datetime.fromisoformat(body['start']['dateTime']).astimezone(pytz.UTC),
+                datetime.fromisoformat(body['end']['dateTime']).astimezone(pytz.UTC))
+
+    @staticmethod
+    def _search_window(start_time_utc, days_ahead):
+        """Window searched for alternatives: the requested day (from now on) and the following days."""
+        window_start = max(start_time_utc.replace(hour=0, minute=0, second=0, microsecond=0),
+                           datetime.now(pytz.UTC))
+        return window_start, window_start + timedelta(days=days_ahead + 1)
+
+    def get_available_slots(self, duration_minutes: int = 60, days_ahead: int = 7,
+                            working_hours: Optional[Tuple[int, int]] = None, buffer_minutes: int = 0) -> List[Dict]:
+        """
+        Get available time slots for scheduling.
 
-                if is_available:
-                    available_slots.append({
-                        'start': current_time,
-                        'end': slot_end
-                    })
-                    current_time = slot_end
-                else:
-                    current_time = slot_end
+        Args:
+            duration_minutes: Duration of the meeting in minutes
+            days_ahead: Number of days to look ahead for availability
+            working_hours: Optional (first hour, last hour) in CALENDAR_TIMEZONE to restrict slots to
+            buffer_minutes: Free time to keep before and after existing meetings
+
+        Returns:
+            List of available time slots
+        """
+        try:
+            # Start at the next quarter hour so proposed times are round
+            now = datetime.now(pytz.UTC).replace(second=0, microsecond=0)
+            now += timedelta(minutes=-now.minute % 15)
+            end_time = now + timedelta(days=days_ahead)
 
-            return available_slots
+            # Busy intervals are parsed and merged once, then slots are cut from the free gaps
+            schedule = BusySchedule.from_intervals(self.event_cache.busy_intervals(now, end_time))
+            return schedule.slots(now, end_time, duration_minutes, working_hours=working_hours,
+                                  buffer_minutes=buffer_minutes)
 
         except Exception as e:
             logger.error(f"❌ Error getting available slots: {str(e)}")
@@ -282,40 +599,18 @@ class CalendarService:
             start_time_utc = start_time.astimezone(pytz.UTC)
             end_time_utc = end_time.astimezone(pytz.UTC)
 
-            # Get existing events for the day
-            events_result = self.service.events().list(
-                calendarId='primary',
-                timeMin=start_time_utc.isoformat(),
-                timeMax=end_time_utc.isoformat(),
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            events = events_result.get('items', [])
-
-            # Find available slots
-            available_slots = []
-            current_time = start_time_utc
-
-            for event in events:
-                event_start = datetime.fromisoformat(event['start'].get('dateTime', event['start'].get('date'))).astimezone(pytz.UTC)
-                event_end = datetime.fromisoformat(event['end'].get('dateTime', event['end'].get('date'))).astimezone(pytz.UTC)
-
-                # Check if there's enough time before this event
-                if (event_start - current_time).total_seconds() >= duration_hours * 3600:
-                    available_slots.append({
-                        'start': current_time,
-                        'end': current_time + timedelta(hours=duration_hours)
-                    })
-                current_time = event_end
-
-            # Add final slot if there's enough time
-            if (end_time_utc - current_time).total_seconds() >= duration_hours * 3600:
-                available_slots.append({
-                    'start': current_time,
-                    'end': current_time + timedelta(hours=duration_hours)
-                })
-
-            return available_slots
+            # Get existing events for the day from the local cache
+            schedule = BusySchedule.from_intervals(self.event_cache.busy_intervals(start_time_utc, end_time_utc))
+
+            # Offer the start of every free gap long enough for the meeting
+            gap_starts, _ = schedule.free_gaps(start_time_utc, end_time_utc, min_minutes=duration_hours * 60)
+            return [
+                {
+                    'start': datetime.fromtimestamp(gap_start, pytz.UTC),
+                    'end': datetime.fromtimestamp(gap_start, pytz.UTC) + timedelta(hours=duration_hours)
+                }
+                for gap_start in gap_starts
+            ]
 
         except Exception as e:
             logger.error(f"❌ Error finding available times: {str(e)}")
@@ -342,29 +637,16 @@ class CalendarService:
             start_time_utc = start_time.astimezone(pytz.UTC)
             end_time_utc = start_time_utc + timedelta(hours=duration_hours)
 
-            # Get events for the day
-            events_result = self.service.events().list(
-                calendarId='primary',
-                timeMin=start_time_utc.isoformat(),
-                timeMax=end_time_utc.isoformat(),
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            events = events_result.get('items', [])
-
-            # Check for conflicts
-            for event in events:
-                event_start = datetime.fromisoformat(event['start'].get('dateTime', event['start'].get('date'))).astimezone(pytz.UTC)
-                event_end = datetime.fromisoformat(event['end'].get('dateTime', event['end'].get('date'))).astimezone(pytz.UTC)
-
-                # Check if there's any overlap
-                if (start_time_utc < event_end and end_time_utc > event_start):
-                    # Time slot is not available, get alternative slots
-                    alternative_slots = self.find_available_times(
-                        start_time_utc.date(),
-                        duration_hours
-                    )
-                    return False, alternative_slots
+            # Check for conflicts against the local event cache and events being created
+            with self._booking_lock:
+                free = self._slot_free(start_time_utc, end_time_utc)
+            if not free:
+                # Time slot is not available, get alternative slots
+                alternative_slots = self.find_available_times(
+                    start_time_utc.date(),
+                    duration_hours
+                )
+                return False, alternative_slots
 
             # If we get here, the time slot is available
             return True, []
@@ -373,6 +655,48 @@ class CalendarService:
             logger.error(f"❌ Error checking time slot availability: {str(e)}")
             return False, []
 
+    def check_attendees_availability(self, start_time, duration_hours=1, attendees=None, num_options=3,
+                                     days_ahead=7, attendee_timezones=None):
+        """
+        Check a time slot against the organizer and every attendee, proposing common alternatives if it is taken.
+
+        The organizer's calendar comes from the local event cache; all attendee
+        calendars are read with one batched freebusy query.
+
+        Args:
+            start_time: The proposed start time (datetime object)
+            duration_hours: Duration of the meeting in hours
+            attendees: Attendee email addresses
+            num_options: Number of alternative slots to propose
+            days_ahead: Number of days after the proposed day to search for alternatives
+            attendee_timezones: Optional mapping of attendee to time zone name
+
+        Returns:
+            Tuple of (is_available, alternative_slots, unknown_attendees), where
+            unknown_attendees could not be checked (their calendar could not be read)
+        """
+        try:
+            if not self.service:
+                raise Exception("Calendar service not initialized")
+            if not attendees:
+                return (*self.check_time_slot_availability(start_time, duration_hours), [])
+
+            start_time_utc = start_time.astimezone(pytz.UTC)
+            window_start, window_end = self._search_window(start_time_utc, days_ahead)
+            result = find_common_slots(
+                self.service, attendees, duration_hours * 60, window_start, window_end,
+                extra_busy=self.event_cache.busy_intervals(window_start, window_end) + self._accepted_busy(),
+                attendee_timezones=attendee_timezones, preferred_start=start_time_utc,
+                num_options=num_options,
+            )
+            if result["available"]:
+                return True, [], result["unknown"]
+            return False, result["slots"], result["unknown"]
+
+        except Exception as e:
+            logger.error(f"❌ Error checking attendee availability: {str(e)}")
+            return False, [], []
+
     def propose_meeting_times(self, date, duration_hours=1, num_options=3):
         """Propose available meeting times for a given date."""
         try:
@@ -380,4 +704,31 @@ class CalendarService:
             return available_slots[:num_options]
         except Exception as e:
             logger.error(f"❌ Error proposing meeting times: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+
+def _http_status(error):
+    """Return the HTTP status of a googleapiclient HttpError, or None."""
+    return getattr(getattr(error, 'resp', None), 'status', None)
+
+
+def _is_retryable(error):
+    """Rate-limit and server errors, and failures without a response (network errors)."""
+    status = _http_status(error)
+    if status == 403:
+        # 403 is only retryable for rate limits, not for permission errors
+        return 'rateLimitExceeded' in str(error) or 'userRateLimitExceeded' in str(error)
+    return status is None or status in RETRYABLE_STATUSES
+
+
+_calendar_service = None
+_calendar_service_lock = threading.Lock()
+
+
+def get_calendar_service() -> CalendarService:
+    """Return the process-wide CalendarService, building it on first use or after a failed start."""
+    global _calendar_service
+    with _calendar_service_lock:
+        if _calendar_service is None or _calendar_service.service is None:
+            _calendar_service = CalendarService()
+        return _calendar_service
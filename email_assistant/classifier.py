@@ -0,0 +1,238 @@
+"""
+Classification cascade in front of the LLM.
+
+Yes/no questions about an email (has a meeting, is important, needs a reply)
+are answered by the cheapest stage that is confident:
+
+1. Deterministic rules (regular expressions and keyword lists).
+2. A small local model per label: logistic regression on hashed word n-grams,
+   trained from the labels the LLM decided (AnalysisLabelSource), never from
+   its own or the rules' decisions, and retrained once
+   CASCADE_RETRAIN_NEW_LABELS new LLM labels have been stored.
+3. The LLM, only when neither of the above is confident.
+
+The cascade counts which stage decided each call so the share of avoided LLM
+calls can be reported.
+"""
+import logging
+import os
+import pickle
+import re
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from email_assistant.config import settings
+
+logger = logging.getLogger(__name__)
+
+CASCADE_MODEL_PATH = getattr(settings, "CASCADE_MODEL_PATH", "cascade_models.pkl")
+CASCADE_MODEL_CONFIDENCE = getattr(settings, "CASCADE_MODEL_CONFIDENCE", 0.9)
+CASCADE_MIN_TRAINING_SAMPLES = 50
+CASCADE_RETRAIN_NEW_LABELS = getattr(settings, "CASCADE_RETRAIN_NEW_LABELS", 50)
+
+LABELS = ("has_meeting", "is_important", "needs_reply")
+
+MEETING_PHRASES = [
+    r'(?i)meeting\s+(?:on|at|for)',
+    r'(?i)schedule\s+(?:a\s+)?meeting',
+    r'(?i)let\'s\s+meet',
+    r'(?i)would\s+you\s+like\s+to\s+meet',
+    r'(?i)propose\s+a\s+time',
+    r'(?i)set\s+up\s+a\s+call',
+    r'(?i)arrange\s+a\s+meeting'
+]
+IMPORTANT_KEYWORDS = ['urgent', 'important', 'asap', 'critical', 'emergency']
+NO_RESPONSE_KEYWORDS = ['no reply needed', 'no response required', 'for your information', 'fyi', 'notification']
+
+_MEETING_PHRASES = [re.compile(phrase) for phrase in MEETING_PHRASES]
+_MEETING_WORDS = re.compile(r'(?i)\b(meet|meeting|call|schedule|calendar|appointment|invite|zoom|teams|agenda)\b')
+_BULK_MAIL = re.compile(r'(?i)(unsubscribe|view (?:this email )?in (?:your )?browser|no-?reply@|do not reply)')
+_REPLY_REQUEST = re.compile(r'(?i)(please (?:reply|respond|confirm|let me know)|let me know|can you|could you|would you)')
+
+
+def rule_decision(label: str, subject: str, body: str) -> Optional[bool]:
+    """
+    Decide a label with deterministic rules.
+
+    Args:
+        label: One of LABELS.
+        subject: The email subject.
+        body: The email body.
+
+    Returns:
+        True or False when the rules are confident, None otherwise.
+    """
+    text = f"{subject}\n{body or ''}"
+    lower = text.lower()
+    bulk = bool(_BULK_MAIL.search(text))
+    no_response = any(keyword in lower for keyword in NO_RESPONSE_KEYWORDS)
+
+    if label == "has_meeting":
+        if any(phrase.search(text) for phrase in _MEETING_PHRASES):
+            return True
+        if not _MEETING_WORDS.search(text):
+            return False
+    elif label == "is_important":
+        if any(keyword in lower for keyword in IMPORTANT_KEYWORDS):
+            return True
+        if bulk:
+            return False
+    elif label == "needs_reply":
+        if no_response or bulk:
+            return False
+        if _REPLY_REQUEST.search(text):
+            return True
+    else:
+        raise ValueError(f"Unknown label '{label}'")
+    return None
+
+
+class ClassificationCascade:
+    """Rules, then a local hashed n-gram model, then the LLM."""
+
+    def __init__(self, model_path: Optional[str] = CASCADE_MODEL_PATH,
+                 confidence: float = CASCADE_MODEL_CONFIDENCE):
+        """
+        Args:
+            model_path: Pickle file holding the trained local models, or None.
+            confidence: Minimum predicted probability for the local model to decide.
+        """
+        self.model_path = model_path
+        self.confidence = confidence
+        self.models = {}
+        self._vectorizer = None
+        self._lock = threading.Lock()
+        self.counters = {"rules": 0, "model": 0, "llm": 0}
+        # LLM labels per label at the last training (not saved, so a new process trains once)
+        self._trained_counts = None
+        if model_path and os.path.exists(model_path):
+            try:
+                with open(model_path, "rb") as f:
+                    self.models = pickle.load(f)
+            except Exception as e:
+                logger.error(f"❌ Could not load cascade models from {model_path}: {str(e)}")
+
+    def classify(self, label: str, subject: str, body: str, llm_fallback: Callable[[], str]) -> Tuple[bool, str]:
+        """
+        Answer a yes/no label for an email using the cheapest confident stage.
+
+        Args:
+            label: One of LABELS.
+            subject: The email subject.
+            body: The email body.
+            llm_fallback: Called without arguments when no cheaper stage is
+                confident; must return the LLM's yes/no answer.
+
+        Returns:
+            Tuple of (decision, stage) where stage is "rules", "model" or "llm".
+        """
+        decision = rule_decision(label, subject, body)
+        stage = "rules"
+        if decision is None:
+            decision = self._model_decision(label, subject, body)
+            stage = "model"
+        if decision is None:
+            decision = llm_fallback().strip().lower().startswith("yes")
+            stage = "llm"
+        with self._lock:
+            self.counters[stage] += 1
+        return decision, stage
+
+    def train(self, session, force: bool = False) -> Dict[str, int]:
+        """
+        Train one local model per label from the labels the LLM decided.
+
+        Labels decided by the rules or by the local model itself are left out,
+        so the model does not learn from its own output.
+
+        Args:
+            session: The database session to read labelled emails from.
+            force: Train even if fewer than CASCADE_RETRAIN_NEW_LABELS LLM labels were added since the last training.
+
+        Returns:
+            Number of training samples per trained label (empty if nothing was trained).
+        """
+        from sqlalchemy import func
+        from email_assistant.models import AnalysisLabelSource, Email, EmailAnalysis
+
+        counts = dict(
+            session.query(AnalysisLabelSource.label, func.count())
+            .filter(AnalysisLabelSource.stage == "llm")
+            .group_by(AnalysisLabelSource.label)
+            .all()
+        )
+        if not force and self._trained_counts is not None and all(
+            counts.get(label, 0) - self._trained_counts.get(label, 0) < CASCADE_RETRAIN_NEW_LABELS for label in LABELS
+        ):
+            return {}
+        self._trained_counts = counts
+
+        from sklearn.linear_model import LogisticRegression
+
+        trained = {}
+        models = {}
+        for label in LABELS:
+            if counts.get(label, 0) < CASCADE_MIN_TRAINING_SAMPLES:
+                logger.info(f"Not enough LLM labels to train the {label} model ({counts.get(label, 0)})")
+                continue
+            rows = (
+                session.query(Email.subject, Email.body, getattr(EmailAnalysis, label))
+                .join(EmailAnalysis, EmailAnalysis.email_id == Email.id)
+                .join(AnalysisLabelSource, AnalysisLabelSource.analysis_id == EmailAnalysis.id)
+                .filter(AnalysisLabelSource.label == label, AnalysisLabelSource.stage == "llm")
+                .all()
+            )
+            targets = [bool(value) for _, _, value in rows]
+            if len(set(targets)) < 2:
+                continue
+            model = LogisticRegression(max_iter=1000, class_weight="balanced")
+            model.fit(self._vectorize([f"{subject}\n{body or ''}" for subject, body, _ in rows]), targets)
+            models[label] = model
+            trained[label] = len(targets)
+
+        with self._lock:
+            self.models = models
+        if self.model_path:
+            with open(self.model_path, "wb") as f:
+                pickle.dump(models, f)
+        logger.info(f"✅ Trained cascade models: {trained}")
+        return trained
+
+    def stats(self) -> Dict[str, float]:
+        """Return the number of decisions per stage and the fraction of LLM calls avoided."""
+        with self._lock:
+            stats = dict(self.counters)
+        total = stats["rules"] + stats["model"] + stats["llm"]
+        stats["llm_avoided"] = (stats["rules"] + stats["model"]) / total if total else 0.0
+        return stats
+
+    def _model_decision(self, label: str, subject: str, body: str) -> Optional[bool]:
+        model = self.models.get(label)
+        if model is None:
+            return None
+        probabilities = model.predict_proba(self._vectorize([f"{subject}\n{body or ''}"]))[0]
+        best = probabilities.argmax()
+        if probabilities[best] < self.confidence:
+            return None
+        return bool(model.classes_[best])
+
+    def _vectorize(self, texts):
+        if self._vectorizer is None:
+            from sklearn.feature_extraction.text import HashingVectorizer
+            self._vectorizer = HashingVectorizer(
+                ngram_range=(1, 2), n_features=2 ** 18, alternate_sign=False, norm="l2"
+            )
+        return self._vectorizer.transform(texts)
+
+
+_cascade = None
+_cascade_lock = threading.Lock()
+
+
+def get_cascade() -> ClassificationCascade:
+    """Return the process-wide classification cascade."""
+    global _cascade
+    with _cascade_lock:
+        if _cascade is None:
+            _cascade = ClassificationCascade()
+        return _cascade
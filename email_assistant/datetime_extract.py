@@ -0,0 +1,449 @@
+"""
+Rule-based date and time extraction for meeting emails.
+
+All patterns are compiled once at import. Quoted lines ("> ...") and
+everything from a reply or forward header on ("On ... wrote:", "-----Original
+Message-----", "From: ...") are ignored. The text is scanned for date
+expressions (ISO and numeric dates, "5 April", "April 5th, 2025", weekdays
+with "this"/"next", "today", "tomorrow", "in 3 days") and time expressions
+("3pm", "15:00", "noon", "3-4pm", "2:00 to 3:30 PM", optionally followed by a
+zone such as "IST" or "GMT+5:30"); the first time is combined with the
+closest date in the same sentence, at most DATETIME_PAIR_DISTANCE characters
+away. Relative expressions are resolved against an explicit reference time
+(when the email was sent) in an explicit time zone (CALENDAR_TIMEZONE by
+default).
+
+Every result carries a confidence: an explicit date next to an unambiguous
+time is confident enough to schedule without asking the model. Ambiguous
+readings ("next Tuesday", 05/04/2025), a date and time from different
+sentences and start times before the reference stay below that. Results are
+memoized per (text, reference minute, zone).
+"""
+import re
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import pytz
+
+from email_assistant.availability import CALENDAR_TIMEZONE
+from email_assistant.config import settings
+
+# Numeric dates like 05/04/2025 are read day first unless the day part is above 12.
+DATE_DAY_FIRST = getattr(settings, "DATE_DAY_FIRST", True)
+DATETIME_CACHE_SIZE = getattr(settings, "DATETIME_CACHE_SIZE", 4096)
+# Most characters between a date and the time it is combined with.
+DATETIME_PAIR_DISTANCE = getattr(settings, "DATETIME_PAIR_DISTANCE", 40)
+# Results at or above this confidence can be used without the model.
+DATETIME_CONFIDENT = 0.9
+# Confidence of readings the rules cannot settle (kept below DATETIME_CONFIDENT).
+AMBIGUOUS_CONFIDENCE = 0.8
+UNPAIRED_CONFIDENCE = 0.6
+PAST_CONFIDENCE = 0.5
+
+MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3, "april": 4, "apr": 4, "may": 5,
+    "june": 6, "jun": 6, "july": 7, "jul": 7, "august": 8, "aug": 8, "september": 9, "sept": 9, "sep": 9,
+    "october": 10, "oct": 10, "november": 11, "nov": 11, "december": 12, "dec": 12,
+}
+# "sat", "sun" and "wed" are left out: they are common words.
+WEEKDAYS = {
+    "monday": 0, "mon": 0, "tuesday": 1, "tues": 1, "tue": 1, "wednesday": 2, "thursday": 3, "thurs": 3,
+    "thur": 3, "thu": 3, "friday": 4, "fri": 4, "saturday": 5, "sunday": 6,
+}
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+                "eight": 8, "nine": 9, "ten": 10}
+ZONES = {
+    "utc": "UTC", "gmt": "UTC", "z": "UTC", "ist": "Asia/Kolkata", "bst": "Europe/London",
+    "cet": "Europe/Paris", "cest": "Europe/Paris", "eet": "Europe/Athens", "eest": "Europe/Athens",
+    "est": "America/New_York", "edt": "America/New_York", "et": "America/New_York",
+    "cst": "America/Chicago", "cdt": "America/Chicago", "ct": "America/Chicago",
+    "mst": "America/Denver", "mdt": "America/Denver", "mt": "America/Denver",
+    "pst": "America/Los_Angeles", "pdt": "America/Los_Angeles", "pt": "America/Los_Angeles",
+    "jst": "Asia/Tokyo", "sgt": "Asia/Singapore", "aest": "Australia/Sydney", "aedt": "Australia/Sydney",
+}
+
+
+def _alternation(words: Iterable[str]) -> str:
+    # Longest first so "september" wins over "sep".
+    return "|".join(sorted((re.escape(word) for word in words), key=len, reverse=True))
+
+
+_MONTH = _alternation(MONTHS)
+_WEEKDAY = _alternation(WEEKDAYS)
+_NUMBER = r"\d+|" + _alternation(NUMBER_WORDS)
+_ORDINAL = r"(?:st|nd|rd|th)?"
+_AMPM = r"[ap]\.?\s?m\b\.?"
+
+DATE_PATTERN = re.compile(
+    rf"""
+    \b(?P<iso_y>\d{{4}})-(?P<iso_m>\d{{1,2}})-(?P<iso_d>\d{{1,2}})\b
+    | \b(?P<n1>\d{{1,2}})(?P<sep>[/.-])(?P<n2>\d{{1,2}})(?P=sep)(?P<n3>\d{{4}}|\d{{2}})\b
+    | \b(?P<dm_d>\d{{1,2}}){_ORDINAL}(?:\s+of)?\s+(?P<dm_m>{_MONTH})\b\.?(?:,?\s+(?P<dm_y>\d{{4}})\b)?
+    | \b(?P<md_m>{_MONTH})\b\.?\s+(?P<md_d>\d{{1,2}}){_ORDINAL}\b(?!\s*(?::|\.\d|{_AMPM}))(?:,?\s+(?P<md_y>\d{{4}})\b)?
+    | \b(?P<rel>day\s+after\s+tomorrow|tomorrow|tonight|today)\b
+    | \bin\s+(?P<in_n>{_NUMBER})\s+(?P<in_unit>days?|weeks?)\b
+    | \b(?:(?P<wd_mod>next|this|coming|following)\s+)?(?P<wd>{_WEEKDAY})\b\.?
+    | \b(?P<next_week>next\s+week)\b
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+
+_CLOCK = rf"(?P<{{p}}h>\d{{{{1,2}}}})(?:[:.](?P<{{p}}m>\d{{{{2}}}}))?\s*(?P<{{p}}ap>{_AMPM})?"
+_ZONE = rf"(?:\s*\(?\b(?P<zone>{_alternation(ZONES)})\b(?P<offset>\s*[+-]\s*\d{{1,2}}(?::?\d{{2}})?)?\)?)?"
+
+TIME_PATTERN = re.compile(
+    rf"""
+    (?:\b(?:from|between)\s+)?
+    (?:
+        \b{_CLOCK.format(p="a")}\s*(?:-|–|to|until|till|and)\s*{_CLOCK.format(p="b")}(?=\W|$)
+      | \b(?P<h>\d{{1,2}})(?:[:.](?P<m>\d{{2}}))?\s*(?P<ap>{_AMPM})
+      | \b(?P<h24>[01]?\d|2[0-3]):(?P<m24>[0-5]\d)\b(?!\s*{_AMPM})
+      | \b(?P<named>noon|midday|midnight)\b
+      | \b(?P<oc>\d{{1,2}})\s*o'?clock\b
+      | \bat\s+(?P<at>\d{{1,2}})\b(?!\s*(?:[:./\d-]|{_AMPM}))
+    )
+    {_ZONE}
+    (?:\s+(?:in\s+the\s+)?(?P<period>morning|afternoon|evening|night))?
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+PERIOD_PATTERN = re.compile(r"\b(morning|afternoon|evening|tonight)\b", re.IGNORECASE)
+# Dates in earlier messages of a thread are not about this one.
+QUOTED_LINE = re.compile(r"^[ \t]*>.*$", re.MULTILINE)
+REPLY_HEADER = re.compile(
+    r"(?<!\w)On\s[^\n]{0,200}?\bwrote:|^[ \t]*-{2,}\s*(?:Original|Forwarded)\s+Message|^[ \t]*From:\s",
+    re.MULTILINE,
+)
+SENTENCE_BREAK = re.compile(r"[.!?](?=\s|$)|\n[ \t]*\n")
+
+
+class ExtractedDateTime(NamedTuple):
+    """A date and time found in a text."""
+
+    start: datetime  # timezone-aware
+    end: Optional[datetime]  # timezone-aware, when a time range was given
+    confidence: float
+    has_date: bool
+    has_time: bool
+    timezone: str
+
+    @property
+    def confident(self) -> bool:
+        """Whether the result can be used without asking the model."""
+        return self.confidence >= DATETIME_CONFIDENT
+
+
+def _year(value: Optional[str], month: int, day: int, today: date) -> Tuple[int, bool]:
+    """Resolve an optional year: a missing year means the next occurrence from today."""
+    if value:
+        year = int(value)
+        return (year + 2000 if year < 100 else year), True
+    year = today.year
+    try:
+        if date(year, month, day) < today:
+            year += 1
+    except ValueError:
+        pass
+    return year, False
+
+
+def _parse_date(match: re.Match, today: date, day_first: bool) -> Tuple[Optional[date], float, bool]:
+    """
+    Turn a DATE_PATTERN match into a date.
+
+    Returns:
+        Tuple of (date or None, confidence, whether a weekday needs "later today" handling).
+    """
+    groups = match.groupdict()
+    try:
+        if groups["iso_y"]:
+            return date(int(groups["iso_y"]), int(groups["iso_m"]), int(groups["iso_d"])), 1.0, False
+        if groups["n1"]:
+            first, second = int(groups["n1"]), int(groups["n2"])
+            year = int(groups["n3"]) + (2000 if len(groups["n3"]) == 2 else 0)
+            ambiguous = first <= 12 and second <= 12 and first != second
+            if first > 12 or (day_first and second <= 12):
+                day, month = first, second
+            else:
+                month, day = first, second
+            return date(year, month, day), (AMBIGUOUS_CONFIDENCE if ambiguous else 1.0), False
+        if groups["dm_d"] or groups["md_d"]:
+            day = int(groups["dm_d"] or groups["md_d"])
+            month = MONTHS[(groups["dm_m"] or groups["md_m"]).lower()]
+            year, explicit = _year(groups["dm_y"] or groups["md_y"], month, day, today)
+            return date(year, month, day), (1.0 if explicit else 0.95), False
+    except ValueError:
+        return None, 0.0, False
+    if groups["rel"]:
+        word = " ".join(groups["rel"].lower().split())
+        offset = {"today": 0, "tonight": 0, "tomorrow": 1, "day after tomorrow": 2}[word]
+        return today + timedelta(days=offset), 1.0, False
+    if groups["in_unit"]:
+        amount = groups["in_n"].lower()
+        amount = NUMBER_WORDS.get(amount) or int(amount)
+        days = amount * (7 if groups["in_unit"].lower().startswith("week") else 1)
+        return today + timedelta(days=days), 0.95, False
+    if groups["wd"]:
+        weekday = WEEKDAYS[groups["wd"].lower().rstrip(".")]
+        ahead = (weekday - today.weekday()) % 7
+        modifier = (groups["wd_mod"] or "").lower()
+        if modifier in ("next", "following") and ahead == 0:
+            ahead = 7
+        # A bare weekday naming today may mean next week if the time has passed.
+        # "next Tuesday" may mean this coming one or the one after
+        return today + timedelta(days=ahead), (AMBIGUOUS_CONFIDENCE if modifier == "next" else 0.95), ahead == 0
+    if groups["next_week"]:
+        return today + timedelta(days=7 - today.weekday()), 0.5, False
+    return None, 0.0, False
+
+
+def _hour(hour: int, ampm: Optional[str]) -> int:
+    if not ampm:
+        return hour
+    if ampm.lower().startswith("p"):
+        return hour % 12 + 12
+    return hour % 12
+
+
+def _guess_hour(hour: int, period: Optional[str]) -> int:
+    """Hour without am/pm: use the period word if any, else assume business hours (8-11 am, 12-7 pm)."""
+    if period:
+        return hour % 12 + (0 if period.lower() == "morning" else 12)
+    return hour + 12 if 1 <= hour <= 7 else hour
+
+
+def _parse_time(match: re.Match, text_period: Optional[str] = None
+                ) -> Optional[Tuple[time, Optional[time], float, Optional[str]]]:
+    """
+    Turn a TIME_PATTERN match into (start, end or None, confidence, zone name or None).
+
+    text_period is a "morning"/"afternoon"/... found elsewhere in the text, used
+    when the time itself has no am/pm ("Monday morning at 9").
+    """
+    groups = match.groupdict()
+    period = groups["period"] or text_period
+    if period and period.lower() == "tonight":
+        period = "evening"
+    try:
+        if groups["ah"]:
+            end_ampm = groups["bap"]
+            start_ampm = groups["aap"] or end_ampm
+            if not start_ampm and not (groups["am"] and groups["bm"]):
+                return None  # "3-4" without am/pm or minutes is not a time range
+            end_hour = _hour(int(groups["bh"]), end_ampm) if end_ampm else _guess_hour(int(groups["bh"]), period)
+            start_hour = _hour(int(groups["ah"]), start_ampm) if start_ampm else _guess_hour(int(groups["ah"]), period)
+            # "11-1pm": the start is in the morning
+            if not groups["aap"] and end_ampm and start_hour > end_hour:
+                start_hour -= 12
+            start = time(start_hour, int(groups["am"] or 0))
+            end = time(end_hour, int(groups["bm"] or 0))
+            confidence = 1.0 if end_ampm or int(groups["ah"]) >= 13 else 0.8
+        elif groups["h"]:
+            start, end = time(_hour(int(groups["h"]), groups["ap"]), int(groups["m"] or 0)), None
+            confidence = 1.0
+        elif groups["h24"]:
+            hour = int(groups["h24"])
+            unambiguous = hour == 0 or hour >= 13 or groups["h24"].startswith("0") or hour == 12
+            if not unambiguous:
+                hour = _guess_hour(hour, period)
+            start, end = time(hour, int(groups["m24"])), None
+            confidence = 1.0 if unambiguous else (0.9 if period else 0.75)
+        elif groups["named"]:
+            start, end = time(0 if groups["named"].lower() == "midnight" else 12), None
+            confidence = 1.0
+        else:
+            hour = int(groups["oc"] or groups["at"])
+            if hour > 23:
+                return None
+            start, end = time(_guess_hour(hour, period) if hour <= 12 else hour), None
+            confidence = 0.9 if period else 0.7
+    except ValueError:
+        return None
+
+    zone = None
+    if groups["zone"]:
+        zone = ZONES[groups["zone"].lower()]
+        if groups["offset"]:
+            sign = -1 if "-" in groups["offset"] else 1
+            digits = re.sub(r"[^\d]", "", groups["offset"])
+            hours, minutes = (int(digits[:-2]), int(digits[-2:])) if len(digits) > 2 else (int(digits), 0)
+            zone = f"{sign * (hours * 60 + minutes)}"  # minutes east of UTC
+    return start, end, confidence, zone
+
+
+def _zone(name: str):
+    if name.lstrip("-").isdigit():
+        return pytz.FixedOffset(int(name))
+    return pytz.timezone(name)
+
+
+def own_text(text: str) -> str:
+    """Return the text without quoted lines and without everything from a reply or forward header on."""
+    header = REPLY_HEADER.search(text)
+    if header:
+        text = text[:header.start()]
+    return QUOTED_LINE.sub("", text)
+
+
+def _is_calendar_date(match: re.Match) -> bool:
+    return bool(match.group("iso_y") or match.group("n1") or match.group("dm_d") or match.group("md_d"))
+
+
+def _overlaps(first: re.Match, second: re.Match) -> bool:
+    return first.start() < second.end() and first.end() > second.start()
+
+
+def _date_match(dates: List[re.Match]) -> Optional[re.Match]:
+    """Return the first calendar date, else the first relative date or weekday."""
+    return next((match for match in dates if _is_calendar_date(match)), dates[0] if dates else None)
+
+
+def _pair(text: str, dates: List[re.Match], times: List[Tuple[re.Match, Tuple]]) -> Optional[Tuple]:
+    """
+    Combine the first time that has a date close by in the same sentence with the closest such date.
+
+    Returns:
+        Tuple of (date match, time match, parsed time), or None if no time has a date close by.
+    """
+    for time_match, parsed_time in times:
+        best = None
+        for date_match in dates:
+            if _overlaps(time_match, date_match):
+                continue
+            if date_match.end() <= time_match.start():
+                between = text[date_match.end():time_match.start()]
+            else:
+                between = text[time_match.end():date_match.start()]
+            if len(between) > DATETIME_PAIR_DISTANCE or SENTENCE_BREAK.search(between):
+                continue
+            # Closest first; "Thursday, 22 October 2026 at 14:30" takes the calendar date
+            key = (len(between), not _is_calendar_date(date_match))
+            if best is None or key < best[0]:
+                best = (key, date_match)
+        if best:
+            return best[1], time_match, parsed_time
+    return None
+
+
+@lru_cache(maxsize=DATETIME_CACHE_SIZE)
+def _extract(text: str, reference: datetime, zone_name: str, day_first: bool) -> Optional[ExtractedDateTime]:
+    zone = pytz.timezone(zone_name)
+    local_reference = reference.astimezone(zone)
+    today = local_reference.date()
+
+    text = own_text(text)
+    dates = list(DATE_PATTERN.finditer(text))
+    period_match = PERIOD_PATTERN.search(text)
+    times = []
+    for time_match in TIME_PATTERN.finditer(text):
+        parsed = _parse_time(time_match, period_match.group(1) if period_match else None)
+        if parsed:
+            times.append((time_match, parsed))
+
+    pair = _pair(text, dates, times)
+    if pair:
+        date_match, _, parsed_time = pair
+    else:
+        date_match = _date_match(dates)
+        # Skip digits that belong to the date itself (e.g. "5" in "April 5")
+        parsed_time = next((parsed for time_match, parsed in times
+                            if not (date_match and _overlaps(time_match, date_match))), None)
+    day, date_confidence, weekday_today = (None, 0.0, False)
+    if date_match:
+        day, date_confidence, weekday_today = _parse_date(date_match, today, day_first)
+
+    if day is None and parsed_time is None:
+        return None
+
+    if parsed_time:
+        start_time, end_time, time_confidence, mentioned_zone = parsed_time
+    else:
+        start_time, end_time, time_confidence, mentioned_zone = time(0), None, 0.0, None
+    event_zone = _zone(mentioned_zone) if mentioned_zone else zone
+
+    if day is None:
+        # Only a time: the next occurrence of it
+        day = today
+        candidate = event_zone.localize(datetime.combine(day, start_time))
+        if candidate < reference:
+            day += timedelta(days=1)
+        date_confidence = 0.5
+    elif weekday_today and parsed_time:
+        if event_zone.localize(datetime.combine(day, start_time)) < reference:
+            day += timedelta(days=7)
+
+    start = event_zone.localize(datetime.combine(day, start_time))
+    end = None
+    if end_time is not None:
+        end = event_zone.localize(datetime.combine(day, end_time))
+        if end <= start:
+            end += timedelta(days=1)
+    confidence = min(date_confidence, time_confidence) if parsed_time else min(date_confidence, 0.4)
+    if date_match and parsed_time and not pair:
+        # The date and the time come from different sentences (or far apart)
+        confidence = min(confidence, UNPAIRED_CONFIDENCE)
+    if start < reference:
+        confidence = min(confidence, PAST_CONFIDENCE)
+    return ExtractedDateTime(
+        start=start.astimezone(zone), end=end.astimezone(zone) if end else None, confidence=confidence,
+        has_date=bool(date_match and date_confidence > 0.5), has_time=parsed_time is not None,
+        timezone=zone_name,
+    )
+
+
+def _reference(reference: Optional[datetime], zone_name: str) -> datetime:
+    """Aware reference time truncated to the minute (so memo entries stay valid for a minute)."""
+    if reference is None:
+        reference = datetime.now(pytz.UTC)
+    elif reference.tzinfo is None:
+        reference = pytz.timezone(zone_name).localize(reference)
+    return reference.replace(second=0, microsecond=0)
+
+
+def extract_datetime(text: str, reference: Optional[datetime] = None, tz: Optional[str] = None,
+                     day_first: bool = DATE_DAY_FIRST) -> Optional[ExtractedDateTime]:
+    """
+    Find the date and time of a meeting in a text.
+
+    Args:
+        text: Text to search, e.g. an email body or "05-04-2025 3:00 pm".
+        reference: Time relative expressions are resolved against (e.g. when the email was sent),
+            defaults to now. Naive values are taken in tz.
+        tz: Time zone name for dates and times without a zone, defaults to CALENDAR_TIMEZONE.
+        day_first: Read ambiguous numeric dates as day/month.
+
+    Returns:
+        The extracted date and time, or None if the text has neither.
+    """
+    zone_name = tz or CALENDAR_TIMEZONE
+    return _extract(text or "", _reference(reference, zone_name), zone_name, day_first)
+
+
+def extract_datetimes(texts: Iterable[str], reference: Optional[datetime] = None, tz: Optional[str] = None,
+                      day_first: bool = DATE_DAY_FIRST) -> List[Optional[ExtractedDateTime]]:
+    """
+    Extract dates and times from many texts against the same reference time.
+
+    Args:
+        texts: Texts to search.
+        reference: See extract_datetime.
+        tz: See extract_datetime.
+        day_first: See extract_datetime.
+
+    Returns:
+        One result per text, in order.
+    """
+    zone_name = tz or CALENDAR_TIMEZONE
+    reference = _reference(reference, zone_name)
+    return [_extract(text or "", reference, zone_name, day_first) for text in texts]
+
+
+def cache_info():
+    """Return the memo's hit and miss counts."""
+    return _extract.cache_info()
+
+
+def clear_cache() -> None:
+    """Empty the memo."""
+    _extract.cache_clear()
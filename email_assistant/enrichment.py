@@ -0,0 +1,228 @@
+"""
+Background enrichment of stored emails.
+
+Every email is analysed once (summary, importance, intent, needs-reply and
+has-meeting). The results are stored in EmailAnalysis, versioned by model and
+prompt, and written back to the Email row so that the UI and Slack forwarding
+can read them instead of calling the LLM. Near-duplicates of an analysed email
+copy its analysis; the summary only if both contain the same numbers.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_
+
+from email_assistant.classifier import get_cascade
+from email_assistant.llm_scheduler import BACKGROUND, llm_context
+from email_assistant.models import AnalysisLabelSource, Email, EmailAnalysis, db
+from email_assistant.near_duplicates import canonical_email_id, same_numbers
+from email_assistant.rag_setup import MODEL_NAME, PROMPT_VERSION, ask_rag_chain, format_email_context, rag_chain_factory
+from email_assistant.stream_filter import YES_NO
+
+logger = logging.getLogger(__name__)
+
+# Bump the suffix whenever ANALYSIS_QUESTIONS change so emails are re-analysed.
+ANALYSIS_VERSION = f"{PROMPT_VERSION}.1"
+
+INTENTS = ("meeting_request", "task_request", "question", "feedback", "report", "other")
+
+# The summary and importance questions match the Streamlit pages so both share the response cache.
+ANALYSIS_FIELDS = ("summary", "is_important", "intent", "needs_reply", "has_meeting")
+
+ANALYSIS_QUESTIONS = {
+    "summary": "Summarize the email content",
+    "is_important": "Is this email important? Respond with 'Yes' or 'No'.",
+    "intent": f"What is the intent of the email? Respond with one word only, one of: {', '.join(INTENTS)}.",
+    "needs_reply": "Is there reply of email is needed or action needed in the email? Respond with 'Yes' or 'No'.",
+    "has_meeting": "Does the email contain a meeting request or meeting details? Respond with 'Yes' or 'No'.",
+}
+
+
+def analyze_email(subject: str, body: str, stages: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Run every analysis question over an email.
+
+    The yes/no labels go through the classification cascade, so the LLM is
+    only asked when the rules and the local model are not confident.
+
+    Args:
+        subject: The email subject.
+        body: The email body.
+        stages: Optional dictionary receiving the cascade stage that decided each yes/no label.
+
+    Returns:
+        Dictionary with summary, is_important, intent, needs_reply and has_meeting.
+    """
+    data = format_email_context(subject, body)
+    get_chain = rag_chain_factory([data])
+    cascade = get_cascade()
+
+    def decide(label):
+        decision, stage = cascade.classify(
+            label, subject, body,
+            lambda: ask_rag_chain(get_chain, ANALYSIS_QUESTIONS[label], data, stop=YES_NO),
+        )
+        if stages is not None:
+            stages[label] = stage
+        return decision
+
+    intent = ask_rag_chain(get_chain, ANALYSIS_QUESTIONS["intent"], data, stop=YES_NO).lower()
+    return {
+        "summary": ask_rag_chain(get_chain, ANALYSIS_QUESTIONS["summary"], data),
+        "is_important": decide("is_important"),
+        "intent": intent if intent in INTENTS else "other",
+        "needs_reply": decide("needs_reply"),
+        "has_meeting": decide("has_meeting"),
+    }
+
+
+def summarize_email(subject: str, body: str) -> str:
+    """Ask the summary question alone (for a near-duplicate whose labels are reused)."""
+    data = format_email_context(subject, body)
+    return ask_rag_chain(rag_chain_factory([data]), ANALYSIS_QUESTIONS["summary"], data)
+
+
+def _current_analysis(session, email_id: int) -> Optional[EmailAnalysis]:
+    return session.query(EmailAnalysis).filter_by(
+        email_id=email_id, model=MODEL_NAME, prompt_version=ANALYSIS_VERSION
+    ).first()
+
+
+def enrich_email(session, email_id: int) -> Optional[EmailAnalysis]:
+    """
+    Analyse an email unless the current model and prompt version already did.
+
+    The analysis is stored as an EmailAnalysis row and written back to the
+    Email's summary, intent, priority, is_important and no_response fields.
+    A near-duplicate copies the analysis of its canonical email, which is
+    analysed first if needed. If their numbers differ (near-duplicates may
+    differ in amounts, dates or times), only the labels are copied and the
+    near-duplicate is summarized itself.
+
+    Args:
+        session: The database session to use.
+        email_id: The ID of the email to analyse.
+
+    Returns:
+        The EmailAnalysis row, or None if the email does not exist or analysis failed.
+    """
+    existing = _current_analysis(session, email_id)
+    if existing:
+        return existing
+
+    email = session.query(Email).filter_by(id=email_id).first()
+    if not email:
+        logger.error(f"❌ Email with ID {email_id} not found.")
+        return None
+
+    source = None
+    stages = {}
+    canonical_id = canonical_email_id(session, email_id)
+    if canonical_id:
+        source = enrich_email(session, canonical_id)
+
+    try:
+        if source:
+            result = {field: getattr(source, field) for field in ANALYSIS_FIELDS}
+            original = session.get(Email, canonical_id)
+            if same_numbers(original.subject, original.body, email.subject, email.body):
+                logger.info(f"Reusing the analysis of email {canonical_id} for near-duplicate {email_id}")
+            else:
+                result["summary"] = summarize_email(email.subject, email.body)
+                logger.info(f"Reusing the labels of email {canonical_id} for near-duplicate {email_id}")
+        else:
+            result = analyze_email(email.subject, email.body, stages)
+        analysis = EmailAnalysis(email_id=email.id, model=MODEL_NAME, prompt_version=ANALYSIS_VERSION, **result)
+        # The cascade trains on the LLM's labels only, so it records where each label came from
+        analysis.label_sources = [AnalysisLabelSource(label=label, stage=stage) for label, stage in stages.items()]
+        session.add(analysis)
+
+        email.summary = result["summary"]
+        email.intent = result["intent"]
+        email.is_important = result["is_important"]
+        email.priority = "high" if result["is_important"] else "normal"
+        email.no_response = not result["needs_reply"]
+        session.commit()
+        logger.info(f"✅ Enriched email {email_id}: {email.subject}")
+        return analysis
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Error enriching email {email_id}: {str(e)}")
+        return None
+
+
+def pending_email_ids(session, limit: Optional[int] = None):
+    """Return the IDs of emails without an analysis for the current version, newest first."""
+    query = (
+        session.query(Email.id)
+        .filter(~Email.analyses.any(and_(
+            EmailAnalysis.model == MODEL_NAME,
+            EmailAnalysis.prompt_version == ANALYSIS_VERSION,
+        )))
+        .order_by(Email.id.desc())
+    )
+    if limit:
+        query = query.limit(limit)
+    return [row[0] for row in query.all()]
+
+
+def enrich_pending(session, limit: Optional[int] = None) -> int:
+    """
+    Analyse every email that has no analysis for the current version yet.
+
+    Args:
+        session: The database session to use.
+        limit: Maximum number of emails to analyse.
+
+    Returns:
+        Number of emails analysed.
+    """
+    enriched = 0
+    for email_id in pending_email_ids(session, limit):
+        if enrich_email(session, email_id):
+            enriched += 1
+    return enriched
+
+
+def get_stored_analysis(session, email_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Read the stored analysis of an email for the current model and prompt version.
+
+    Args:
+        session: The database session to use.
+        email_id: The ID of the email.
+
+    Returns:
+        Dictionary with the analysis fields, or None if the email has not been analysed yet.
+    """
+    analysis = _current_analysis(session, email_id)
+    if not analysis:
+        return None
+    return {field: getattr(analysis, field) for field in ANALYSIS_FIELDS}
+
+
+def start_enrichment_worker(check_interval=60):
+    """
+    Start a background thread that analyses new emails.
+
+    Args:
+        check_interval: Time in seconds between checks for unanalysed emails.
+    """
+    def worker_thread():
+        logger.info(f"Starting enrichment worker (checking every {check_interval} seconds)")
+        while True:
+            try:
+                with llm_context(priority=BACKGROUND):
+                    enrich_pending(db)
+            except Exception as e:
+                logger.error(f"❌ Error in enrichment worker: {str(e)}")
+            finally:
+                db.remove()
+            time.sleep(check_interval)
+
+    thread = threading.Thread(target=worker_thread, daemon=True)
+    thread.start()
+    logger.info("✅ Enrichment worker started")
+    return thread
@@ -0,0 +1,170 @@
+"""
+Response cache for LLM answers.
+
+Answers are keyed by (model, prompt template version, question, context hash)
+and kept in two tiers: an in-memory LRU for the current process and an
+on-disk SQLite table with a TTL shared across processes and restarts.
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from email_assistant.config import settings
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_PATH = getattr(settings, "LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_TTL = getattr(settings, "LLM_CACHE_TTL", 7 * 24 * 3600)
+LLM_CACHE_SIZE = getattr(settings, "LLM_CACHE_SIZE", 512)
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + SQLite) cache for cleaned LLM responses."""
+
+    def __init__(self, path: Optional[str] = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_SIZE,
+                 ttl_seconds: float = LLM_CACHE_TTL):
+        """
+        Args:
+            path: SQLite file for the persistent tier, or None for memory only.
+            max_entries: Maximum number of entries kept in the memory tier.
+            ttl_seconds: Time to live of an entry in both tiers.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"❌ LLM cache disabled on disk ({path}): {str(e)}")
+                self._conn = None
+
+    @staticmethod
+    def make_key(model: str, prompt_version: str, question: str, context: str) -> str:
+        """
+        Build the cache key for a question asked over a given context.
+
+        Args:
+            model: Name of the chat model.
+            prompt_version: Version of the prompt template.
+            question: The question sent to the chain.
+            context: The context the question is answered from.
+
+        Returns:
+            A hex digest identifying the request.
+        """
+        context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        raw = "\x1f".join([model, prompt_version, question, context_hash])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.error(f"❌ Error reading LLM cache: {str(e)}")
+                    row = None
+                if row and row[1] > now:
+                    self._remember(key, row[0], row[1])
+                    self.counters["disk_hits"] += 1
+                    return row[0]
+
+            self.counters["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        """Store value under key in both tiers."""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self.counters["writes"] += 1
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, value, expires_at),
+                    )
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"❌ Error writing LLM cache: {str(e)}")
+
+    def purge_expired(self) -> int:
+        """Delete expired entries from the disk tier and return how many were removed."""
+        if self._conn is None:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the hit rate."""
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
+
+
+def set_response_cache(cache: ResponseCache) -> None:
+    """Replace the process-wide response cache (e.g. a memory-only or disabled one)."""
+    global _response_cache
+    with _response_cache_lock:
+        _response_cache = cache
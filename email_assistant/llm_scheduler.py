@@ -0,0 +1,224 @@
+"""
+Priority-aware scheduler for LLM and embedding calls.
+
+Streamlit requests and the background enrichment loop share one Ollama
+server. Every call to the model takes a slot from the scheduler first:
+
+- interactive requests are served before background ones,
+- at most LLM_MAX_CONCURRENCY calls run at once (match OLLAMA_NUM_PARALLEL),
+- LLM_RESERVED_INTERACTIVE_SLOTS slots are never given to background work
+  (background work always keeps one slot, so with LLM_MAX_CONCURRENCY=1 there
+  is no reservation and interactive requests only go ahead of queued ones),
+- a request that cannot get a slot before its deadline raises DeadlineExceeded.
+
+With LLM_SCHEDULER_DIR set, slots are also file locks in that directory so the
+concurrency cap and the interactive reservation hold across processes (e.g.
+the Streamlit app and `python -m email_assistant`). Priority ordering among
+waiting requests applies within a process.
+"""
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-process slots are not available
+    fcntl = None
+
+from email_assistant.config import settings
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = getattr(settings, "LLM_MAX_CONCURRENCY", 2)
+LLM_RESERVED_INTERACTIVE_SLOTS = getattr(settings, "LLM_RESERVED_INTERACTIVE_SLOTS", 1)
+LLM_SCHEDULER_DIR = getattr(settings, "LLM_SCHEDULER_DIR", None)
+# Seconds a Streamlit page waits for a model slot before telling the user to retry
+LLM_INTERACTIVE_TIMEOUT = getattr(settings, "LLM_INTERACTIVE_TIMEOUT", 60)
+
+INTERACTIVE = 0
+BACKGROUND = 10
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+_deadline = contextvars.ContextVar("llm_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request could not get a model slot before its deadline."""
+
+
+@contextmanager
+def llm_context(priority: Optional[int] = None, timeout: Optional[float] = None):
+    """
+    Set the priority and deadline of model calls made inside the block.
+
+    Args:
+        priority: INTERACTIVE or BACKGROUND.
+        timeout: Seconds from now after which waiting for a slot gives up.
+    """
+    tokens = []
+    if priority is not None:
+        tokens.append((_priority, _priority.set(priority)))
+    if timeout is not None:
+        tokens.append((_deadline, _deadline.set(time.monotonic() + timeout)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class LLMScheduler:
+    """Bounded, priority-ordered access to the model server."""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 reserved_interactive: int = LLM_RESERVED_INTERACTIVE_SLOTS,
+                 slot_dir: Optional[str] = LLM_SCHEDULER_DIR):
+        """
+        Args:
+            max_concurrency: Maximum number of concurrent model calls.
+            reserved_interactive: Slots background requests may not use (at most max_concurrency - 1).
+            slot_dir: Directory for cross-process slot lock files, or None.
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.background_limit = max(1, self.max_concurrency - reserved_interactive)
+        if reserved_interactive > self.max_concurrency - self.background_limit:
+            logger.warning(
+                f"⚠️ Only {self.max_concurrency - self.background_limit} of {reserved_interactive} LLM slots "
+                f"reserved for interactive requests with LLM_MAX_CONCURRENCY={self.max_concurrency}; they can "
+                f"wait for a running background call (raise LLM_MAX_CONCURRENCY and OLLAMA_NUM_PARALLEL)"
+            )
+        self.slot_dir = slot_dir if fcntl is not None else None
+        if slot_dir and fcntl is None:
+            logger.warning("⚠️ Cross-process LLM slots need fcntl; limiting concurrency per process only")
+        if self.slot_dir:
+            os.makedirs(self.slot_dir, exist_ok=True)
+
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._metrics = {
+            name: {"queued": 0, "completed": 0, "expired": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+        self._max_queue_depth = 0
+
+    @contextmanager
+    def slot(self, priority: Optional[int] = None, deadline: Optional[float] = None):
+        """
+        Hold a model slot for the duration of the block.
+
+        Args:
+            priority: Defaults to the priority set with llm_context (INTERACTIVE otherwise).
+            deadline: time.monotonic() value; defaults to the llm_context deadline.
+
+        Raises:
+            DeadlineExceeded: If no slot became free before the deadline.
+        """
+        priority = _priority.get() if priority is None else priority
+        deadline = _deadline.get() if deadline is None else deadline
+        name = PRIORITY_NAMES.get(priority, "background" if priority > INTERACTIVE else "interactive")
+        limit = self.max_concurrency if priority <= INTERACTIVE else self.background_limit
+
+        started = time.monotonic()
+        self._acquire(priority, limit, deadline, name)
+        lock_file = None
+        try:
+            if self.slot_dir:
+                lock_file = self._acquire_file_slot(limit, deadline, name)
+            waited = time.monotonic() - started
+            with self._condition:
+                metrics = self._metrics[name]
+                metrics["wait_seconds"] += waited
+                metrics["max_wait_seconds"] = max(metrics["max_wait_seconds"], waited)
+            yield
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+            with self._condition:
+                self._in_flight -= 1
+                self._metrics[name]["completed"] += 1
+                self._condition.notify_all()
+
+    def run(self, fn: Callable, *args, priority: Optional[int] = None, deadline: Optional[float] = None,
+            **kwargs) -> Any:
+        """Call fn(*args, **kwargs) while holding a slot."""
+        with self.slot(priority, deadline):
+            return fn(*args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, in-flight count and per-priority wait metrics."""
+        with self._condition:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for entry in self._waiting:
+                depth[entry[2]] += 1
+            return {
+                "in_flight": self._in_flight,
+                "queue_depth": depth,
+                "max_queue_depth": self._max_queue_depth,
+                "max_concurrency": self.max_concurrency,
+                "background_limit": self.background_limit,
+                "per_priority": {name: dict(values) for name, values in self._metrics.items()},
+            }
+
+    def _acquire(self, priority: int, limit: int, deadline: Optional[float], name: str) -> None:
+        with self._condition:
+            entry = [priority, next(self._sequence), name]
+            heapq.heappush(self._waiting, entry)
+            self._metrics[name]["queued"] += 1
+            self._max_queue_depth = max(self._max_queue_depth, len(self._waiting))
+            try:
+                while not (self._waiting[0] is entry and self._in_flight < limit):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self._metrics[name]["expired"] += 1
+                        raise DeadlineExceeded(f"No LLM slot free before the deadline ({name} request)")
+                    self._condition.wait(remaining)
+                heapq.heappop(self._waiting)
+                self._in_flight += 1
+            except BaseException:
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                raise
+            # The head of the queue changed; let the next request re-check.
+            self._condition.notify_all()
+
+    def _acquire_file_slot(self, limit: int, deadline: Optional[float], name: str):
+        # Interactive requests may use every slot; background ones skip the reserved slots.
+        first_slot = self.max_concurrency - limit
+        while True:
+            for index in range(first_slot, self.max_concurrency):
+                lock_file = open(os.path.join(self.slot_dir, f"slot-{index}.lock"), "a+")
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return lock_file
+                except OSError:
+                    lock_file.close()
+            if deadline is not None and time.monotonic() >= deadline:
+                with self._condition:
+                    self._metrics[name]["expired"] += 1
+                raise DeadlineExceeded(f"No LLM slot free across processes before the deadline ({name} request)")
+            time.sleep(0.02)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Return the process-wide LLM scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
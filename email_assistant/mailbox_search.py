@@ -0,0 +1,561 @@
+"""
+Hybrid retrieval over every stored email.
+
+Emails are split into chunks and indexed twice: a BM25 lexical index and a
+FAISS vector index. Queries rank candidates in both, fuse the rankings with
+reciprocal-rank fusion and can be filtered on sender, date range and priority.
+Text extracted from attachments is indexed as extra chunks of its email.
+"""
+import bisect
+import contextvars
+import logging
+import math
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+
+from email_assistant.config import settings
+from email_assistant.llm_scheduler import get_scheduler
+from email_assistant.metrics import timed
+from email_assistant.attachment_extract import OK
+from email_assistant.models import Attachment, AttachmentText, Email
+from email_assistant.near_duplicates import canonical_email_ids
+from email_assistant.vector_index import VECTOR_INDEX_TYPE, VectorIndex
+
+logger = logging.getLogger(__name__)
+
+MAILBOX_CHUNK_CHARS = getattr(settings, "MAILBOX_CHUNK_CHARS", 1200)
+MAILBOX_SEARCH_BUDGET_MS = getattr(settings, "MAILBOX_SEARCH_BUDGET_MS", 1500)
+MAILBOX_INDEX_DIR = getattr(settings, "MAILBOX_INDEX_DIR", "mailbox_index")
+EMBED_BATCH_SIZE = 64
+RRF_K = 60
+
+_TOKEN = re.compile(r"\w+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "that", "the", "this", "to", "was", "we", "what",
+    "when", "where", "which", "who", "will", "with", "you", "your",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase text and split it into indexable terms."""
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def chunk_email(subject: str, body: str, max_chars: int = MAILBOX_CHUNK_CHARS) -> List[str]:
+    """
+    Split an email into chunks of at most max_chars, each prefixed with the subject.
+
+    Args:
+        subject: The email subject.
+        body: The email body.
+        max_chars: Maximum length of the body part of a chunk.
+
+    Returns:
+        List of chunk texts.
+    """
+    body = body or ""
+    pieces = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", body):
+        paragraph = paragraph.strip()
+        while len(paragraph) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current or not pieces:
+        pieces.append(current)
+    return [f"Subject: {subject}\n{piece}" for piece in pieces]
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index of chunk ids."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.doc_lengths = []
+        self.total_length = 0
+
+    def add(self, text: str) -> int:
+        """Index text and return its document id."""
+        doc_id = len(self.doc_lengths)
+        terms = Counter(tokenize(text))
+        for term, count in terms.items():
+            self.postings[term][doc_id] = count
+        length = sum(terms.values())
+        self.doc_lengths.append(length)
+        self.total_length += length
+        return doc_id
+
+    def search(self, query: str, top_n: int, candidates: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Rank documents for a query.
+
+        Args:
+            query: The query text.
+            top_n: Number of results to return.
+            candidates: Optional set of document ids to restrict the search to.
+
+        Returns:
+            List of (doc_id, score) sorted by descending score.
+        """
+        num_docs = len(self.doc_lengths)
+        if not num_docs:
+            return []
+        avg_length = self.total_length / num_docs or 1.0
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                if candidates is not None and doc_id not in candidates:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_n]
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """
+    Fuse several rankings of document ids with reciprocal-rank fusion.
+
+    Args:
+        rankings: Lists of document ids, best first.
+        k: RRF damping constant.
+
+    Returns:
+        List of (doc_id, fused_score) sorted by descending score.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class MailboxIndex:
+    """Incrementally refreshed hybrid (BM25 + vector) index over stored emails."""
+
+    def __init__(self, embeddings, index_type: str = VECTOR_INDEX_TYPE, directory: Optional[str] = MAILBOX_INDEX_DIR):
+        """
+        Args:
+            embeddings: A LangChain embeddings object (embed_documents / embed_query).
+            index_type: Vector index type, see vector_index.INDEX_TYPES.
+            directory: Where the index is saved and loaded from, or None to keep it in memory only.
+        """
+        self.embeddings = embeddings
+        self.directory = directory
+        self._lock = threading.RLock()
+        # Held for a whole refresh; self._lock only while the index changes
+        self._refresh_lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mailbox-embed")
+        # Bumped by reset(); chunk ids are only stable within one generation
+        self._generation = 0
+        self.reset(index_type)
+        if directory and os.path.exists(os.path.join(directory, "chunks.pkl")):
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"❌ Could not load mailbox index from {directory}, rebuilding: {str(e)}")
+                self.reset(index_type)
+
+    def reset(self, index_type: Optional[str] = None) -> None:
+        """Drop every indexed chunk, optionally switching the vector index type."""
+        with self._refresh_lock, self._lock:
+            self.bm25 = BM25Index()
+            self.vectors = VectorIndex(index_type or self.vectors.index_type)
+            self.chunks = []
+            self.last_email_id = 0
+            self.last_attachment_text_id = 0
+            self._by_sender = defaultdict(set)
+            self._by_priority = defaultdict(set)
+            self._by_time = []
+            self._by_email = defaultdict(list)
+            self._chunks_by_email = defaultdict(list)
+            self._by_attachment_hash = defaultdict(list)
+            self._generation += 1
+
+    def refresh(self, session) -> int:
+        """
+        Index emails and attachment texts stored since the last refresh.
+
+        Chunks of a near-duplicate reuse the vectors of its canonical email's
+        chunks when both split into the same number of chunks, and an
+        attachment already indexed with the same content reuses its vectors.
+        Refreshes run one at a time; searches only wait for the new chunks to
+        be added, not for them to be embedded.
+
+        Args:
+            session: The database session to read emails from.
+
+        Returns:
+            Number of chunks added.
+        """
+        with self._refresh_lock:
+            emails = (
+                session.query(Email)
+                .filter(Email.id > self.last_email_id)
+                .order_by(Email.id)
+                .all()
+            )
+            attachment_texts = (
+                session.query(AttachmentText, Attachment, Email)
+                .join(Attachment, AttachmentText.attachment_id == Attachment.id)
+                .join(Email, Attachment.email_id == Email.id)
+                .filter(AttachmentText.id > self.last_attachment_text_id, AttachmentText.status == OK)
+                .order_by(AttachmentText.id)
+                .all()
+            )
+            if not emails and not attachment_texts:
+                return 0
+
+            canonical = canonical_email_ids(session, [email.id for email in emails])
+            new_chunks = []
+            # Per new chunk: ("embed", position in texts), ("indexed", chunk id) or ("new", new chunk position)
+            sources = []
+            texts = []
+            new_by_email = defaultdict(list)
+            for email in emails:
+                email_texts = chunk_email(email.subject, email.body)
+                source_id = canonical.get(email.id)
+                indexed = self._by_email.get(source_id, [])
+                pending = new_by_email.get(source_id, [])
+                for position, text in enumerate(email_texts):
+                    if source_id and len(indexed) == len(email_texts):
+                        sources.append(("indexed", indexed[position]))
+                    elif source_id and len(pending) == len(email_texts):
+                        sources.append(("new", pending[position]))
+                    else:
+                        sources.append(("embed", len(texts)))
+                        texts.append(text)
+                    new_by_email[email.id].append(len(new_chunks))
+                    new_chunks.append({
+                        "email_id": email.id,
+                        "sender": email.sender,
+                        "subject": email.subject,
+                        "timestamp": email.timestamp,
+                        "priority": email.priority,
+                        "text": text,
+                    })
+
+            new_by_hash = defaultdict(list)
+            for extracted, attachment, email in attachment_texts:
+                if not extracted.text:
+                    continue
+                attachment_chunks = chunk_email(f"{email.subject} (attachment {attachment.filename})",
+                                                extracted.text)
+                indexed = self._by_attachment_hash.get(extracted.content_hash, [])
+                pending = new_by_hash.get(extracted.content_hash, [])
+                for position, text in enumerate(attachment_chunks):
+                    if len(indexed) == len(attachment_chunks):
+                        sources.append(("indexed", indexed[position]))
+                    elif len(pending) == len(attachment_chunks):
+                        sources.append(("new", pending[position]))
+                    else:
+                        sources.append(("embed", len(texts)))
+                        texts.append(text)
+                    if not pending:
+                        new_by_hash[extracted.content_hash].append(len(new_chunks))
+                    new_chunks.append({
+                        "email_id": email.id,
+                        "attachment_id": attachment.id,
+                        "content_hash": extracted.content_hash,
+                        "filename": attachment.filename,
+                        "sender": email.sender,
+                        "subject": email.subject,
+                        "timestamp": email.timestamp,
+                        "priority": email.priority,
+                        "text": text,
+                    })
+
+            embedded = []
+            with timed("embedding"):
+                for start in range(0, len(texts), EMBED_BATCH_SIZE):
+                    batch = texts[start:start + EMBED_BATCH_SIZE]
+                    embedded.extend(get_scheduler().run(self.embeddings.embed_documents, batch))
+
+            with self._lock:
+                with timed("index_build"):
+                    embedded = np.array(embedded, dtype="float32")
+                    reused_ids = [value for kind, value in sources if kind == "indexed"]
+                    reused = dict(zip(reused_ids, self.vectors.reconstruct(reused_ids))) if reused_ids else {}
+                    vectors = []
+                    for kind, value in sources:
+                        if kind == "embed":
+                            vectors.append(embedded[value])
+                        elif kind == "indexed":
+                            vectors.append(reused[value])
+                        else:
+                            vectors.append(vectors[value])
+                    vectors = np.array(vectors, dtype="float32")
+                    faiss.normalize_L2(vectors)
+                    self.vectors.add(vectors)
+
+                    for chunk in new_chunks:
+                        self._add_chunk(chunk)
+
+                if emails:
+                    self.last_email_id = emails[-1].id
+                if attachment_texts:
+                    self.last_attachment_text_id = attachment_texts[-1][0].id
+            logger.info(f"✅ Indexed {len(new_chunks)} chunks from {len(emails)} emails and "
+                        f"{len(attachment_texts)} attachments ({len(new_chunks) - len(texts)} reused)")
+            return len(new_chunks)
+
+    def update_priorities(self, session, email_ids: List[int]) -> int:
+        """
+        Re-tag the indexed chunks of emails whose priority changed since they were indexed.
+
+        Enrichment sets Email.priority after an email may already be indexed,
+        so the priority filter would use the old value.
+
+        Args:
+            session: The database session to read emails from.
+            email_ids: IDs of the emails to check, e.g. the ones just enriched.
+
+        Returns:
+            Number of chunks re-tagged.
+        """
+        if not email_ids:
+            return 0
+        priorities = dict(session.query(Email.id, Email.priority).filter(Email.id.in_(list(email_ids))).all())
+        changed = 0
+        with self._lock:
+            for email_id, priority in priorities.items():
+                for chunk_id in self._chunks_by_email.get(email_id, []):
+                    chunk = self.chunks[chunk_id]
+                    if chunk["priority"] != priority:
+                        self._by_priority[chunk["priority"]].discard(chunk_id)
+                        self._by_priority[priority].add(chunk_id)
+                        chunk["priority"] = priority
+                        changed += 1
+        return changed
+
+    def rebuild_vectors(self, index_type: Optional[str] = None) -> None:
+        """
+        Retrain the vector index from the stored vectors, optionally changing its type.
+
+        Args:
+            index_type: New vector index type, defaults to the current one.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            self.vectors.rebuild(index_type)
+            logger.info(f"✅ Rebuilt {self.vectors.index_type} index over {self.vectors.ntotal} vectors "
+                        f"in {time.perf_counter() - started:.1f}s")
+
+    def save(self) -> None:
+        """
+        Persist the chunks and vector index to the index directory.
+
+        Each file is written under a temporary name and renamed into place, so
+        readers never see a partial file; chunks.pkl goes last and records the
+        vector count, which load() checks against vectors.faiss.
+        """
+        if not self.directory:
+            return
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            vectors_path = os.path.join(self.directory, "vectors.faiss")
+            fd, tmp_path = tempfile.mkstemp(prefix="vectors.", suffix=".tmp", dir=self.directory)
+            os.close(fd)
+            fd, tmp_chunks_path = tempfile.mkstemp(prefix="chunks.", suffix=".tmp", dir=self.directory)
+            os.close(fd)
+            try:
+                self.vectors.save(tmp_path)
+                if os.path.exists(f"{tmp_path}.raw.npy"):
+                    os.replace(f"{tmp_path}.raw.npy", f"{vectors_path}.raw.npy")
+                if os.path.getsize(tmp_path):
+                    os.replace(tmp_path, vectors_path)
+                elif os.path.exists(vectors_path):
+                    os.remove(vectors_path)
+                with open(tmp_chunks_path, "wb") as f:
+                    pickle.dump({
+                        "index_type": self.vectors.index_type,
+                        "last_email_id": self.last_email_id,
+                        "last_attachment_text_id": self.last_attachment_text_id,
+                        "num_vectors": self.vectors.ntotal,
+                        "chunks": self.chunks,
+                    }, f)
+                os.replace(tmp_chunks_path, os.path.join(self.directory, "chunks.pkl"))
+            finally:
+                for leftover in (tmp_path, f"{tmp_path}.raw.npy", tmp_chunks_path):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+
+    def load(self) -> None:
+        """
+        Load the chunks and vector index saved by save().
+
+        Raises:
+            ValueError: If the saved vectors do not match the saved chunks.
+        """
+        with self._refresh_lock, self._lock:
+            with open(os.path.join(self.directory, "chunks.pkl"), "rb") as f:
+                state = pickle.load(f)
+            self.reset(state["index_type"])
+            vectors_path = os.path.join(self.directory, "vectors.faiss")
+            if os.path.exists(vectors_path):
+                self.vectors = VectorIndex.load(vectors_path, state["index_type"])
+            expected = state.get("num_vectors", len(state["chunks"]))
+            if self.vectors.ntotal != expected:
+                found = self.vectors.ntotal
+                self.reset(state["index_type"])
+                raise ValueError(f"{vectors_path} holds {found} vectors, the chunks expect {expected}")
+            for chunk in state["chunks"]:
+                self._add_chunk(chunk)
+            self.last_email_id = state["last_email_id"]
+            self.last_attachment_text_id = state.get("last_attachment_text_id", 0)
+
+    def _add_chunk(self, chunk: Dict[str, Any]) -> int:
+        chunk_id = self.bm25.add(chunk["text"])
+        self.chunks.append(chunk)
+        self._by_sender[(chunk["sender"] or "").lower()].add(chunk_id)
+        self._by_priority[chunk["priority"]].add(chunk_id)
+        self._chunks_by_email[chunk["email_id"]].append(chunk_id)
+        if chunk.get("attachment_id"):
+            # Keep the chunks of the first attachment with this content only.
+            same_content = self._by_attachment_hash[chunk["content_hash"]]
+            if not same_content or self.chunks[same_content[-1]]["attachment_id"] == chunk["attachment_id"]:
+                same_content.append(chunk_id)
+        else:
+            self._by_email[chunk["email_id"]].append(chunk_id)
+        if chunk["timestamp"] is not None:
+            bisect.insort(self._by_time, (_naive(chunk["timestamp"]), chunk_id))
+        return chunk_id
+
+    def search(self, query: str, k: int = 5, sender: Optional[str] = None,
+               date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+               priority: Optional[str] = None, budget_ms: float = MAILBOX_SEARCH_BUDGET_MS) -> List[Dict[str, Any]]:
+        """
+        Return the top-k chunks for a query.
+
+        The lexical ranking is always computed. The query is embedded on the
+        embedding thread, without holding the index lock, and the vector
+        ranking is only fused in if the embedding arrives within the latency
+        budget.
+
+        Args:
+            query: The question or search text.
+            k: Number of chunks to return.
+            sender: Only match emails whose sender contains this text.
+            date_from: Only match emails sent at or after this time.
+            date_to: Only match emails sent at or before this time.
+            priority: Only match emails with this priority.
+            budget_ms: Latency budget for the whole search in milliseconds.
+
+        Returns:
+            List of chunk dictionaries with an added "score" key, best first.
+        """
+        deadline = time.monotonic() + budget_ms / 1000.0
+        depth = max(k * 4, 20)
+        with self._lock:
+            if not self.chunks:
+                return []
+            candidates = self._filter(sender, date_from, date_to, priority)
+            if candidates is not None and not candidates:
+                return []
+            # Run in the caller's context so the LLM scheduler sees the caller's priority.
+            embed_future = self._executor.submit(contextvars.copy_context().run, self._embed_query, query)
+            generation = self._generation
+            lexical = [doc_id for doc_id, _ in self.bm25.search(query, depth, candidates)]
+
+        vector = None
+        try:
+            vector = embed_future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            # The embedding may still finish on its thread; its result is dropped
+            embed_future.cancel()
+            logger.warning("⚠️ Vector search exceeded the latency budget, using lexical results only")
+        except Exception as e:
+            logger.error(f"❌ Vector search failed: {str(e)}")
+
+        with self._lock:
+            if generation != self._generation:
+                # Reset or reloaded meanwhile: the chunk ids above are stale
+                candidates = self._filter(sender, date_from, date_to, priority)
+                if candidates is not None and not candidates:
+                    return []
+                lexical = [doc_id for doc_id, _ in self.bm25.search(query, depth, candidates)]
+            rankings = [lexical]
+            if vector is not None:
+                try:
+                    rankings.append(self._vector_search(vector, depth, candidates))
+                except Exception as e:
+                    logger.error(f"❌ Vector search failed: {str(e)}")
+
+            results = []
+            for doc_id, score in reciprocal_rank_fusion(rankings)[:k]:
+                chunk = dict(self.chunks[doc_id])
+                chunk["score"] = score
+                results.append(chunk)
+            return results
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        vector = np.array([get_scheduler().run(self.embeddings.embed_query, query)], dtype="float32")
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _vector_search(self, vector: np.ndarray, depth: int, candidates: Optional[Set[int]]) -> List[int]:
+        depth = min(depth, self.vectors.ntotal)
+        if not depth:
+            return []
+        if candidates is None:
+            _, ids = self.vectors.search(vector, depth)
+        else:
+            _, ids = self.vectors.search(vector, min(depth, len(candidates)),
+                                         ids=np.fromiter(candidates, dtype="int64"))
+        return [int(doc_id) for doc_id in ids[0] if doc_id >= 0]
+
+    def _filter(self, sender: Optional[str], date_from: Optional[datetime], date_to: Optional[datetime],
+                priority: Optional[str]) -> Optional[Set[int]]:
+        """Return the chunk ids matching the metadata filters, or None when unfiltered."""
+        candidates = None
+        if sender:
+            needle = sender.lower()
+            candidates = set()
+            for key, ids in self._by_sender.items():
+                if needle in key:
+                    candidates |= ids
+        if priority:
+            ids = self._by_priority.get(priority, set())
+            candidates = set(ids) if candidates is None else candidates & ids
+        if date_from or date_to:
+            low = bisect.bisect_left(self._by_time, (_naive(date_from), -1)) if date_from else 0
+            high = bisect.bisect_right(self._by_time, (_naive(date_to), len(self.chunks))) if date_to else len(self._by_time)
+            ids = {chunk_id for _, chunk_id in self._by_time[low:high]}
+            candidates = ids if candidates is None else candidates & ids
+        return candidates
+
+
+def _naive(value: datetime) -> datetime:
+    """Convert aware timestamps to naive UTC so stored values with and without offsets compare."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def format_chunk(chunk: Dict[str, Any]) -> str:
+    """Render a retrieved chunk as prompt context."""
+    return f"From: {chunk['sender']}\nDate: {chunk['timestamp']}\n{chunk['text']}"
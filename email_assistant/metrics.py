@@ -0,0 +1,60 @@
+"""
+Lightweight per-stage latency metrics.
+
+Code paths wrap their stages (embedding, index build, retrieval, generation,
+post-processing, ...) in `timed("stage")`; benchmarks and logs read the
+aggregated numbers with `stage_stats()`.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict
+
+_samples = defaultdict(list)
+_lock = threading.Lock()
+
+
+def record(stage: str, seconds: float) -> None:
+    """Record one duration for a stage."""
+    with _lock:
+        _samples[stage].append(seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    """Record how long the block takes under the given stage name."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def stage_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Summarize the recorded durations.
+
+    Returns:
+        Mapping of stage name to count, total, mean, p50 and p95 in milliseconds.
+    """
+    with _lock:
+        snapshot = {stage: sorted(values) for stage, values in _samples.items()}
+    stats = {}
+    for stage, values in snapshot.items():
+        if not values:
+            continue
+        stats[stage] = {
+            "count": len(values),
+            "total_ms": sum(values) * 1000,
+            "mean_ms": sum(values) / len(values) * 1000,
+            "p50_ms": values[len(values) // 2] * 1000,
+            "p95_ms": values[int(0.95 * (len(values) - 1))] * 1000,
+        }
+    return stats
+
+
+def reset() -> None:
+    """Forget every recorded duration."""
+    with _lock:
+        _samples.clear()
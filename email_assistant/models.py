@@ -1,7 +1,7 @@
 """
 Database models for the email assistant.
 """
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Float
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, Boolean, ForeignKey, Text, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship, sessionmaker, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
 from email_assistant.config import settings
@@ -44,6 +44,9 @@ class Email(Base):
     # Relationships
     attachments = relationship("Attachment", back_populates="email")
     meeting = relationship("Meeting", back_populates="email", uselist=False)
+    analyses = relationship("EmailAnalysis", back_populates="email")
+    signature = relationship("EmailSignature", foreign_keys="EmailSignature.email_id", back_populates="email",
+                             uselist=False)
 
 class Attachment(Base):
     """Model for storing email attachments."""
@@ -58,6 +61,23 @@ class Attachment(Base):
 
     # Relationships
     email = relationship("Email", back_populates="attachments")
+    extracted = relationship("AttachmentText", back_populates="attachment", uselist=False)
+
+class AttachmentText(Base):
+    """Text extracted from an attachment; rows with the same content_hash share one extraction."""
+    __tablename__ = 'attachment_texts'
+
+    id = Column(Integer, primary_key=True)  # increases as texts are extracted; the mailbox index reads past its watermark
+    attachment_id = Column(Integer, ForeignKey('attachments.id'), unique=True, nullable=False)
+    content_hash = Column(String(64), nullable=False, index=True)  # SHA-256 of the file
+    status = Column(String(20), nullable=False)  # ok, failed, timeout, too_large, unsupported
+    extractor = Column(String(20))
+    text = Column(Text)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationship
+    attachment = relationship("Attachment", back_populates="extracted")
 
 class Meeting(Base):
     __tablename__ = 'meetings'
@@ -76,6 +96,110 @@ class Meeting(Base):
     # Relationship
     email = relationship("Email", back_populates="meeting")
 
+class EmailAnalysis(Base):
+    """LLM analysis of an email, versioned by model and prompt."""
+    __tablename__ = 'email_analyses'
+    __table_args__ = (UniqueConstraint('email_id', 'model', 'prompt_version'),)
+
+    id = Column(Integer, primary_key=True)
+    email_id = Column(Integer, ForeignKey('emails.id'), nullable=False, index=True)
+    model = Column(String(100), nullable=False)
+    prompt_version = Column(String(50), nullable=False)
+    summary = Column(Text)
+    is_important = Column(Boolean, default=False)
+    intent = Column(String(50))
+    needs_reply = Column(Boolean, default=False)
+    has_meeting = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    email = relationship("Email", back_populates="analyses")
+    label_sources = relationship("AnalysisLabelSource", back_populates="analysis")
+
+class AnalysisLabelSource(Base):
+    """Cascade stage that decided a yes/no label of an analysis (none for labels copied from a near-duplicate)."""
+    __tablename__ = 'analysis_label_sources'
+
+    analysis_id = Column(Integer, ForeignKey('email_analyses.id'), primary_key=True)
+    label = Column(String(50), primary_key=True)  # has_meeting, is_important, needs_reply
+    stage = Column(String(20), nullable=False, index=True)  # rules, model, llm
+
+    # Relationship
+    analysis = relationship("EmailAnalysis", back_populates="label_sources")
+
+class EmailSignature(Base):
+    """SimHash signature of an email and the earlier email it is a near-duplicate of."""
+    __tablename__ = 'email_signatures'
+
+    email_id = Column(Integer, ForeignKey('emails.id'), primary_key=True)
+    simhash = Column(BigInteger, nullable=True)  # None when the email is too short to fingerprint
+    duplicate_of = Column(Integer, ForeignKey('emails.id'), nullable=True, index=True)
+    distance = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationship
+    email = relationship("Email", foreign_keys=[email_id], back_populates="signature")
+    bands = relationship("EmailSignatureBand", back_populates="signature", cascade="all, delete-orphan")
+
+class ThreadSummary(Base):
+    """Rolling summary of an email thread, versioned by model and prompt."""
+    __tablename__ = 'thread_summaries'
+    __table_args__ = (UniqueConstraint('thread_key', 'model', 'prompt_version'),)
+
+    id = Column(Integer, primary_key=True)
+    thread_key = Column(String(998), nullable=False, index=True)  # Message-ID of the thread's first email
+    model = Column(String(100), nullable=False)
+    prompt_version = Column(String(50), nullable=False)
+    summary = Column(Text, nullable=False)
+    last_email_id = Column(Integer, nullable=False)  # newest email folded into the summary
+    message_count = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ThreadSummaryPart(Base):
+    """Cached partial summary of a fixed group of emails in a thread (map step of map-reduce)."""
+    __tablename__ = 'thread_summary_parts'
+    __table_args__ = (UniqueConstraint('thread_key', 'model', 'prompt_version', 'first_email_id', 'last_email_id'),)
+
+    id = Column(Integer, primary_key=True)
+    thread_key = Column(String(998), nullable=False, index=True)
+    model = Column(String(100), nullable=False)
+    prompt_version = Column(String(50), nullable=False)
+    first_email_id = Column(Integer, nullable=False)
+    last_email_id = Column(Integer, nullable=False)
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class EmailSignatureBand(Base):
+    """One slice of an email's SimHash, indexed to find near-duplicate candidates."""
+    __tablename__ = 'email_signature_bands'
+    __table_args__ = (Index('ix_email_signature_bands_band_value', 'band', 'value'),)
+
+    email_id = Column(Integer, ForeignKey('email_signatures.email_id'), primary_key=True)
+    band = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False)
+
+    # Relationship
+    signature = relationship("EmailSignature", back_populates="bands")
+
+class SlackOutbox(Base):
+    """A Slack API call waiting to be delivered, or the record of one that was."""
+    __tablename__ = 'slack_outbox'
+    __table_args__ = (Index('ix_slack_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+    id = Column(Integer, primary_key=True)
+    method = Column(String(50), nullable=False, default='chat.postMessage')
+    channel = Column(String(100), nullable=False)
+    kind = Column(String(30), nullable=False, default='message')  # message, important_email (digestable), digest
+    text = Column(Text, nullable=False)
+    dedupe_key = Column(String(255), unique=True, nullable=True)  # e.g. "important:<email id>"
+    status = Column(String(20), nullable=False, default='pending')  # pending, sending, sent, failed, digested
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text)
+    digest_id = Column(Integer, ForeignKey('slack_outbox.id'), nullable=True)  # digest that carried this row
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
 def init_db():
     """Initialize the database by creating all tables."""
     Base.metadata.create_all(engine)
\ No newline at end of file
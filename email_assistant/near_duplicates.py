@@ -0,0 +1,274 @@
+"""
+Near-duplicate detection for stored emails.
+
+Newsletters, notifications and reply-all storms produce many emails whose
+text differs only in a date, a number or a greeting. Every email gets a
+64-bit SimHash of its normalized subject and body when it is stored; an email
+within NEAR_DUPLICATE_MAX_DISTANCE bits of an earlier one records that email
+as its canonical email, and enrichment and the mailbox index reuse the
+canonical email's analysis, summary and embeddings instead of calling the
+model again. Since the signature ignores digits, a summary is only reused
+when both emails contain the same numbers (same_numbers).
+
+Candidates are looked up through eight indexed 8-bit bands of the signature.
+Signatures at most 7 bits apart always share a band; at 10 bits more than 97%
+still do, and unrelated emails are typically 20 or more bits apart.
+"""
+import hashlib
+import logging
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+
+from email_assistant.config import settings
+from email_assistant.models import Email, EmailSignature, EmailSignatureBand
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUPLICATE_MAX_DISTANCE = getattr(settings, "NEAR_DUPLICATE_MAX_DISTANCE", 10)
+# Emails with fewer shingles than this are not fingerprinted: short replies
+# ("Thanks!") look alike without meaning the same thing.
+NEAR_DUPLICATE_MIN_FEATURES = getattr(settings, "NEAR_DUPLICATE_MIN_FEATURES", 8)
+
+SIGNATURE_BITS = 64
+BANDS = 8
+BAND_BITS = SIGNATURE_BITS // BANDS
+SHINGLE_SIZE = 2
+
+_QUOTED_LINE = re.compile(r"^\s*>.*$", re.MULTILINE)
+_REPLY_HEADER = re.compile(r"^\s*On .{0,200}wrote:\s*$.*", re.MULTILINE | re.DOTALL)
+_URL = re.compile(r"https?://\S+|www\.\S+")
+_ADDRESS = re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b")
+_NUMBER = re.compile(r"\d+")
+_WORD = re.compile(r"\w+")
+
+
+def strip_quoted_text(body: str) -> str:
+    """Remove quoted lines and everything after an "On ... wrote:" reply header."""
+    return _REPLY_HEADER.sub("", _QUOTED_LINE.sub("", body or "")).strip()
+
+
+def normalize_tokens(subject: str, body: str) -> List[str]:
+    """
+    Turn an email into the tokens its signature is computed from.
+
+    Quoted replies, URLs, addresses and digits are stripped or collapsed so
+    that emails differing only in those still match.
+
+    Args:
+        subject: The email subject.
+        body: The email body.
+
+    Returns:
+        List of lower-case word tokens.
+    """
+    body = strip_quoted_text(body)
+    subject = re.sub(r"(?i)^\s*((re|fwd?|aw)\s*:\s*)+", "", subject or "")
+    text = f"{subject}\n{body}".lower()
+    text = _URL.sub(" url ", text)
+    text = _ADDRESS.sub(" address ", text)
+    text = _NUMBER.sub("0", text)
+    return _WORD.findall(text)
+
+
+def same_numbers(subject: str, body: str, other_subject: str, other_body: str) -> bool:
+    """
+    Check whether two emails contain the same digit sequences, in the same order.
+
+    The signature collapses every number to "0", so near-duplicates can still
+    differ in amounts, dates or times; text derived from one (a summary) is
+    only valid for the other if this holds. Quoted replies, URLs and addresses
+    are ignored as in normalize_tokens.
+    """
+    def numbers(subject, body):
+        text = f"{subject or ''}\n{strip_quoted_text(body)}"
+        return _NUMBER.findall(_ADDRESS.sub(" ", _URL.sub(" ", text)))
+
+    return numbers(subject, body) == numbers(other_subject, other_body)
+
+
+def shingles(tokens: List[str], size: int = SHINGLE_SIZE) -> Counter:
+    """Return the word n-grams of tokens with their counts."""
+    if len(tokens) < size:
+        return Counter([" ".join(tokens)]) if tokens else Counter()
+    return Counter(" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1))
+
+
+def simhash(features: Counter) -> int:
+    """
+    Compute the 64-bit SimHash of weighted features.
+
+    Args:
+        features: Mapping of feature to weight.
+
+    Returns:
+        Unsigned 64-bit signature.
+    """
+    weights = [0] * SIGNATURE_BITS
+    for feature, weight in features.items():
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIGNATURE_BITS):
+            weights[bit] += weight if value >> bit & 1 else -weight
+    signature = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            signature |= 1 << bit
+    return signature
+
+
+def email_signature(subject: str, body: str) -> Optional[int]:
+    """Return the SimHash of an email, or None if it is too short to fingerprint."""
+    features = shingles(normalize_tokens(subject, body))
+    if sum(features.values()) < NEAR_DUPLICATE_MIN_FEATURES:
+        return None
+    return simhash(features)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Return the number of differing bits between two signatures."""
+    return bin(a ^ b).count("1")
+
+
+def signature_bands(signature: int) -> List[int]:
+    """Split a signature into BANDS slices of BAND_BITS bits."""
+    mask = (1 << BAND_BITS) - 1
+    return [(signature >> (band * BAND_BITS)) & mask for band in range(BANDS)]
+
+
+def _to_signed(signature: int) -> int:
+    # BIGINT columns are signed 64-bit.
+    return signature - (1 << SIGNATURE_BITS) if signature >= 1 << (SIGNATURE_BITS - 1) else signature
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << SIGNATURE_BITS) if value < 0 else value
+
+
+def find_near_duplicate(session, signature: int, exclude_email_id: Optional[int] = None,
+                        max_distance: int = NEAR_DUPLICATE_MAX_DISTANCE) -> Optional[Tuple[int, int]]:
+    """
+    Find the canonical email a signature is a near-duplicate of.
+
+    Args:
+        session: The database session to use.
+        signature: Unsigned 64-bit SimHash.
+        exclude_email_id: Email to ignore (the email being registered).
+        max_distance: Maximum number of differing bits.
+
+    Returns:
+        Tuple of (canonical email ID, distance), or None if no stored email is close enough.
+    """
+    matching_band = or_(*(
+        and_(EmailSignatureBand.band == band, EmailSignatureBand.value == value)
+        for band, value in enumerate(signature_bands(signature))
+    ))
+    candidate_ids = session.query(EmailSignatureBand.email_id).filter(matching_band).distinct()
+    query = session.query(EmailSignature).filter(EmailSignature.email_id.in_(candidate_ids))
+    if exclude_email_id is not None:
+        query = query.filter(EmailSignature.email_id != exclude_email_id)
+
+    best = None
+    for candidate in query.all():
+        distance = hamming_distance(signature, _to_unsigned(candidate.simhash))
+        if distance > max_distance:
+            continue
+        canonical_id = candidate.duplicate_of or candidate.email_id
+        if best is None or (distance, canonical_id) < (best[1], best[0]):
+            best = (canonical_id, distance)
+    return best
+
+
+def register_email(session, email: Email) -> Optional[EmailSignature]:
+    """
+    Compute and store the signature of an email and link it to its canonical email.
+
+    The caller commits the session.
+
+    Args:
+        session: The database session to use.
+        email: A flushed Email row (its id must be set).
+
+    Returns:
+        The EmailSignature row, or None if fingerprinting failed.
+    """
+    try:
+        signature = email_signature(email.subject, email.body)
+        row = EmailSignature(email_id=email.id)
+        if signature is not None:
+            row.simhash = _to_signed(signature)
+            row.bands = [EmailSignatureBand(band=band, value=value)
+                         for band, value in enumerate(signature_bands(signature))]
+            match = find_near_duplicate(session, signature, exclude_email_id=email.id)
+            if match and match[0] < email.id:
+                row.duplicate_of, row.distance = match
+                logger.info(f"Email {email.id} is a near-duplicate of email {match[0]} (distance {match[1]})")
+        session.add(row)
+        return row
+    except Exception as e:
+        logger.error(f"❌ Error fingerprinting email {email.id}: {str(e)}")
+        return None
+
+
+def backfill_signatures(session, limit: Optional[int] = None) -> int:
+    """
+    Fingerprint stored emails that have no signature yet, oldest first.
+
+    Args:
+        session: The database session to use.
+        limit: Maximum number of emails to fingerprint.
+
+    Returns:
+        Number of emails fingerprinted.
+    """
+    query = session.query(Email).filter(~Email.signature.has()).order_by(Email.id)
+    if limit:
+        query = query.limit(limit)
+    count = 0
+    try:
+        for email in query.all():
+            if register_email(session, email) is not None:
+                # Flush so later emails in this batch can match this one.
+                session.flush()
+                count += 1
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Error backfilling email signatures: {str(e)}")
+        return 0
+    if count:
+        logger.info(f"✅ Fingerprinted {count} stored emails")
+    return count
+
+
+def canonical_email_id(session, email_id: int) -> Optional[int]:
+    """Return the ID of the email this one is a near-duplicate of, or None."""
+    row = session.query(EmailSignature.duplicate_of).filter_by(email_id=email_id).first()
+    return row[0] if row else None
+
+
+def canonical_email_ids(session, email_ids: Iterable[int]) -> Dict[int, int]:
+    """Map each near-duplicate among email_ids to its canonical email ID."""
+    email_ids = list(email_ids)
+    if not email_ids:
+        return {}
+    rows = (
+        session.query(EmailSignature.email_id, EmailSignature.duplicate_of)
+        .filter(EmailSignature.email_id.in_(email_ids), EmailSignature.duplicate_of.isnot(None))
+        .all()
+    )
+    return {email_id: duplicate_of for email_id, duplicate_of in rows}
+
+
+def duplicate_stats(session) -> Dict[str, float]:
+    """Return the number of fingerprinted emails, near-duplicates and their share."""
+    total = session.query(func.count(EmailSignature.email_id)).scalar() or 0
+    duplicates = session.query(func.count(EmailSignature.email_id)).filter(
+        EmailSignature.duplicate_of.isnot(None)
+    ).scalar() or 0
+    return {
+        "fingerprinted": total,
+        "near_duplicates": duplicates,
+        "duplicate_share": duplicates / total if total else 0.0,
+    }
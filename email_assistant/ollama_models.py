@@ -0,0 +1,204 @@
+"""
+Ollama model settings, warm-up and keep-alive.
+
+The first request after Ollama starts (or after a model was unloaded for being
+idle) pays the model load time. At service startup the configured chat and
+embedding models are loaded with a keep-alive, a tiny generation warms the
+chat model up, and a background thread refreshes the keep-alive while the
+service runs. The warm-up state is exposed through `readiness()` so the UI
+and logs can tell whether the first request will be fast.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from email_assistant.config import settings
+from email_assistant.llm_scheduler import BACKGROUND, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = getattr(settings, "OLLAMA_CHAT_MODEL", "deepseek-r1:1.5b")
+# Whether the chat model emits a <think> section before its answer (deepseek-r1 does);
+# answer limits (num_predict, stop sequences) are then only applied client-side.
+OLLAMA_THINKING_MODEL = getattr(settings, "OLLAMA_THINKING_MODEL", "r1" in MODEL_NAME.lower())
+EMBEDDING_MODEL_NAME = getattr(settings, "OLLAMA_EMBEDDING_MODEL", MODEL_NAME)
+OLLAMA_BASE_URL = getattr(settings, "OLLAMA_BASE_URL", "http://localhost:11434")
+# Ollama duration ("30m", "2h") or seconds; a negative value keeps the model loaded indefinitely.
+OLLAMA_KEEP_ALIVE = getattr(settings, "OLLAMA_KEEP_ALIVE", "30m")
+# Seconds between keep-alive refreshes while the service runs (0 disables them).
+OLLAMA_KEEP_ALIVE_REFRESH = getattr(settings, "OLLAMA_KEEP_ALIVE_REFRESH", 600)
+OLLAMA_WARMUP_TIMEOUT = getattr(settings, "OLLAMA_WARMUP_TIMEOUT", 300)
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class ModelWarmup:
+    """Loads the chat and embedding models, keeps them loaded and tracks readiness."""
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, chat_model: str = MODEL_NAME,
+                 embedding_model: str = EMBEDDING_MODEL_NAME, keep_alive=OLLAMA_KEEP_ALIVE,
+                 refresh_seconds: float = OLLAMA_KEEP_ALIVE_REFRESH, timeout: float = OLLAMA_WARMUP_TIMEOUT):
+        """
+        Args:
+            base_url: URL of the Ollama server.
+            chat_model: Name of the chat model to load.
+            embedding_model: Name of the embedding model to load.
+            keep_alive: How long Ollama keeps the models loaded after a request.
+            refresh_seconds: Interval of the keep-alive refresh, 0 to disable it.
+            timeout: Seconds allowed for each warm-up request.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.chat_model = chat_model
+        self.embedding_model = embedding_model
+        self.keep_alive = keep_alive
+        self.refresh_seconds = refresh_seconds
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._state = {
+            "chat": {"model": chat_model, "status": PENDING, "load_seconds": None, "warmup_seconds": None,
+                     "error": None},
+            "embedding": {"model": embedding_model, "status": PENDING, "load_seconds": None, "error": None},
+            "last_refresh": None,
+        }
+
+    def start(self) -> None:
+        """Warm the models up in a background thread, then keep them loaded."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="ollama-warmup", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop refreshing the keep-alive."""
+        self._stop.set()
+
+    def warm_up(self) -> bool:
+        """
+        Load both models and run a one-token generation on the chat model.
+
+        Returns:
+            True if both models are ready.
+        """
+        chat_ok = self._warm_up_chat()
+        embedding_ok = self._warm_up_embedding()
+        if chat_ok and embedding_ok:
+            self._ready.set()
+            logger.info(f"✅ Ollama models ready: {self.readiness()}")
+        return chat_ok and embedding_ok
+
+    def refresh(self) -> None:
+        """Re-send the keep-alive so Ollama does not unload the models."""
+        try:
+            self._post("/api/generate", {"model": self.chat_model, "keep_alive": self.keep_alive})
+            if self.embedding_model != self.chat_model:
+                self._post("/api/embed", {"model": self.embedding_model, "input": "keep-alive",
+                                          "keep_alive": self.keep_alive})
+        except Exception as e:
+            logger.warning(f"⚠️ Could not refresh the model keep-alive: {str(e)}")
+            return
+        with self._lock:
+            self._state["last_refresh"] = time.time()
+
+    def is_ready(self) -> bool:
+        """Return True once both models are loaded and warm."""
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until the models are ready or timeout seconds passed."""
+        return self._ready.wait(timeout)
+
+    def readiness(self) -> Dict[str, Any]:
+        """Return the warm-up status of each model."""
+        with self._lock:
+            state = {key: dict(value) if isinstance(value, dict) else value for key, value in self._state.items()}
+        state["ready"] = self.is_ready()
+        return state
+
+    def _run(self) -> None:
+        while not self.warm_up():
+            # Ollama may still be starting; retry until it answers.
+            if self._stop.wait(10):
+                return
+        while self.refresh_seconds and not self._stop.wait(self.refresh_seconds):
+            self.refresh()
+
+    def _warm_up_chat(self) -> bool:
+        self._set("chat", status=LOADING, error=None)
+        try:
+            started = time.perf_counter()
+            # A request without a prompt only loads the model and applies keep_alive.
+            self._post("/api/generate", {"model": self.chat_model, "keep_alive": self.keep_alive})
+            loaded = time.perf_counter()
+            get_scheduler().run(
+                self._post, "/api/generate",
+                {"model": self.chat_model, "prompt": "Hi", "stream": False, "keep_alive": self.keep_alive,
+                 "options": {"num_predict": 1}},
+                priority=BACKGROUND,
+            )
+            self._set("chat", status=READY, load_seconds=loaded - started,
+                      warmup_seconds=time.perf_counter() - loaded)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Could not warm up chat model {self.chat_model}: {str(e)}")
+            self._set("chat", status=FAILED, error=str(e))
+            return False
+
+    def _warm_up_embedding(self) -> bool:
+        self._set("embedding", status=LOADING, error=None)
+        try:
+            started = time.perf_counter()
+            get_scheduler().run(
+                self._post, "/api/embed",
+                {"model": self.embedding_model, "input": "warm-up", "keep_alive": self.keep_alive},
+                priority=BACKGROUND,
+            )
+            self._set("embedding", status=READY, load_seconds=time.perf_counter() - started)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Could not warm up embedding model {self.embedding_model}: {str(e)}")
+            self._set("embedding", status=FAILED, error=str(e))
+            return False
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        import requests
+
+        response = requests.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _set(self, key: str, **values) -> None:
+        with self._lock:
+            self._state[key].update(values)
+
+
+_warmup = None
+_warmup_lock = threading.Lock()
+
+
+def get_model_warmup() -> ModelWarmup:
+    """Return the process-wide model warm-up manager."""
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = ModelWarmup()
+        return _warmup
+
+
+def start_model_warmup() -> ModelWarmup:
+    """Start warming up the models in the background and return the manager."""
+    warmup = get_model_warmup()
+    warmup.start()
+    return warmup
+
+
+def readiness() -> Dict[str, Any]:
+    """Return the warm-up status of the process-wide manager."""
+    return get_model_warmup().readiness()
@@ -1,145 +1,88 @@
 """
 Script to process a specific email and create a calendar event from it.
 """
+import asyncio
 import re
 import os
 from datetime import datetime, timedelta
 import pytz
 from dateutil import parser
-from email_assistant.calendar_service import CalendarService
+from email_assistant.availability import CALENDAR_TIMEZONE
+from email_assistant.async_calendar import AsyncCalendarService
+from email_assistant.calendar_cache import get_event_cache
+from email_assistant.calendar_service import get_calendar_service
+from email_assistant.datetime_extract import extract_datetime
 from email_assistant.config import settings
 import json
-from email_assistant.slack_operations import SlackOperations
 
-# Timezone setup
-IST = pytz.timezone('Asia/Kolkata')
 UTC = pytz.UTC
 
+# Meeting emails one asyncio worker keeps in flight, and seconds each may take.
+MEETING_PIPELINE_CONCURRENCY = getattr(settings, "MEETING_PIPELINE_CONCURRENCY", 20)
+MEETING_DEADLINE = getattr(settings, "MEETING_DEADLINE", 30)
+
+# Dates and times dateutil can read on its own, compiled once for the fallback path.
+DATETIME_FALLBACK_PATTERN = re.compile('|'.join([
+    r'\b\d{1,2}[-/]\d{1,2}[-/]\d{2,4}\b',  # Matches dates like 12-31-2020 or 12/31/20
+    r'\b\d{1,2} \w+ \d{2,4}\b',            # Matches dates like 31 December 2020
+    r'\b\w+ \d{1,2}, \d{2,4}\b',           # Matches dates like December 31, 2020
+    r'\b\d{1,2}:\d{2} ?[APap][mM]?\b',     # Matches times like 12:30 PM or 12:30pm
+    r'\b\d{1,2}:\d{2}:\d{2} ?[APap][mM]?\b' # Matches times like 12:30:45 PM
+]))
+
 def parse_datetime_with_dateutil(text: str) -> datetime:
     """
-    Extract and parse date and time from a given text using dateutil.parser.
+    Extract and parse date and time from a given text.
+
+    The rule-based extractor in datetime_extract is tried first (numeric dates
+    are read day first, as the model writes them as dd-mm-yyyy); dateutil.parser
+    is the fallback for anything it does not recognize.
 
     Args:
         text: The input text containing date and time information.
 
     Returns:
-        A datetime object representing the parsed date and time.
+        A timezone-aware datetime object (CALENDAR_TIMEZONE unless the text names a zone).
 
     Raises:
         ValueError: If no valid date or time is found in the text.
     """
-    # Regular expression to find potential date and time patterns
-    date_patterns = [
-        r'\b\d{1,2}[-/]\d{1,2}[-/]\d{2,4}\b',  # Matches dates like 12-31-2020 or 12/31/20
-        r'\b\d{1,2} \w+ \d{2,4}\b',            # Matches dates like 31 December 2020
-        r'\b\w+ \d{1,2}, \d{2,4}\b',           # Matches dates like December 31, 2020
-        r'\b\d{1,2}:\d{2} ?[APap][mM]?\b',     # Matches times like 12:30 PM or 12:30pm
-        r'\b\d{1,2}:\d{2}:\d{2} ?[APap][mM]?\b' # Matches times like 12:30:45 PM
-    ]
-
-    # Combine patterns into a single regex
-    combined_pattern = '|'.join(date_patterns)
-
-    # Find all matches in the text
-    matches = re.findall(combined_pattern, text)
+    extracted = extract_datetime(text, day_first=True)
+    if extracted and extracted.has_date and extracted.has_time:
+        return extracted.start
 
     # Parse and return the first valid date-time
-    for match in matches:
+    for match in DATETIME_FALLBACK_PATTERN.findall(text):
         try:
-            parsed_date = parser.parse(match)
-            return parsed_date
-        except ValueError:
+            parsed_date = parser.parse(match, dayfirst=True)
+        except (ValueError, OverflowError):
             continue  # Skip if parsing fails
+        if parsed_date.tzinfo is None:
+            parsed_date = pytz.timezone(CALENDAR_TIMEZONE).localize(parsed_date)
+        return parsed_date
 
     # If no valid date-time is found, raise an error
     raise ValueError(f"No valid date or time found in the text: {text}")
 
 def parse_datetime(date_str: str, time_str: str) -> datetime:
     """
-    Parse date and time strings into a datetime object, handling specific formats and ignoring unnecessary characters.
-    Supports relative days like "Friday at 3 PM".
+    Parse date and time strings into a datetime object.
+    Supports relative days like "Friday" and "tomorrow", and times like "3 PM IST".
 
     Args:
         date_str: The date string to parse (can include day names like "Friday").
         time_str: The time string to parse.
 
     Returns:
-        A datetime object representing the parsed date and time.
+        A naive datetime object in CALENDAR_TIMEZONE.
 
     Raises:
-        ValueError: If none of the formats match the input strings.
+        ValueError: If the strings do not contain a date and a time.
     """
-
-
-    # Define possible date and time formats
-    date_formats = [
-        "%B %d, %Y",  # Example: "April 5, 2025"
-        "%d %B %Y",   # Example: "5 April 2025"
-        "%Y-%m-%d",   # Example: "2025-04-05"
-        "%d/%m/%Y",   # Example: "05/04/2025"
-        "%m/%d/%Y",   # Example: "04/05/2025"
-        "%A",         # Example: "Friday"
-        "%A, %B %d, %Y",  # Example: "Friday, April 5, 2025"
-    ]
-
-    time_formats = [
-        "%I:%M %p",        # Example: "3:00 PM"
-        "%H:%M",           # Example: "15:00"
-        "%I:%M %p %Z",     # Example: "3:00 PM IST"
-        "%I:%M %p (%Z)",   # Example: "3:00 PM (IST)"
-    ]
-
-    # Define relative days
-    weekdays = {
-        "monday": 0,
-        "tuesday": 1,
-        "wednesday": 2,
-        "thursday": 3,
-        "friday": 4,
-        "saturday": 5,
-        "sunday": 6,
-    }
-
-    # Clean the date and time strings by removing unnecessary characters
-    date_str = re.sub(r"[\/\.,-:]", " ", date_str).strip().lower()
-    time_str = re.sub(r"[\/\.,-:]", " ", time_str).strip().lower()
-
-    # Handle relative days like "Friday"
-    today = datetime.now()
-    if date_str in weekdays:
-        target_weekday = weekdays[date_str]
-        current_weekday = today.weekday()
-        days_until_target = (target_weekday - current_weekday) % 7
-        parsed_date = today + timedelta(days=days_until_target)
-    else:
-        # Try parsing the date
-        parsed_date = None
-        for date_format in date_formats:
-            try:
-                parsed_date = datetime.strptime(date_str, date_format)
-                break
-            except ValueError:
-                continue
-
-        if not parsed_date:
-            raise ValueError(f"Date string '{date_str}' does not match any known formats.")
-
-    # Try parsing the time
-    parsed_time = None
-    for time_format in time_formats:
-        try:
-            parsed_time = datetime.strptime(time_str, time_format).time()
-            break
-        except ValueError:
-            continue
-
-    if not parsed_time:
-        raise ValueError(f"Time string '{time_str}' does not match any known formats.")
-
-    # Combine date and time
-    combined_datetime = datetime.combine(parsed_date.date(), parsed_time)
-
-    return combined_datetime
+    extracted = extract_datetime(f"{date_str} {time_str}")
+    if not extracted or not extracted.has_date or not extracted.has_time:
+        raise ValueError(f"Could not read a date and time from '{date_str}' and '{time_str}'.")
+    return extracted.start.replace(tzinfo=None)
 
 def check_time_slot_availability(service, start_time, duration_hours=1):
     """
@@ -212,6 +155,161 @@ def validate_email(email: str) -> bool:
     return re.match(email_regex, email) is not None
 
 
+def build_event_details(meeting_details):
+    """
+    Turn extracted meeting details into event details for CalendarService.
+
+    Args:
+        meeting_details: A dictionary containing meeting details. An optional
+            "source_id" (the Message-ID of the email) makes event creation idempotent.
+
+    Returns:
+        A dictionary of event details.
+
+    Raises:
+        ValueError: If the start date or time is missing or cannot be parsed.
+    """
+    # Extract and clean meeting details
+    summary = meeting_details.get("summary", "No Title Provided")
+    location = meeting_details.get("location", "No Location Provided")
+    description = meeting_details.get("description", "No Description Provided")
+    start_date = meeting_details.get("start_date", "").strip()
+    start_time = meeting_details.get("start_time", "").strip()
+    end_date = meeting_details.get("end_date", "").strip()
+    end_time = meeting_details.get("end_time", "").strip()
+    attendees = meeting_details.get("attendees", "").split(",")
+    sender_email = meeting_details.get("sender_email", "")
+
+    # Parse start_date and start_time
+    if start_date and start_time:
+        start_datetime = parse_datetime_with_dateutil(f"{start_date} {start_time}")
+    else:
+        raise ValueError("Start date or time is missing or invalid.")
+
+    # Handle missing end_date and end_time
+    try:
+        if end_date and end_time:
+            end_datetime = parse_datetime_with_dateutil(f"{end_date} {end_time}")
+        else:
+            end_datetime = start_datetime + timedelta(hours=1)  # Default to 1-hour duration
+    except ValueError as e:
+        end_datetime = start_datetime + timedelta(hours=1)  # Default to 1-hour duration
+
+    # Parse attendees
+    valid_attendees = []
+    for attendee in attendees:
+        attendee = attendee.strip()
+        if validate_email(attendee):
+            valid_attendees.append(attendee)
+
+    # Fallback to sender's email if no valid attendees
+    if not valid_attendees and validate_email(sender_email):
+        valid_attendees = [sender_email]
+
+    return {
+        "title": summary,
+        "location": location,
+        "description": description,
+        "start_time": start_datetime,
+        "end_time": end_datetime,
+        "attendees": valid_attendees,
+        "source_id": meeting_details.get("source_id"),
+    }
+
+
+def process_meeting_emails(meetings):
+    """
+    Process the meeting details of many emails with batched calendar requests.
+
+    Availability of all meetings is checked in one batch of freebusy queries
+    and the events that fit are created in one batch of inserts. Meetings
+    with a "source_id" are created with an ID derived from it, so processing
+    the same emails again reports them as existing instead of duplicating them.
+
+    Args:
+        meetings: A list of meeting details dictionaries, as for process_meeting_email.
+
+    Returns:
+        One result per meeting, in order, with the same statuses as process_meeting_email
+        ("exists" for meetings created earlier).
+    """
+    results = [None] * len(meetings)
+    events, positions = [], []
+    for index, meeting_details in enumerate(meetings):
+        try:
+            events.append(build_event_details(meeting_details))
+            positions.append(index)
+        except ValueError as e:
+            results[index] = {"status": "error", "message": f"Error parsing start date and time: {e}"}
+
+    if events:
+        for index, result in zip(positions, get_calendar_service().schedule_events(events)):
+            results[index] = result
+    return results
+
+
+async def process_meeting_email_async(meeting_details, calendar_service, deadline=MEETING_DEADLINE):
+    """
+    Process meeting details with the asynchronous calendar service.
+
+    Args:
+        meeting_details: A dictionary containing meeting details.
+        calendar_service: An AsyncCalendarService.
+        deadline: Seconds allowed for the calendar operations, None for no limit.
+
+    Returns:
+        A dictionary with the same statuses as process_meeting_email, plus "timeout".
+    """
+    try:
+        event_details = build_event_details(meeting_details)
+    except ValueError as e:
+        return {"status": "error", "message": f"Error parsing start date and time: {e}"}
+    try:
+        result = await calendar_service.schedule(event_details, deadline=deadline)
+    except Exception as e:
+        # One failing meeting must not take the rest of a gathered batch with it
+        print(f"Unexpected error: {e}")
+        return {"status": "error", "message": f"Unexpected error: {e}", "summary": event_details["title"]}
+    result["summary"] = event_details["title"]
+    return result
+
+
+async def process_meeting_emails_async(meetings, calendar_service=None, concurrency=MEETING_PIPELINE_CONCURRENCY,
+                                       deadline=MEETING_DEADLINE):
+    """
+    Process the meeting details of many emails concurrently on one event loop.
+
+    Up to concurrency meetings are in flight at once, each with its own
+    deadline; the availability lookups of a meeting fan out concurrently too.
+
+    Args:
+        meetings: A list of meeting details dictionaries, as for process_meeting_email.
+        calendar_service: An AsyncCalendarService; one with the stored credentials is created
+            (and closed) if omitted. It uses the primary calendar's event cache when a
+            CalendarService has attached an API service to it, and asks freebusy otherwise.
+        concurrency: Most meetings processed at once.
+        deadline: Seconds allowed per meeting, None for no limit.
+
+    Returns:
+        One result per meeting, in order.
+    """
+    if calendar_service is None:
+        # A cache without an API service cannot sync, and would fail every meeting once stale
+        event_cache = get_event_cache(None)
+        if event_cache.service is None:
+            event_cache = None
+        async with AsyncCalendarService.from_settings(event_cache=event_cache) as service:
+            return await process_meeting_emails_async(meetings, service, concurrency, deadline)
+
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async def process(meeting_details):
+        async with in_flight:
+            return await process_meeting_email_async(meeting_details, calendar_service, deadline)
+
+    return await asyncio.gather(*(process(meeting_details) for meeting_details in meetings))
+
+
 def process_meeting_email(meeting_details):
     """
     Process meeting details and create a calendar event if start_date and start_time are provided.
@@ -224,102 +322,69 @@ def process_meeting_email(meeting_details):
         A dictionary with the status of the event creation or alternative time slots if unavailable.
     """
     try:
-        # Extract and clean meeting details
-        summary = meeting_details.get("summary", "No Title Provided")
-        location = meeting_details.get("location", "No Location Provided")
-        description = meeting_details.get("description", "No Description Provided")
-        start_date = meeting_details.get("start_date", "").strip()
-        start_time = meeting_details.get("start_time", "").strip()
-        end_date = meeting_details.get("end_date", "").strip()
-        end_time = meeting_details.get("end_time", "").strip()
-        attendees = meeting_details.get("attendees", "").split(",")
-        sender_email = meeting_details.get("sender_email", "")
-
-        # Parse start_date and start_time
         try:
-            if start_date and start_time:
-                start_datetime = parse_datetime_with_dateutil(f"{start_date} {start_time}")
-            else:
-                raise ValueError("Start date or time is missing or invalid.")
+            event_details = build_event_details(meeting_details)
         except ValueError as e:
             return {
                 "status": "error",
                 "message": f"Error parsing start date and time: {e}",
             }
-
-        # Handle missing end_date and end_time
-        try:
-            if end_date and end_time:
-                end_datetime = parse_datetime_with_dateutil(f"{end_date} {end_time}")
-            else:
-                end_datetime = start_datetime + timedelta(hours=1)  # Default to 1-hour duration
-        except ValueError as e:
-            end_datetime = start_datetime + timedelta(hours=1)  # Default to 1-hour duration
-
-        # Parse attendees
-        valid_attendees = []
-        for attendee in attendees:
-            attendee = attendee.strip()
-            if validate_email(attendee):
-                valid_attendees.append(attendee)
-
-        # Fallback to sender's email if no valid attendees
-        if not valid_attendees and validate_email(sender_email):
-            valid_attendees = [sender_email]
-
-        print("Initializing CalendarService...")
-        # Initialize the CalendarService
-        calendar_service = CalendarService()
-
-        # Check if the time slot is available
-        is_available, alternative_slots = calendar_service.check_time_slot_availability(
-            start_datetime, (end_datetime - start_datetime).total_seconds() / 3600
-        )
-
-        if is_available:
-            # Create the calendar event
-            event_details = {
-                "title": summary,
-                "location": location,
-                "description": description,
-                "start_time": start_datetime,
-                "end_time": end_datetime,
-                "attendees": valid_attendees or ["No Attendees Provided"],
+        summary = event_details["title"]
+
+        # Reuse the process-wide CalendarService (built and authorized once). schedule checks the
+        # organizer and every attendee, and accepts the slot under a lock shared by all threads;
+        # an email scheduled before finds its own event instead of conflicting with it.
+        result = get_calendar_service().schedule(event_details)
+        event_id = result.get("event_id")
+        unknown_attendees = result.get("unknown_attendees", [])
+        if unknown_attendees:
+            print(f"⚠️ Could not check the availability of: {', '.join(unknown_attendees)}")
+
+        if result["status"] == "exists":
+            print(f"Event {event_id} already exists.")
+            return {
+                "status": "exists",
+                "message": f"Event {event_id} already exists",
+                "event_id": event_id,
+                "summary": summary,
+            }
+        if result["status"] == "success":
+            print(f"✅ Event created successfully with ID: {event_id}")
+            return {
+                "status": "success",
+                "message": f"Event created successfully with ID: {event_id}",
+                "event_id": event_id,
+                "summary": summary,
+                "unknown_attendees": unknown_attendees,
+            }
+        if result["status"] == "error":
+            print("❌ Failed to create calendar event.")
+            return {
+                "status": "error",
+                "message": "Failed to create calendar event.",
             }
-            event_id = calendar_service.create_event(event_details)
-            if event_id:
-                print(f"✅ Event created successfully with ID: {event_id}")
-                return {
-                    "status": "success",
-                    "message": f"Event created successfully with ID: {event_id}",
-                    "event_id": event_id,
-                    "summary": summary,
-                }
-            else:
-                print("❌ Failed to create calendar event.")
-                return {
-                    "status": "error",
-                    "message": "Failed to create calendar event.",
-                }
         else:
             # Propose alternative time slots
+            alternative_slots = result.get("alternative_slots")
             print("❌ The requested time slot is not available.")
             if alternative_slots:
                 print("Here are some alternative available time slots:")
                 for slot in alternative_slots:
-                    start_time = slot["start"].astimezone(pytz.timezone("Asia/Kolkata"))
-                    end_time = slot["end"].astimezone(pytz.timezone("Asia/Kolkata"))
-                    print(f"  • {start_time.strftime('%I:%M %p')} - {end_time.strftime('%I:%M %p')}")
+                    start_time = slot["start"].astimezone(pytz.timezone(CALENDAR_TIMEZONE))
+                    end_time = slot["end"].astimezone(pytz.timezone(CALENDAR_TIMEZONE))
+                    print(f"  • {start_time.strftime('%a %d %b %I:%M %p')} - {end_time.strftime('%I:%M %p')}")
                 return {
                     "status": "conflict",
                     "message": "The requested time slot is not available.",
                     "alternative_slots": alternative_slots,
+                    "unknown_attendees": unknown_attendees,
                 }
             else:
                 print("No alternative time slots available for this day.")
                 return {
                     "status": "conflict",
                     "message": "The requested time slot is not available, and no alternatives are available.",
+                    "unknown_attendees": unknown_attendees,
                 }
 
     except Exception as e:
@@ -1,12 +1,18 @@
 import re
-from typing import Dict, Optional, Any
+import json
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import uuid
 import logging
+import threading
+import time
+from datetime import datetime
 
-from email_assistant.models import Email
+from email_assistant.models import Email, db
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
 
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
@@ -14,45 +20,35 @@ from langchain_core.runnables import RunnablePassthrough
 from langchain_ollama import ChatOllama, OllamaEmbeddings
 import numpy as np
 import faiss
+import pytz
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from email_assistant.availability import CALENDAR_TIMEZONE
 from email_assistant.config import settings
-from email_assistant.process_meeting_email import process_meeting_email
+from email_assistant.datetime_extract import ExtractedDateTime, extract_datetime
+from email_assistant.llm_cache import get_response_cache
+from email_assistant.llm_scheduler import DeadlineExceeded, get_scheduler
+from email_assistant.mailbox_search import MailboxIndex, format_chunk
+from email_assistant.metrics import record, timed
+from email_assistant.ollama_models import (
+    EMBEDDING_MODEL_NAME, MODEL_NAME, OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE, OLLAMA_THINKING_MODEL,
+)
+from email_assistant.vector_index import VectorIndex
+from email_assistant.stream_filter import StopConditions, ThinkStreamFilter
 # from email_assistant.web_search_service import WebSearchService
 # from email_assistant.save_draft_email import save_draft_if_needed
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 results = {}
 
-def setup_vector_store(chunks):
-    embeddings = OllamaEmbeddings(model='deepseek-r1:1.5b', base_url="http://localhost:11434")
-    vectors = np.array([embeddings.embed_query(text) for text in chunks], dtype="float32")
-    print("Generated embeddings:", vectors)
-
-    index = faiss.IndexFlatL2(vectors.shape[1])
-    index.add(vectors)
-    print("FAISS index created and vectors added.")
-
-    docstore = InMemoryDocstore()
-    index_to_docstore_id = {}
-
-    for i, text in enumerate(chunks):
-        doc_id = str(uuid.uuid4())
-        doc = Document(page_content=text)
-        docstore.add({doc_id: doc})
-        index_to_docstore_id[i] = doc_id
-
-    vector_store = FAISS(
-        embedding_function=embeddings,
-        index=index,
-        docstore=docstore,
-        index_to_docstore_id=index_to_docstore_id
-    )
-    print("Vector store setup complete.")
-    return vector_store
+# Contexts up to this many (estimated) tokens are put straight into the prompt;
+# larger corpora go through embedding and MMR retrieval instead.
+CONTEXT_BUDGET_TOKENS = getattr(settings, "RAG_CONTEXT_BUDGET_TOKENS", 1536)
+CHARS_PER_TOKEN = 4
 
-def create_rag_chain(retriever):
-    prompt = """
+# Bump PROMPT_VERSION whenever RAG_PROMPT changes so cached answers are not reused.
+PROMPT_VERSION = "1"
+RAG_PROMPT = """
         You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question.understand the context and analyze whole data throughly before answering the question.
         If you don't know the answer, just say that you don't know.
         Answer concisely and directly without including any additional explanations or thought processes. Use the following pieces of retrieved context to answer the question.Try to be as concise as possible.try to give answer in one word if in details is not mentioned in the question. Don't give any extra information or detailed answer when it is not mentioned.Strictly follow the answer format asked in question.
@@ -63,8 +59,67 @@ def create_rag_chain(retriever):
 
         ### Answer:
     """
-    model = ChatOllama(model="deepseek-r1:1.5b", base_url="http://localhost:11434")
-    prompt_template = ChatPromptTemplate.from_template(prompt)
+
+def setup_vector_store(chunks, index_type: str = "flat"):
+    """
+    Embed chunks and wrap them in a FAISS vector store.
+
+    Args:
+        chunks: The texts to index.
+        index_type: Vector index type, see vector_index.INDEX_TYPES. Types that
+            need training fall back to exact search until enough vectors exist.
+
+    Returns:
+        The LangChain FAISS vector store.
+    """
+    embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL_NAME, base_url=OLLAMA_BASE_URL, keep_alive=OLLAMA_KEEP_ALIVE)
+    with timed("embedding"):
+        vectors = np.array(get_scheduler().run(embeddings.embed_documents, chunks), dtype="float32")
+    print("Generated embeddings:", vectors.shape)
+
+    with timed("index_build"):
+        if index_type == "flat":
+            index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(vectors)
+        else:
+            faiss.normalize_L2(vectors)
+            vector_index = VectorIndex(index_type)
+            vector_index.add(vectors)
+            index = vector_index.index if vector_index.index is not None else vector_index.staging
+        print("FAISS index created and vectors added.")
+
+        docstore = InMemoryDocstore()
+        index_to_docstore_id = {}
+
+        for i, text in enumerate(chunks):
+            doc_id = str(uuid.uuid4())
+            doc = Document(page_content=text)
+            docstore.add({doc_id: doc})
+            index_to_docstore_id[i] = doc_id
+
+        vector_store = FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+            normalize_L2=index_type != "flat",
+            distance_strategy=DistanceStrategy.EUCLIDEAN_DISTANCE if index_type == "flat" else DistanceStrategy.MAX_INNER_PRODUCT,
+        )
+    print("Vector store setup complete.")
+    return vector_store
+
+def create_rag_chain(retriever):
+    """
+    Create the question-answering chain.
+
+    Args:
+        retriever: A retriever, or any callable mapping the question to the context.
+
+    Returns:
+        The runnable RAG chain.
+    """
+    model = ChatOllama(model=MODEL_NAME, base_url=OLLAMA_BASE_URL, keep_alive=OLLAMA_KEEP_ALIVE)
+    prompt_template = ChatPromptTemplate.from_template(RAG_PROMPT)
 
     chain = (
         {"context": retriever, "question": RunnablePassthrough()}
@@ -75,39 +130,295 @@ def create_rag_chain(retriever):
     print("RAG chain created successfully.")
     return chain
 
-def chatbot_interaction(question: str) -> str:
-    vector_sto = setup_vector_store([question])
-    retriever = vector_sto.as_retriever(search_type="mmr", search_kwargs={'k': 3})
-    rag_chain = create_rag_chain(retriever)
-    answer = ""  # Initialize an empty string to collect chunks
-    question = "Give me answer in detail in 4-5 line" + question
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of model tokens in text."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def fits_context_budget(chunks: List[str], budget_tokens: Optional[int] = None) -> bool:
+    """
+    Check whether all chunks together fit the direct-context token budget.
+
+    Args:
+        chunks: The texts that would be placed in the prompt.
+        budget_tokens: Token budget, defaults to CONTEXT_BUDGET_TOKENS.
+
+    Returns:
+        True if the chunks can be stuffed into the prompt without retrieval.
+    """
+    if budget_tokens is None:
+        budget_tokens = CONTEXT_BUDGET_TOKENS
+    return sum(estimate_tokens(chunk) for chunk in chunks) <= budget_tokens
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """
+    Split text into pieces of at most max_chars, preferring paragraph and line breaks.
+
+    Args:
+        text: The text to split.
+        max_chars: Maximum length of a piece.
+
+    Returns:
+        List of text pieces.
+    """
+    pieces = []
+    current = ""
+    for block in re.split(r"(\n\s*\n|\n)", text):
+        while len(block) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(block[:max_chars])
+            block = block[max_chars:]
+        if len(current) + len(block) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += block
+    if current.strip():
+        pieces.append(current)
+    return [piece for piece in pieces if piece.strip()]
+
+def rag_chain_factory(chunks: List[str]):
+    """
+    Return a callable that builds the RAG chain over chunks on first use.
+
+    When the chunks fit the context budget they are put directly into the
+    prompt, skipping embedding and retrieval. Larger inputs are split so that
+    the retrieved top-k still fits the budget, embedded and retrieved with MMR.
+    Cached answers do not need the chain at all, so building it is deferred
+    until the first cache miss.
+
+    Args:
+        chunks: The texts to answer from.
+
+    Returns:
+        A zero-argument callable returning the (memoized) RAG chain.
+    """
+    rag_chain = None
+
+    def get_chain():
+        nonlocal rag_chain
+        if rag_chain is None:
+            if fits_context_budget(chunks):
+                context = "\n\n".join(chunks)
+                rag_chain = create_rag_chain(lambda _: context)
+            else:
+                k = 3
+                max_chars = CONTEXT_BUDGET_TOKENS * CHARS_PER_TOKEN // k
+                pieces = [piece for chunk in chunks for piece in split_text(chunk, max_chars)]
+                vector_sto = setup_vector_store(pieces)
+                retriever = vector_sto.as_retriever(search_type="mmr", search_kwargs={'k': k})
+
+                def retrieve(query):
+                    with timed("retrieval"):
+                        return retriever.invoke(query)
+
+                rag_chain = create_rag_chain(retrieve)
+        return rag_chain
+
+    return get_chain
+
+def _split_chain(rag_chain) -> Tuple[Any, BaseChatModel]:
+    """Return (runnable producing the prompt, chat model) of a chain built by create_rag_chain."""
+    steps = rag_chain.steps
+    position = next(i for i, step in enumerate(steps) if isinstance(step, BaseChatModel))
+    prompt = steps[0]
+    for step in steps[1:position]:
+        prompt = prompt | step
+    return prompt, steps[position]
+
+def stream_answer(rag_chain, question: str, stop: Optional[StopConditions] = None) -> Iterator[str]:
+    """
+    Stream the answer to a question with <think> content removed as it arrives.
+
+    The prompt (with its retrieved context) is built first and the model's own
+    stream is read directly: closing a stream of the whole chain waits for the
+    generation to finish, closing the model's stream drops the HTTP connection
+    and makes Ollama cancel it. So when a stop condition is met the rest of the
+    generation is not paid for, and for models without a <think> section the
+    conditions are also passed to Ollama (num_predict, stop). The generation
+    holds an LLM scheduler slot until the stream ends.
+
+    Args:
+        rag_chain: The RAG chain to ask.
+        question: The question to ask.
+        stop: Optional stop conditions for this call.
+
+    Yields:
+        Pieces of answer text.
+    """
+    stream_filter = ThinkStreamFilter(stop)
+    prompt, model = _split_chain(rag_chain)
+    prompt_value = prompt.invoke(question)
+    options = stop.model_options() if stop is not None and not OLLAMA_THINKING_MODEL else {}
+    with get_scheduler().slot():
+        started = time.perf_counter()
+        first_token = None
+        filter_seconds = 0.0
+        stream = model.stream(prompt_value, options=options) if options else model.stream(prompt_value)
+        emitted = ""
+        try:
+            for chunk in stream:
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                filter_started = time.perf_counter()
+                piece = stream_filter.feed(chunk.content)
+                filter_seconds += time.perf_counter() - filter_started
+                if piece:
+                    emitted += piece
+                    yield piece
+                if stream_filter.done:
+                    break
+            # Text held back as a possible tag prefix (e.g. a trailing "<") is only released by finish()
+            answer, emitted = stream_filter.finish(), emitted.lstrip()
+            if len(answer) > len(emitted) and answer.startswith(emitted):
+                yield answer[len(emitted):]
+        finally:
+            stream.close()
+            if first_token is not None:
+                record("first_token", first_token)
+            record("generation", time.perf_counter() - started - filter_seconds)
+            record("post_processing", filter_seconds)
+
+def ask_rag_chain(get_chain, question: str, context: str, use_cache: bool = True,
+                  stop: Optional[StopConditions] = None, on_token: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Ask a question through the RAG chain and return the cleaned answer.
+
+    Answers are served from the response cache when the same question was
+    already asked over the same context with the same model and prompt.
+
+    Args:
+        get_chain: Callable returning the RAG chain (see rag_chain_factory).
+        question: The question to ask.
+        context: The full context the chain answers from, used for the cache key.
+        use_cache: Whether to read and write the response cache.
+        stop: Optional stop conditions that end the generation early.
+        on_token: Optional callback receiving answer text as it streams in.
+
+    Returns:
+        The cleaned response from the RAG chain.
+    """
+    cache = get_response_cache()
+    cache_question = f"{question}\x1e{stop.cache_tag()}" if stop else question
+    key = cache.make_key(MODEL_NAME, PROMPT_VERSION, cache_question, context)
+    if use_cache:
+        with timed("cache_lookup"):
+            cached = cache.get(key)
+        if cached is not None:
+            print(f"Question (cached): {question}")
+            if on_token:
+                on_token(cached)
+            return cached
+
     print(f"Question: {question}")
+    answer = ""  # Initialize an empty string to collect chunks
+    for piece in stream_answer(get_chain(), question, stop):
+        answer += piece  # Append each piece of the answer
+        if on_token:
+            on_token(piece)
+    cleaned_response = answer.strip()
+    if use_cache:
+        cache.set(key, cleaned_response)
+    return cleaned_response
+
+_mailbox_index = None
+_mailbox_index_lock = threading.Lock()
+
+def get_mailbox_index() -> MailboxIndex:
+    """Return the process-wide mailbox index, creating it on first use."""
+    global _mailbox_index
+    with _mailbox_index_lock:
+        if _mailbox_index is None:
+            _mailbox_index = MailboxIndex(
+                OllamaEmbeddings(model=EMBEDDING_MODEL_NAME, base_url=OLLAMA_BASE_URL, keep_alive=OLLAMA_KEEP_ALIVE)
+            )
+        return _mailbox_index
+
+_index_refresh_thread = None
+_index_refresh_lock = threading.Lock()
+
+def refresh_mailbox_index_in_background() -> None:
+    """
+    Index newly stored emails in a background thread, unless a refresh is already running.
+
+    Used by the chatbot, which answers from the emails indexed so far instead
+    of waiting for new ones to be embedded.
+    """
+    global _index_refresh_thread
+
+    def refresh():
+        try:
+            index = get_mailbox_index()
+            if index.refresh(db):
+                index.save()
+        except Exception as e:
+            logging.error(f"Error refreshing mailbox index: {e}")
+        finally:
+            db.remove()
+
+    with _index_refresh_lock:
+        if _index_refresh_thread is None or not _index_refresh_thread.is_alive():
+            _index_refresh_thread = threading.Thread(target=refresh, daemon=True)
+            _index_refresh_thread.start()
 
-    for chunk in rag_chain.stream(question):
-            answer += chunk  # Append each chunk to the answer
-    cleaned_response = clean_response(answer)  # Clean the response
+def chatbot_interaction(question: str, sender: Optional[str] = None, date_from: Optional[datetime] = None,
+                        date_to: Optional[datetime] = None, priority: Optional[str] = None, k: int = 5) -> str:
+    """
+    Answer a question about the mailbox using hybrid retrieval over all stored emails.
+
+    Args:
+        question: The user's question.
+        sender: Only use emails whose sender contains this text.
+        date_from: Only use emails sent at or after this time.
+        date_to: Only use emails sent at or before this time.
+        priority: Only use emails with this priority.
+        k: Number of email chunks to answer from.
+
+    Returns:
+        The cleaned response from the RAG chain.
+    """
+    chunks = []
+    try:
+        index = get_mailbox_index()
+        refresh_mailbox_index_in_background()
+        with timed("retrieval"):
+            hits = index.search(question, k=k, sender=sender, date_from=date_from, date_to=date_to, priority=priority)
+        chunks = [format_chunk(hit) for hit in hits]
+    except Exception as e:
+        logging.error(f"Error searching mailbox: {e}")
+    if not chunks:
+        chunks = [question]
+
+    get_chain = rag_chain_factory(chunks)
+    context = "\n\n".join(chunks)
+    question = "Give me answer in detail in 4-5 line" + question
+    cleaned_response = ask_rag_chain(get_chain, question, context)
     print(f"\n\nExtracted Questions: {cleaned_response}")
     return cleaned_response  # Return the cleaned response
 
 
-def chat_model(email_id: int, question: str) -> str:
+def format_email_context(subject: str, body: str) -> str:
+    """Render an email as the context text given to the RAG chain."""
+    return f"email subject: {subject}\nemail body: {body}"
+
+def chat_model(email_id: int, question: str, stop: Optional[StopConditions] = None) -> str:
     """
     Process a question using the RAG chain and return the cleaned response.
 
     Args:
         email_id: The ID of the email being processed.
         question: The question to ask the RAG chain.
+        stop: Optional stop conditions, e.g. stream_filter.YES_NO for yes/no questions.
 
     Returns:
         The cleaned response from the RAG chain.
+
+    Raises:
+        DeadlineExceeded: If the llm_context deadline passed before a model slot was free.
     """
     try:
-        # Set up database connection
-        engine = create_engine(settings.DATABASE_URL)
-        Session = sessionmaker(bind=engine)
-        session = Session()
-
-
+        # Use the shared scoped session instead of creating an engine per question
+        session = db
 
         email_data = get_email_from_db(session, email_id)
         if not email_data:
@@ -115,20 +426,15 @@ def chat_model(email_id: int, question: str) -> str:
             return
 
         logging.info(f"Processing email: {email_data['subject']}")
-        data = f"email subject: {email_data['subject']}\nemail body: {email_data['body']}"
-
+        data = format_email_context(email_data['subject'], email_data['body'])
 
-        vector_sto = setup_vector_store([data])
-        retriever = vector_sto.as_retriever(search_type="mmr", search_kwargs={'k': 3})
-        rag_chain = create_rag_chain(retriever)
-        answer = ""  # Initialize an empty string to collect chunks
-        print(f"Question: {question}")
 
-        for chunk in rag_chain.stream(question):
-            answer += chunk  # Append each chunk to the answer
-        cleaned_response = clean_response(answer)  # Clean the response
+        cleaned_response = ask_rag_chain(rag_chain_factory([data]), question, data, stop=stop)
         print(f"\n\nExtracted Questions: {cleaned_response}")
         return cleaned_response  # Return the cleaned response
+    except DeadlineExceeded:
+        # The caller tells the user the model is busy
+        raise
     except Exception as e:
         print(f"Error processing question: {e}")
         return "Error processing question"
@@ -158,39 +464,199 @@ def chat_model(email_id: int, question: str) -> str:
 #     except Exception as e:
 #         print(f"Error extracting questions: {e}")
 
-def extract_meeting_details(data: str) -> str :
+MEETING_QUESTIONS = {
+    "summary": "What is the agenda of the meeting?",
+    "location": "What is the location of the meeting?",
+    "description": "What is the description of the meeting?",
+    "start_date": "What is the start date of the meeting? Please send reply in dd-mm-yyyy format in one word only.If date is not present then find out day of the week and send reply in one word only.",
+    "start_time": "What is the start time of the meeting?Please send reply in hh:mm am/pm format in one word only",
+    "end_date": "What is the end date of the meeting? Please send reply in dd-mm-yyyy format in one word only",
+    "end_time": "What is the end time of the meeting? Please send reply in hh:mm am/pm format in one word only.",
+    "attendees": "Who is/are the attendees of the meeting? If there are multiple attendees, please separate them with commas.If attendees email id is present then please send email id of attendees in one word, If not then please send name of attendees separeted with comma in 2 words.",
+}
+
+MEETING_JSON_QUESTION = """Extract the meeting details from the email and reply with one JSON object only, no other text.
+Use exactly these keys:
+"summary": agenda of the meeting,
+"location": location of the meeting,
+"description": description of the meeting,
+"start_date": start date in dd-mm-yyyy format, or the day of the week if no date is given,
+"start_time": start time in hh:mm am/pm format,
+"end_date": end date in dd-mm-yyyy format,
+"end_time": end time in hh:mm am/pm format,
+"attendees": attendee email ids (or names if no email id is present) separated with commas.
+Use an empty string for any detail that is not present in the email."""
+
+_DATE_VALUE = re.compile(
+    r"^(\d{1,2}[-/]\d{1,2}[-/]\d{2,4}|monday|tuesday|wednesday|thursday|friday|saturday|sunday)$",
+    re.IGNORECASE,
+)
+_TIME_VALUE = re.compile(r"^\d{1,2}(:\d{2})?\s*([ap]\.?m\.?)?$", re.IGNORECASE)
+
+# Field -> (validator pattern, required). Required fields are re-asked when empty.
+MEETING_FIELD_RULES = {
+    "summary": (None, False),
+    "location": (None, False),
+    "description": (None, False),
+    "start_date": (_DATE_VALUE, True),
+    "start_time": (_TIME_VALUE, True),
+    "end_date": (_DATE_VALUE, False),
+    "end_time": (_TIME_VALUE, False),
+    "attendees": (None, False),
+}
+
+
+def parse_meeting_json(response: str) -> Tuple[Dict[str, str], List[str]]:
     """
-    Extract meeting details such as agenda, location, description, start/end date and time, and attendees.
+    Parse and validate a JSON meeting-details answer from the model.
 
     Args:
-        rag_chain: The RAG chain to query for meeting details.
+        response: The raw response from the model.
 
     Returns:
-        A dictionary containing the extracted meeting details.
-    """
-    vector_sto = setup_vector_store([data])
-    retriever = vector_sto.as_retriever(search_type="mmr", search_kwargs={'k': 3})
-    rag_chain = create_rag_chain(retriever)
-
-    meeting_details = {}
-    questions = {
-        "summary": "What is the agenda of the meeting?",
-        "location": "What is the location of the meeting?",
-        "description": "What is the description of the meeting?",
-        "start_date": "What is the start date of the meeting? Please send reply in dd-mm-yyyy format in one word only.If date is not present then find out day of the week and send reply in one word only.",
-        "start_time": "What is the start time of the meeting?Please send reply in hh:mm am/pm format in one word only",
-        "end_date": "What is the end date of the meeting? Please send reply in dd-mm-yyyy format in one word only",
-        "end_time": "What is the end time of the meeting? Please send reply in hh:mm am/pm format in one word only.",
-        "attendees": "Who is/are the attendees of the meeting? If there are multiple attendees, please separate them with commas.If attendees email id is present then please send email id of attendees in one word, If not then please send name of attendees separeted with comma in 2 words.",
+        A tuple of (valid_fields, failed_fields). failed_fields lists the keys
+        that were missing, malformed or empty while required.
+    """
+    text = clean_response(response)
+    match = re.search(r"\{.*\}", text, flags=re.DOTALL)
+    try:
+        payload = json.loads(match.group()) if match else None
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return {}, list(MEETING_FIELD_RULES)
+
+    details = {}
+    failed = []
+    for key, (pattern, required) in MEETING_FIELD_RULES.items():
+        value = payload.get(key)
+        if isinstance(value, list):
+            value = ", ".join(str(item).strip() for item in value)
+        if not isinstance(value, str):
+            failed.append(key)
+            continue
+        value = value.strip()
+        if not value:
+            if required:
+                failed.append(key)
+            else:
+                details[key] = value
+            continue
+        if pattern is not None and not pattern.match(value):
+            failed.append(key)
+            continue
+        details[key] = value
+    return details, failed
+
+
+# Skip the model when the email states its date and time unambiguously.
+MEETING_RULES_FIRST = getattr(settings, "MEETING_RULES_FIRST", True)
+_SUBJECT_LINE = re.compile(r"^\s*(?:email\s+)?subject:\s*(.+)$", re.IGNORECASE | re.MULTILINE)
+_EMAIL_ADDRESS = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}")
+
+
+def datetime_fields(extracted: ExtractedDateTime) -> Dict[str, str]:
+    """
+    Format an extracted date and time as the start/end fields the model would answer.
+
+    Args:
+        extracted: Result of extract_datetime.
+
+    Returns:
+        Dictionary with start_date and start_time, plus end_date and end_time for a time range.
+    """
+    start = extracted.start.astimezone(pytz.timezone(CALENDAR_TIMEZONE))
+    fields = {"start_date": start.strftime("%d-%m-%Y"), "start_time": start.strftime("%I:%M %p")}
+    if extracted.end is not None:
+        end = extracted.end.astimezone(pytz.timezone(CALENDAR_TIMEZONE))
+        fields.update(end_date=end.strftime("%d-%m-%Y"), end_time=end.strftime("%I:%M %p"))
+    return fields
+
+
+def rule_based_meeting_details(data: str, extracted: ExtractedDateTime) -> Dict[str, str]:
+    """
+    Build meeting details without the model from a confident date and time.
+
+    Args:
+        data: The email content.
+        extracted: A confident result of extract_datetime for data.
+
+    Returns:
+        A meeting details dictionary in the format of the model's answer.
+    """
+    subject = _SUBJECT_LINE.search(data)
+    first_line = next((line.strip() for line in data.splitlines() if line.strip()), "")
+    details = {
+        "summary": (subject.group(1).strip() if subject else first_line)[:100],
+        "location": "",
+        "description": "",
+        "start_date": "",
+        "start_time": "",
+        "end_date": "",
+        "end_time": "",
+        "attendees": ", ".join(dict.fromkeys(_EMAIL_ADDRESS.findall(data))),
     }
+    details.update(datetime_fields(extracted))
+    return details
+
+
+def extract_meeting_details(data: str, structured: bool = True, source_id: Optional[str] = None,
+                            reference: Optional[datetime] = None) -> str :
+    """
+    Extract meeting details such as agenda, location, description, start/end date and time, and attendees.
 
-    for key, question in questions.items():
-        response = ""
-        print(f"Question: {question}")
+    The date and time are first read with the rule-based extractor; when it
+    is confident (an explicit date and an unambiguous time) the model is not
+    asked at all. Otherwise, in structured mode, all fields are requested in a
+    single JSON answer and only the fields that fail validation are re-asked
+    one question at a time.
+
+    Args:
+        data: The email content to extract the meeting details from.
+        structured: Ask for all fields in one JSON call before falling back
+            to per-field questions.
+        source_id: Message-ID of the email, so scheduling it twice does not
+            create a second event.
+        reference: Time relative dates ("tomorrow", "next Friday") are resolved
+            against, e.g. when the email was sent. Defaults to now.
+
+    Returns:
+        "success" once the details have been handed to process_meeting_email.
+    """
+    with timed("datetime_extraction"):
+        extracted = extract_datetime(data, reference)
+
+    if MEETING_RULES_FIRST and extracted and extracted.confident:
+        meeting_details = rule_based_meeting_details(data, extracted)
+        print(f"Rule-based extraction: {meeting_details}")
+        failed_fields = []
+    else:
+        get_chain = rag_chain_factory([data])
+
+        meeting_details = {}
+        failed_fields = list(MEETING_QUESTIONS)
+
+        if structured:
+            try:
+                response = ask_rag_chain(get_chain, MEETING_JSON_QUESTION, data)
+                meeting_details, failed_fields = parse_meeting_json(response)
+                print(f"Structured extraction: {meeting_details}, re-asking: {failed_fields}")
+            except Exception as e:
+                print(f"Error in structured meeting extraction: {e}")
+
+        # A date and time the rules found are better than re-asking the model for them
+        if extracted and extracted.has_date and extracted.has_time and (
+                "start_date" in failed_fields or "start_time" in failed_fields):
+            rule_fields = datetime_fields(extracted)
+            for key in ("start_date", "start_time"):
+                if key in failed_fields:
+                    meeting_details[key] = rule_fields[key]
+                    failed_fields.remove(key)
+
+    for key in failed_fields:
+        question = MEETING_QUESTIONS[key]
         try:
-            for chunk in rag_chain.stream(question):
-                response += chunk  # Append each chunk to the response
-            cleaned_response = clean_response(response)
+            cleaned_response = ask_rag_chain(get_chain, question, data)
             meeting_details[key] = cleaned_response.strip()  # Store the cleaned response
             print(f"{key.capitalize()}: {cleaned_response}")
         except Exception as e:
@@ -198,6 +664,10 @@ def extract_meeting_details(data: str) -> str :
             meeting_details[key] = "Error extracting information"
 
     print("\n\nExtracted Meeting Details:", meeting_details)
+    if source_id:
+        meeting_details["source_id"] = source_id
+    # Imported here so the chat and summary paths do not load the Google and Slack clients
+    from email_assistant.process_meeting_email import process_meeting_email
     process_meeting_email(meeting_details)
     return "success"
 
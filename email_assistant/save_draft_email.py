@@ -51,7 +51,7 @@ def create_draft(service, user_id, subject, body, recipient):
     except Exception as e:
         print(f"An error occurred: {e}")
 
-def save_draft_if_needed( agenda, drafted_email, recipient):
+def save_draft_if_needed( agenda, drafted_email, recipient, service=None):
     """
     Save the drafted email to Gmail's Drafts section if a reply is needed.
 
@@ -60,9 +60,11 @@ def save_draft_if_needed( agenda, drafted_email, recipient):
         agenda: The subject or agenda of the email.
         drafted_email: The drafted email body.
         recipient: The recipient of the email.
+        service: Gmail API service to use instead of authenticating (e.g. a local stand-in).
     """
     # Authenticate and initialize the Gmail API service
-    service = authenticate_gmail()
+    if service is None:
+        service = authenticate_gmail()
 
     # Save the draft
     create_draft(service, 'me', agenda, drafted_email, recipient)
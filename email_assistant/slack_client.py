@@ -0,0 +1,181 @@
+"""
+Shared Slack Web API clients.
+
+get_slack_client returns one process-wide WebClient whose calls go over a
+keep-alive httpx connection pool; slack_sdk's own transport (urllib) opens a
+new connection, and TLS handshake, for every call. The sync WebClient has no
+public transport hook, so the pool replaces one of its private methods; that
+is only done on the slack_sdk versions it was written against
+(SLACK_SDK_POOLED_VERSIONS, as pinned in requirements.txt), and any other
+version gets a plain WebClient. The bot token is checked
+lazily: slack_auth runs auth.test on first use and caches the answer for
+SLACK_AUTH_TTL seconds, or until a call fails with an authentication error.
+
+open_async_slack_client yields an AsyncWebClient whose calls share one
+aiohttp session, for asyncio code such as SlackDeliveryWorker.run_once_async.
+Both clients use SLACK_API_URL, so they can be pointed at a local stand-in.
+"""
+import contextlib
+import inspect
+import io
+import logging
+import re
+import threading
+import time
+from email.message import Message
+from typing import AsyncIterator, Dict, Optional
+from urllib.error import HTTPError
+from urllib.request import Request
+
+import httpx
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError, SlackRequestError
+from slack_sdk.version import __version__ as SLACK_SDK_VERSION
+
+from email_assistant.config import settings
+
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+SLACK_API_URL = getattr(settings, "SLACK_API_URL", "https://slack.com/api/")
+SLACK_HTTP_TIMEOUT = getattr(settings, "SLACK_HTTP_TIMEOUT", 30)
+SLACK_MAX_CONNECTIONS = getattr(settings, "SLACK_MAX_CONNECTIONS", 10)
+SLACK_AUTH_TTL = getattr(settings, "SLACK_AUTH_TTL", 3600)
+
+AUTH_ERRORS = {"not_authed", "invalid_auth", "token_revoked", "token_expired", "account_inactive"}
+
+# slack_sdk versions (lowest included, highest excluded) whose urllib transport PooledWebClient replaces
+SLACK_SDK_POOLED_VERSIONS = ((3, 19), (4, 0))
+
+
+def pooling_supported() -> bool:
+    """Check that the installed slack_sdk is one PooledWebClient's override was written against."""
+    version = tuple(int(part) for part in re.findall(r"\d+", SLACK_SDK_VERSION)[:2])
+    low, high = SLACK_SDK_POOLED_VERSIONS
+    method = getattr(WebClient, "_perform_urllib_http_request_internal", None)
+    return (low <= version < high and method is not None
+            and list(inspect.signature(method).parameters) == ["self", "url", "req"])
+
+
+class PooledWebClient(WebClient):
+    """WebClient sending its calls over a keep-alive httpx connection pool (thread-safe)."""
+
+    def __init__(self, *args, max_connections: int = SLACK_MAX_CONNECTIONS, **kwargs):
+        super().__init__(*args, **kwargs)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        # retries=1 reconnects once when a pooled connection turns out to be closed
+        transport = httpx.HTTPTransport(verify=self.ssl or True, proxy=self.proxy, limits=limits, retries=1)
+        self._http = httpx.Client(timeout=self.timeout, transport=transport)
+
+    def _perform_urllib_http_request_internal(self, url: str, req: Request) -> Dict:
+        # Same contract as slack_sdk's urllib transport: error statuses raise HTTPError,
+        # so its retry handlers and SlackResponse handling apply unchanged.
+        if not url.lower().startswith("http"):
+            raise SlackRequestError(f"Invalid URL detected: {url}")
+        # slack_sdk sets some header values as ints (Content-Length of file uploads), httpx only takes strings
+        headers = {name: str(value) for name, value in req.header_items()}
+        response = self._http.post(url, content=req.data, headers=headers)
+        if response.status_code >= 400:
+            headers = Message()
+            for name, value in response.headers.multi_items():
+                headers[name] = value
+            raise HTTPError(url, response.status_code, response.reason_phrase, headers, io.BytesIO(response.content))
+        gzip = response.headers.get("Content-Type", "").startswith("application/gzip")
+        return {"status": response.status_code, "headers": dict(response.headers),
+                "body": response.content if gzip else response.text}
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        self._http.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+_auth_result = None
+_auth_checked_at = None
+_auth_lock = threading.Lock()
+
+
+def get_slack_client() -> WebClient:
+    """
+    Return the process-wide Slack client, created on first use.
+
+    It is a PooledWebClient, or a plain WebClient if the installed slack_sdk
+    is not a version the pool supports.
+
+    Raises:
+        ValueError: If SLACK_BOT_TOKEN is not configured.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            if not settings.SLACK_BOT_TOKEN:
+                raise ValueError("Slack bot token not configured")
+            if pooling_supported():
+                _client = PooledWebClient(token=settings.SLACK_BOT_TOKEN, base_url=SLACK_API_URL,
+                                          timeout=SLACK_HTTP_TIMEOUT)
+            else:
+                logger.warning(f"⚠️ slack_sdk {SLACK_SDK_VERSION} is not supported by the pooled Slack client, "
+                               f"using a connection per call")
+                _client = WebClient(token=settings.SLACK_BOT_TOKEN, base_url=SLACK_API_URL,
+                                    timeout=SLACK_HTTP_TIMEOUT)
+        return _client
+
+
+def slack_auth(refresh: bool = False) -> Optional[Dict]:
+    """
+    Return the auth.test answer for the bot token (team, user, bot_id), checking it at most once per SLACK_AUTH_TTL.
+
+    Args:
+        refresh: Check again even if a cached answer is still fresh.
+
+    Returns:
+        The answer, or None if the token is rejected or Slack cannot be reached
+        (a rejection is cached like an answer, a network error is not).
+    """
+    global _auth_result, _auth_checked_at
+    with _auth_lock:
+        if not refresh and _auth_checked_at is not None and time.monotonic() - _auth_checked_at < SLACK_AUTH_TTL:
+            return _auth_result
+        try:
+            _auth_result = get_slack_client().auth_test().data
+            logger.info("✅ Slack authentication successful")
+        except SlackApiError as e:
+            _auth_result = None
+            logger.error(f"❌ Slack authentication failed: {str(e)}")
+        except Exception as e:
+            logger.error(f"❌ Slack authentication check failed: {str(e)}")
+            return None
+        _auth_checked_at = time.monotonic()
+        return _auth_result
+
+
+def invalidate_slack_auth() -> None:
+    """Forget the cached auth.test answer (after a call fails with an authentication error)."""
+    global _auth_result, _auth_checked_at
+    with _auth_lock:
+        _auth_result, _auth_checked_at = None, None
+
+
+@contextlib.asynccontextmanager
+async def open_async_slack_client(max_connections: int = SLACK_MAX_CONNECTIONS) -> AsyncIterator:
+    """
+    Yield an AsyncWebClient whose calls share one aiohttp session, closed on exit.
+
+    Args:
+        max_connections: Most connections the session opens.
+
+    Raises:
+        ValueError: If SLACK_BOT_TOKEN is not configured.
+    """
+    # aiohttp is only needed by asyncio callers
+    import aiohttp
+    from slack_sdk.web.async_client import AsyncWebClient
+
+    if not settings.SLACK_BOT_TOKEN:
+        raise ValueError("Slack bot token not configured")
+    connector = aiohttp.TCPConnector(limit=max_connections)
+    async with aiohttp.ClientSession(connector=connector,
+                                     timeout=aiohttp.ClientTimeout(total=SLACK_HTTP_TIMEOUT)) as session:
+        yield AsyncWebClient(token=settings.SLACK_BOT_TOKEN, base_url=SLACK_API_URL, session=session,
+                             timeout=SLACK_HTTP_TIMEOUT)
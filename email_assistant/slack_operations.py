@@ -3,10 +3,9 @@ Slack operations for sending notifications and messages.
 """
 import logging
 from email_assistant.config import settings
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
-from email_assistant.models import Email, db
-from datetime import datetime
+from email_assistant.models import db
+from email_assistant.slack_client import get_slack_client, slack_auth
+from email_assistant.slack_outbox import FAILED, enqueue, get_delivery_worker, important_email_text, start_slack_worker
 
 # Set up logging
 logging.basicConfig(
@@ -17,45 +16,65 @@ logger = logging.getLogger(__name__)
 
 class SlackOperations:
     def __init__(self):
-        """Initialize Slack client with bot token."""
-        if not settings.SLACK_BOT_TOKEN:
-            raise ValueError("Slack bot token not configured")
-
-        self.client = WebClient(token=settings.SLACK_BOT_TOKEN)
+        """Use the shared Slack client; the bot token is checked lazily (see verify)."""
+        self.client = get_slack_client()  # Raises ValueError if the bot token is not configured
         self.channel = settings.SLACK_CHANNEL
 
-        # Verify token and channel on initialization
-        try:
-            self.client.auth_test()
-            logger.info("✅ Slack authentication successful")
-        except SlackApiError as e:
-            logger.error(f"❌ Slack authentication failed: {str(e)}")
-            raise
+    def verify(self) -> bool:
+        """
+        Check the bot token with auth.test, answered from a cache shared by all instances.
+
+        Returns:
+            bool: True if Slack accepts the token, False otherwise
+        """
+        return slack_auth() is not None
 
     def send_message(self, message: str) -> bool:
         """
         Send a simple message to the configured Slack channel.
 
+        The message goes through the Slack outbox: it is delivered now if the
+        rate limits allow it, and otherwise (or after a transient error) by the
+        Slack delivery worker.
+
         Args:
             message: The message to send
 
         Returns:
-            bool: True if successful, False otherwise
+            bool: True if sent or queued for delivery, False otherwise
         """
-        try:
-            response = self.client.chat_postMessage(
-                channel=self.channel,
-                text=message
-            )
-            logger.info(f"✅ Message sent successfully: {message[:30]}...")
-            return True
-        except SlackApiError as e:
-            logger.error(f"❌ Error sending message: {str(e)}")
-            if e.response['error'] == 'not_authed':
-                logger.error("Please check your Slack bot token and permissions")
-            elif e.response['error'] == 'channel_not_found':
-                logger.error(f"Channel {self.channel} not found. Make sure the bot is invited to the channel")
+        row = enqueue(db, message, channel=self.channel)
+        if row is None:
             return False
+        return self._deliver(row) != FAILED
+
+    def forward_email(self, email_id: int, subject: str, summary: str) -> str:
+        """
+        Forward an email's summary to the configured Slack channel on request.
+
+        Unlike the automatic important-email notifications, every request is
+        sent (no once-per-email key) and never held for a digest.
+
+        Args:
+            email_id: ID of the email
+            subject: Subject of the email
+            summary: Summary of the email
+
+        Returns:
+            str: "sent", "failed", or another SlackDeliveryWorker.deliver outcome
+            if the message was queued for the Slack delivery worker
+        """
+        row = enqueue(db, important_email_text(subject, summary), channel=self.channel)
+        if row is None:
+            return FAILED
+        return self._deliver(row)
+
+    def _deliver(self, row) -> str:
+        status = get_delivery_worker().deliver(db, row)
+        if status in ("deferred", "retry"):
+            # Nothing else may be delivering the outbox in this process (e.g. the Streamlit app)
+            start_slack_worker()
+        return status
 
 
 
@@ -0,0 +1,536 @@
+"""
+Persistent, rate-limit-aware delivery of Slack messages.
+
+Messages are written to the slack_outbox table first (enqueue) and delivered
+by SlackDeliveryWorker, so nothing is lost when Slack is slow, rate limits
+us or the process restarts. The worker:
+
+- spaces calls per Slack rate tier (chat.postMessage: about one message per
+  second per channel; other methods by their tier's calls per minute), plus
+  SLACK_RATE_MARGIN. Booked slots only order the calls: a call starts once
+  the previous call of its method (and channel) has completed an interval
+  ago, so a busy event loop or slow requests cannot bunch calls at Slack;
+- honours Retry-After on HTTP 429 for the method (for chat.postMessage only
+  in that channel), without counting the 429 as a failed attempt; messages
+  whose booked slot falls in the blocked time are deferred, not sent;
+- retries transient errors with exponential backoff and jitter, up to
+  SLACK_MAX_ATTEMPTS, and fails permanent errors (unknown channel, bad
+  token) at once;
+- in digest mode (SLACK_DIGEST_WINDOW > 0 seconds) holds important-email
+  notifications and sends every one that arrived within the window as a
+  single message per channel.
+
+A sender claims a message (status "sending", with a lease of
+SLACK_CLAIM_LEASE seconds) with one conditional UPDATE before calling
+Slack, so the CLI worker and a Streamlit page never post the same message
+twice; a claim whose sender died expires with its lease.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+from email_assistant.config import settings
+from email_assistant.models import SlackOutbox, db
+from email_assistant.slack_client import AUTH_ERRORS, get_slack_client, invalidate_slack_auth
+
+logger = logging.getLogger(__name__)
+
+SLACK_DIGEST_WINDOW = getattr(settings, "SLACK_DIGEST_WINDOW", 0)
+SLACK_DIGEST_MAX = getattr(settings, "SLACK_DIGEST_MAX", 50)
+SLACK_MAX_ATTEMPTS = getattr(settings, "SLACK_MAX_ATTEMPTS", 8)
+SLACK_BACKOFF_BASE = getattr(settings, "SLACK_BACKOFF_BASE", 2)
+SLACK_BACKOFF_MAX = getattr(settings, "SLACK_BACKOFF_MAX", 300)
+SLACK_OUTBOX_BATCH = getattr(settings, "SLACK_OUTBOX_BATCH", 50)
+SLACK_WORKER_INTERVAL = getattr(settings, "SLACK_WORKER_INTERVAL", 5)
+# Seconds a claimed message is reserved for its sender (longer than a Slack call can take)
+SLACK_CLAIM_LEASE = getattr(settings, "SLACK_CLAIM_LEASE", 120)
+# Queue a notification for every email the enrichment marks important
+SLACK_NOTIFY_IMPORTANT = getattr(settings, "SLACK_NOTIFY_IMPORTANT", False)
+
+PENDING, SENDING, SENT, FAILED, DIGESTED = "pending", "sending", "sent", "failed", "digested"
+IMPORTANT_EMAIL, DIGEST = "important_email", "digest"
+
+# Calls per minute of Slack's rate tiers, and the tier of the methods we call.
+TIER_CALLS_PER_MINUTE = {1: 1, 2: 20, 3: 50, 4: 100}
+METHOD_TIERS = {"chat.update": 3, "chat.delete": 3, "conversations.list": 2, "conversations.history": 3,
+                "files.upload": 2, "auth.test": 4, "users.info": 4}
+# chat.postMessage has its own limit: about one message per second per channel.
+POST_MESSAGE_INTERVAL = 1.0
+# Fraction added to every interval, as calls arrive at Slack with their latency's jitter
+SLACK_RATE_MARGIN = getattr(settings, "SLACK_RATE_MARGIN", 0.2)
+# Seconds between checks while the previous call of a method (and channel) is in flight
+ADMIT_POLL_INTERVAL = 0.05
+
+RETRYABLE_ERRORS = {"ratelimited", "internal_error", "fatal_error", "service_unavailable", "request_timeout"}
+ERROR_HINTS = {
+    "not_authed": "Please check your Slack bot token and permissions",
+    "invalid_auth": "Please check your Slack bot token and permissions",
+    "channel_not_found": "Make sure the channel exists and the bot is invited to it",
+    "not_in_channel": "Make sure the bot is invited to the channel",
+}
+
+
+class SlackRateLimiter:
+    """Spacing of Slack API calls by method (and channel for chat.postMessage), plus Retry-After blocks."""
+
+    def __init__(self):
+        self._next_call = {}  # (method, channel) -> earliest monotonic time of the next call
+        self._blocked_until = {}  # (method, channel) -> monotonic time a 429 blocks it until
+        self._ready_at = {}  # (method, channel) -> completion of the last call plus its interval
+        self._in_flight = set()  # (method, channel) with a call in progress
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def interval(method: str) -> float:
+        """Seconds between two calls of a method, margin included."""
+        if method == "chat.postMessage":
+            return POST_MESSAGE_INTERVAL * (1 + SLACK_RATE_MARGIN)
+        return 60.0 / TIER_CALLS_PER_MINUTE[METHOD_TIERS.get(method, 3)] * (1 + SLACK_RATE_MARGIN)
+
+    @staticmethod
+    def _key(method: str, channel: Optional[str]) -> Tuple[str, Optional[str]]:
+        """chat.postMessage is limited per channel, other methods per workspace."""
+        return method, channel if method == "chat.postMessage" else None
+
+    def delay(self, method: str, channel: Optional[str] = None) -> float:
+        """Seconds to wait before calling method (0 if it can be called now)."""
+        key = self._key(method, channel)
+        now = time.monotonic()
+        with self._lock:
+            return max(self._next_call.get(key, 0.0) - now, self._blocked_until.get(key, 0.0) - now, 0.0)
+
+    def blocked(self, method: str, channel: Optional[str] = None) -> float:
+        """Seconds a Retry-After still blocks method (in channel for chat.postMessage)."""
+        with self._lock:
+            return max(self._blocked_until.get(self._key(method, channel), 0.0) - time.monotonic(), 0.0)
+
+    def reserve(self, method: str, channel: Optional[str] = None, max_wait: float = float("inf")) -> Optional[float]:
+        """
+        Book the next free call slot of method.
+
+        Returns:
+            Seconds until the booked slot, or None (nothing booked) if it is more than max_wait away.
+        """
+        key = self._key(method, channel)
+        now = time.monotonic()
+        with self._lock:
+            slot = max(now, self._next_call.get(key, 0.0), self._blocked_until.get(key, 0.0))
+            if slot - now > max_wait:
+                return None
+            self._next_call[key] = slot + self.interval(method)
+            return slot - now
+
+    def admit(self, method: str, channel: Optional[str] = None) -> float:
+        """
+        Start a call of method now if the previous one completed at least an interval ago.
+
+        Returns:
+            0 if the call may start (report its completion with finish), else seconds to wait
+            before asking again.
+        """
+        key = self._key(method, channel)
+        now = time.monotonic()
+        with self._lock:
+            if key in self._in_flight:
+                return ADMIT_POLL_INTERVAL
+            wait = max(self._ready_at.get(key, 0.0) - now, self._blocked_until.get(key, 0.0) - now)
+            if wait > 0:
+                return wait
+            self._in_flight.add(key)
+            return 0.0
+
+    def finish(self, method: str, channel: Optional[str] = None) -> None:
+        """Record the completion of a call started with admit."""
+        key = self._key(method, channel)
+        with self._lock:
+            self._in_flight.discard(key)
+            self._ready_at[key] = time.monotonic() + self.interval(method)
+            self._next_call[key] = max(self._next_call.get(key, 0.0), self._ready_at[key])
+
+    def block(self, method: str, seconds: float, channel: Optional[str] = None) -> None:
+        """Hold the calls of method (to channel for chat.postMessage) for seconds, after an HTTP 429."""
+        key = self._key(method, channel)
+        with self._lock:
+            self._blocked_until[key] = max(self._blocked_until.get(key, 0.0), time.monotonic() + seconds)
+
+
+def enqueue(session, text: str, channel: Optional[str] = None, method: str = "chat.postMessage",
+            kind: str = "message", dedupe_key: Optional[str] = None) -> Optional[SlackOutbox]:
+    """
+    Add a message to the outbox.
+
+    Args:
+        session: The database session to use.
+        text: Message text (Slack mrkdwn).
+        channel: Target channel, defaults to SLACK_CHANNEL.
+        method: Slack API method used to deliver it.
+        kind: "message", or "important_email" for notifications that digest mode may coalesce.
+        dedupe_key: Optional key; a second message with the same key is not queued again,
+            unless the first one failed (it is then queued again).
+
+    Returns:
+        The outbox row (the existing one for a repeated dedupe_key), or None if it could not be stored.
+    """
+    try:
+        if dedupe_key:
+            existing = session.query(SlackOutbox).filter_by(dedupe_key=dedupe_key).first()
+            if existing:
+                if existing.status == FAILED:
+                    existing.status, existing.attempts, existing.text = PENDING, 0, text
+                    existing.next_attempt_at = datetime.utcnow()
+                    session.commit()
+                return existing
+        row = SlackOutbox(method=method, channel=channel or settings.SLACK_CHANNEL, kind=kind, text=text,
+                          dedupe_key=dedupe_key, status=PENDING, attempts=0, next_attempt_at=datetime.utcnow())
+        session.add(row)
+        session.commit()
+        return row
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Error queueing Slack message: {str(e)}")
+        return None
+
+
+def important_email_text(subject: str, summary: str) -> str:
+    """Format the notification of an important email: subject on the first line, summary below."""
+    return f"📧 *{subject.strip() or '(no subject)'}*\n{(summary or '').strip()}"
+
+
+def notify_important_email(session, email_id: int, subject: str, summary: str,
+                           channel: Optional[str] = None) -> Optional[SlackOutbox]:
+    """
+    Queue the notification of an important email, once per email.
+
+    Args:
+        session: The database session to use.
+        email_id: ID of the email.
+        subject: Subject of the email.
+        summary: Summary of the email.
+        channel: Target channel, defaults to SLACK_CHANNEL.
+
+    Returns:
+        The outbox row, or None if it could not be stored.
+    """
+    return enqueue(session, important_email_text(subject, summary), channel=channel, kind=IMPORTANT_EMAIL,
+                   dedupe_key=f"important:{email_id}")
+
+
+def digest_text(rows: List[SlackOutbox]) -> str:
+    """Combine important-email notifications into one message."""
+    if len(rows) == 1:
+        return rows[0].text
+    lines = [f"📬 *{len(rows)} important emails*"]
+    for row in rows:
+        subject, _, summary = row.text.partition("\n")
+        summary = " ".join(summary.split())
+        lines.append(f"• {subject.replace('📧 ', '', 1)}" + (f" — {summary[:200]}" if summary else ""))
+    return "\n".join(lines)
+
+
+def _error_details(error: Exception) -> Tuple[Optional[int], str, Optional[float]]:
+    """Return (HTTP status, Slack error code, Retry-After seconds) of a failed call."""
+    if isinstance(error, SlackApiError):
+        response = error.response
+        retry_after = response.headers.get("Retry-After") or response.headers.get("retry-after")
+        try:
+            code = response.get("error", "") or ""
+        except AttributeError:
+            code = ""
+        return response.status_code, code, float(retry_after) if retry_after else None
+    return None, type(error).__name__, None
+
+
+class SlackDeliveryWorker:
+    """Delivers the Slack outbox, respecting rate limits."""
+
+    def __init__(self, client: Optional[WebClient] = None, limiter: Optional[SlackRateLimiter] = None,
+                 digest_window: float = SLACK_DIGEST_WINDOW, max_wait: float = POST_MESSAGE_INTERVAL):
+        """
+        Args:
+            client: Slack WebClient, the shared one (get_slack_client) if omitted.
+            limiter: Rate limiter shared by everything that calls Slack.
+            digest_window: Seconds important-email notifications are held and coalesced; 0 sends them one by one.
+            max_wait: Longest the worker sleeps for the rate limiter before moving a message to a later run.
+        """
+        self._client = client
+        self.limiter = limiter or SlackRateLimiter()
+        self.digest_window = digest_window
+        self.max_wait = max_wait
+        self.counters = defaultdict(int)
+
+    @property
+    def client(self) -> WebClient:
+        return self._client or get_slack_client()
+
+    def run_once(self, session, limit: int = SLACK_OUTBOX_BATCH) -> Dict[str, int]:
+        """
+        Build due digests and deliver up to limit due messages, oldest first.
+
+        Args:
+            session: The database session to use.
+            limit: Most messages delivered in this run.
+
+        Returns:
+            Count of delivered, retried, failed and deferred messages in this run.
+        """
+        outcomes = defaultdict(int)
+        try:
+            for row in self._due(session, limit):
+                outcomes[self.deliver(session, row)] += 1
+        except Exception as e:
+            session.rollback()
+            logger.error(f"❌ Error delivering Slack outbox: {str(e)}")
+        return dict(outcomes)
+
+    def deliver(self, session, row: SlackOutbox) -> str:
+        """
+        Try to deliver one outbox message now and record the outcome.
+
+        Returns:
+            "sent", "retry" (kept for a later attempt), "deferred" (rate limited, not attempted),
+            "held" (waiting for its digest), "sending" (claimed by another sender) or "failed".
+        """
+        outcome, wait = self._book(session, row)
+        if outcome:
+            return outcome
+        if wait:
+            time.sleep(wait)
+        while True:
+            if self.limiter.blocked(row.method, row.channel):
+                return self._defer(session, row)
+            wait = self.limiter.admit(row.method, row.channel)
+            if not wait:
+                break
+            time.sleep(wait)
+        try:
+            self.client.api_call(row.method, json={"channel": row.channel, "text": row.text})
+        except Exception as e:
+            self.limiter.finish(row.method, row.channel)
+            return self._record(session, row, e)
+        self.limiter.finish(row.method, row.channel)
+        return self._record(session, row)
+
+    async def deliver_async(self, session, row: SlackOutbox, client) -> str:
+        """
+        Try to deliver one outbox message now with an AsyncWebClient (see slack_client.open_async_slack_client).
+
+        Returns:
+            The outcome, as for deliver.
+        """
+        outcome, wait = self._book(session, row)
+        if outcome:
+            return outcome
+        if wait:
+            await asyncio.sleep(wait)
+        while True:
+            if self.limiter.blocked(row.method, row.channel):
+                return self._defer(session, row)
+            wait = self.limiter.admit(row.method, row.channel)
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+        try:
+            await client.api_call(row.method, json={"channel": row.channel, "text": row.text})
+        except Exception as e:
+            self.limiter.finish(row.method, row.channel)
+            return self._record(session, row, e)
+        self.limiter.finish(row.method, row.channel)
+        return self._record(session, row)
+
+    async def run_once_async(self, session, client, limit: int = SLACK_OUTBOX_BATCH) -> Dict[str, int]:
+        """
+        Like run_once, but with messages to different channels delivered concurrently.
+
+        Args:
+            session: The database session to use.
+            client: AsyncWebClient to deliver with.
+            limit: Most messages delivered in this run.
+
+        Returns:
+            Count of delivered, retried, failed and deferred messages in this run.
+        """
+        outcomes = defaultdict(int)
+        try:
+            rows = self._due(session, limit)
+            # Call slots are booked in row order before the first await, so each channel keeps its order
+            for outcome in await asyncio.gather(*(self.deliver_async(session, row, client) for row in rows)):
+                outcomes[outcome] += 1
+        except Exception as e:
+            session.rollback()
+            logger.error(f"❌ Error delivering Slack outbox: {str(e)}")
+        return dict(outcomes)
+
+    def _due(self, session, limit: int) -> List[SlackOutbox]:
+        """Build due digests and return up to limit messages due for delivery, oldest first."""
+        self._build_digests(session)
+        # A message still "sending" after its lease was claimed by a sender that died
+        query = session.query(SlackOutbox).filter(
+            SlackOutbox.status.in_((PENDING, SENDING)), SlackOutbox.next_attempt_at <= datetime.utcnow())
+        if self.digest_window:
+            query = query.filter(SlackOutbox.kind != IMPORTANT_EMAIL)
+        return query.order_by(SlackOutbox.id).limit(limit).all()
+
+    def _book(self, session, row: SlackOutbox) -> Tuple[Optional[str], float]:
+        """Return (outcome, 0) if row is not to be sent now, else (None, seconds until its booked call slot)."""
+        if row.status not in (PENDING, SENDING):
+            return row.status, 0.0
+        if self.digest_window and row.kind == IMPORTANT_EMAIL:
+            return "held", 0.0
+        if not self._claim(session, row):
+            return SENDING, 0.0
+        wait = self.limiter.reserve(row.method, row.channel, self.max_wait)
+        if wait is None:
+            return self._defer(session, row), 0.0
+        return None, wait
+
+    def _defer(self, session, row: SlackOutbox) -> str:
+        """Release a claimed message until the rate limiter lets its method (and channel) through."""
+        row.status = PENDING
+        row.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.limiter.delay(row.method, row.channel))
+        session.commit()
+        self.counters["deferred"] += 1
+        return "deferred"
+
+    @staticmethod
+    def _claim(session, row: SlackOutbox) -> bool:
+        """Atomically take a due message for this sender; False if another sender has it or it is not due."""
+        now = datetime.utcnow()
+        claimed = session.query(SlackOutbox).filter(
+            SlackOutbox.id == row.id, SlackOutbox.status.in_((PENDING, SENDING)), SlackOutbox.next_attempt_at <= now,
+        ).update({"status": SENDING, "next_attempt_at": now + timedelta(seconds=SLACK_CLAIM_LEASE)},
+                 synchronize_session=False)
+        session.commit()
+        return claimed == 1
+
+    def _record(self, session, row: SlackOutbox, error: Optional[Exception] = None) -> str:
+        """Store the outcome of a delivery attempt."""
+        if error is not None:
+            outcome = self._failed(row, error)
+        else:
+            row.status, row.sent_at, row.last_error = SENT, datetime.utcnow(), None
+            if row.kind == DIGEST:
+                session.query(SlackOutbox).filter_by(digest_id=row.id).update({"sent_at": row.sent_at})
+            outcome = SENT
+            logger.info(f"✅ Slack message sent: {row.text[:30]}...")
+        session.commit()
+        self.counters[outcome] += 1
+        return outcome
+
+    def _failed(self, row: SlackOutbox, error: Exception) -> str:
+        status, code, retry_after = _error_details(error)
+        row.last_error = f"{code}: {str(error)}"[:1000]
+        if status == 429:
+            # Rate limited: the message did nothing wrong, so this is not a failed attempt
+            seconds = retry_after or 30.0
+            self.limiter.block(row.method, seconds, row.channel)
+            row.status = PENDING
+            row.next_attempt_at = datetime.utcnow() + timedelta(seconds=seconds)
+            logger.warning(f"⚠️ Slack rate limited {row.method}, retrying in {seconds:.0f}s")
+            return "retry"
+
+        row.attempts += 1
+        retryable = status is None or status >= 500 or code in RETRYABLE_ERRORS
+        if not retryable or row.attempts >= SLACK_MAX_ATTEMPTS:
+            row.status = FAILED
+            logger.error(f"❌ Error sending Slack message: {str(error)}")
+            if code in ERROR_HINTS:
+                logger.error(f"{ERROR_HINTS[code]} (channel {row.channel})")
+            if code in AUTH_ERRORS:
+                invalidate_slack_auth()
+            return FAILED
+        delay = min(SLACK_BACKOFF_BASE * 2 ** (row.attempts - 1), SLACK_BACKOFF_MAX) * (0.5 + random.random() / 2)
+        row.status = PENDING
+        row.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        logger.warning(f"⚠️ Slack delivery failed ({code}), attempt {row.attempts}, retrying in {delay:.0f}s")
+        return "retry"
+
+    def _build_digests(self, session) -> int:
+        """Replace held important-email notifications whose window has passed with digest messages."""
+        if not self.digest_window:
+            return 0
+        cutoff = datetime.utcnow() - timedelta(seconds=self.digest_window)
+        held = session.query(SlackOutbox).filter_by(status=PENDING, kind=IMPORTANT_EMAIL) \
+            .order_by(SlackOutbox.id).all()
+        by_channel = defaultdict(list)
+        for row in held:
+            by_channel[row.channel].append(row)
+
+        digests = 0
+        for channel, rows in by_channel.items():
+            # The window opens with the oldest held notification of the channel
+            if rows[0].created_at > cutoff:
+                continue
+            for offset in range(0, len(rows), SLACK_DIGEST_MAX):
+                members = rows[offset:offset + SLACK_DIGEST_MAX]
+                digest = SlackOutbox(method="chat.postMessage", channel=channel, kind=DIGEST,
+                                     text=digest_text(members), status=PENDING, attempts=0,
+                                     next_attempt_at=datetime.utcnow())
+                session.add(digest)
+                session.flush()
+                for row in members:
+                    row.status, row.digest_id = DIGESTED, digest.id
+                digests += 1
+        if digests:
+            session.commit()
+            logger.info(f"Coalesced {len(held)} important-email notifications into {digests} Slack digests")
+        return digests
+
+    def stats(self, session) -> Dict[str, int]:
+        """Return the number of outbox rows per status."""
+        from sqlalchemy import func
+
+        return dict(session.query(SlackOutbox.status, func.count(SlackOutbox.id)).group_by(SlackOutbox.status).all())
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_delivery_worker() -> SlackDeliveryWorker:
+    """Return the process-wide delivery worker (one rate limiter for the whole process)."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = SlackDeliveryWorker()
+        return _worker
+
+
+_worker_thread = None
+_worker_thread_lock = threading.Lock()
+
+
+def start_slack_worker(check_interval=SLACK_WORKER_INTERVAL):
+    """
+    Start a background thread that delivers the Slack outbox, unless this process already runs one.
+
+    Args:
+        check_interval: Time in seconds between deliveries of due messages.
+    """
+    global _worker_thread
+
+    def worker_thread():
+        logger.info(f"Starting Slack delivery worker (checking every {check_interval} seconds)")
+        worker = get_delivery_worker()
+        while True:
+            try:
+                worker.run_once(db)
+            except Exception as e:
+                logger.error(f"❌ Error in Slack delivery worker: {str(e)}")
+            finally:
+                db.remove()
+            time.sleep(check_interval)
+
+    with _worker_thread_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(target=worker_thread, daemon=True)
+            _worker_thread.start()
+            logger.info("✅ Slack delivery worker started")
+        return _worker_thread
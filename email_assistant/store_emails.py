@@ -3,6 +3,9 @@ Script to read emails from Gmail and store them in the database.
 """
 from email_assistant.models import Email
 from email_assistant.config import settings
+from email_assistant.classifier import IMPORTANT_KEYWORDS, NO_RESPONSE_KEYWORDS
+from email_assistant.near_duplicates import register_email
+from email_assistant.attachments import save_attachment
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import imaplib
@@ -52,12 +55,11 @@ def analyze_email_content(subject: str, body: str) -> Dict[str, Any]:
     }
 
     # Check for importance indicators
-    important_keywords = ['urgent', 'important', 'asap', 'critical', 'emergency']
     subject_lower = subject.lower()
     body_lower = body.lower()
 
     # Check for priority
-    if any(keyword in subject_lower or keyword in body_lower for keyword in important_keywords):
+    if any(keyword in subject_lower or keyword in body_lower for keyword in IMPORTANT_KEYWORDS):
         analysis['is_important'] = True
         analysis['priority'] = 'high'
 
@@ -76,8 +78,7 @@ def analyze_email_content(subject: str, body: str) -> Dict[str, Any]:
             break
 
     # Check for no-response indicators
-    no_response_keywords = ['no reply needed', 'no response required', 'for your information', 'fyi', 'notification']
-    if any(keyword in subject_lower or keyword in body_lower for keyword in no_response_keywords):
+    if any(keyword in subject_lower or keyword in body_lower for keyword in NO_RESPONSE_KEYWORDS):
         analysis['no_response'] = True
 
     return analysis
@@ -118,13 +119,27 @@ def parse_email_message(msg) -> Dict[str, Any]:
         except:
             timestamp = datetime.now()
 
-        # Get email body
+        # Get email body and attachments (saved and parsed later, off the ingest path)
         body = ""
+        attachments = []
         if msg.is_multipart():
             for part in msg.walk():
-                if part.get_content_type() == "text/plain":
+                if part.is_multipart():
+                    continue
+                if part.get_filename() or part.get_content_disposition() == "attachment":
+                    payload = part.get_payload(decode=True)
+                    if payload:
+                        filename = part.get_filename() or "attachment"
+                        decoded = decode_header(filename)[0][0]
+                        if isinstance(decoded, bytes):
+                            decoded = decoded.decode(errors="replace")
+                        attachments.append({
+                            "filename": decoded,
+                            "content_type": part.get_content_type(),
+                            "data": payload,
+                        })
+                elif not body and part.get_content_type() == "text/plain":
                     body = part.get_payload(decode=True).decode()
-                    break
         else:
             body = msg.get_payload(decode=True).decode()
 
@@ -145,7 +160,8 @@ def parse_email_message(msg) -> Dict[str, Any]:
             "intent": analysis['intent'],
             "summary": analysis['summary'],
             "no_response": analysis['no_response'],
-            "status": "unread"
+            "status": "unread",
+            "attachments": attachments
         }
 
         return email_data
@@ -193,6 +209,8 @@ def store_emails(num_emails=50):
                     skipped_count += 1
                     continue
 
+                attachments = email_data.pop("attachments", [])
+
                 # Check if email already exists
                 existing = session.query(Email).filter_by(
                     message_id=email_data["message_id"]
@@ -203,6 +221,12 @@ def store_emails(num_emails=50):
                         # Create new email record
                         email_record = Email(**email_data)
                         session.add(email_record)
+                        session.flush()
+                        # Fingerprint it so near-duplicates can reuse an earlier analysis
+                        register_email(session, email_record)
+                        for attachment in attachments:
+                            save_attachment(session, email_record.id, attachment["filename"],
+                                            attachment["content_type"], attachment["data"])
                         session.commit()
                         stored_count += 1
                         logger.info(f"✅ Stored email: {email_data['subject']} (Sender: {email_data['sender']})")
@@ -0,0 +1,164 @@
+"""
+Incremental filtering of streamed model output.
+
+Reasoning models such as deepseek-r1 emit a <think>...</think> section before
+the answer. ThinkStreamFilter drops that section as chunks arrive, exposes the
+answer text live, and signals when a stop condition is met so the caller can
+close the stream and cancel the generation early.
+"""
+import re
+from typing import Any, Dict, Optional, Pattern, Union
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+# Tokens allowed beyond the answer limit for whitespace and a first word split into several tokens
+ANSWER_TOKEN_SLACK = 8
+_REGEX_SYNTAX = re.compile(r"[\\.^$*+?{}\[\]|()]")
+
+
+class StopConditions:
+    """Per-call conditions that end a streamed answer early."""
+
+    def __init__(self, max_answer_tokens: Optional[int] = None, first_word: bool = False,
+                 stop_pattern: Optional[Union[str, Pattern]] = None):
+        """
+        Args:
+            max_answer_tokens: Stop after this many answer chunks (one chunk is one token with Ollama).
+            first_word: Stop once the first complete word of the answer is known (yes/no prompts).
+            stop_pattern: Regex; the answer is cut where it first matches, like a stop sequence.
+        """
+        self.max_answer_tokens = max_answer_tokens
+        self.first_word = first_word
+        self.stop_pattern = re.compile(stop_pattern) if isinstance(stop_pattern, str) else stop_pattern
+
+    def cache_tag(self) -> str:
+        """Return a string identifying these conditions, for use in cache keys."""
+        pattern = self.stop_pattern.pattern if self.stop_pattern is not None else ""
+        return f"max={self.max_answer_tokens};first_word={self.first_word};stop={pattern}"
+
+    def model_options(self) -> Dict[str, Any]:
+        """
+        Return Ollama options that end the generation server-side where these conditions allow it.
+
+        Only valid for models without a <think> section, which would count
+        against num_predict and could contain the stop sequence.
+
+        Returns:
+            Options with "num_predict" and/or "stop", possibly empty.
+        """
+        options = {}
+        if self.max_answer_tokens is not None:
+            options["num_predict"] = self.max_answer_tokens + ANSWER_TOKEN_SLACK
+        elif self.first_word:
+            options["num_predict"] = ANSWER_TOKEN_SLACK
+        if self.stop_pattern is not None and not _REGEX_SYNTAX.search(self.stop_pattern.pattern):
+            options["stop"] = [self.stop_pattern.pattern]
+        return options
+
+
+# Answer only the first word of a yes/no style question.
+YES_NO = StopConditions(first_word=True)
+
+_FIRST_WORD = re.compile(r"^\s*([\w'-]+)(?=[^\w'-])")
+
+
+def _partial_tag_length(text: str, tag: str) -> int:
+    """Return the length of the longest suffix of text that is a proper prefix of tag."""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class ThinkStreamFilter:
+    """Strip <think> sections from a token stream and apply stop conditions incrementally."""
+
+    def __init__(self, stop: Optional[StopConditions] = None):
+        self.stop = stop or StopConditions()
+        self.done = False
+        self._in_think = False
+        self._pending = ""
+        self._answer = ""
+        self._answer_tokens = 0
+
+    @property
+    def answer(self) -> str:
+        """The answer text collected so far, without think content."""
+        return self._answer.strip()
+
+    def feed(self, chunk: str) -> str:
+        """
+        Consume one streamed chunk.
+
+        Args:
+            chunk: The next piece of raw model output.
+
+        Returns:
+            The new answer text contributed by this chunk (may be empty).
+        """
+        if self.done:
+            return ""
+        self._pending += chunk
+        emitted = ""
+        while self._pending:
+            if self._in_think:
+                end = self._pending.find(THINK_CLOSE)
+                if end == -1:
+                    keep = _partial_tag_length(self._pending, THINK_CLOSE)
+                    self._pending = self._pending[len(self._pending) - keep:]
+                    break
+                self._pending = self._pending[end + len(THINK_CLOSE):]
+                self._in_think = False
+            else:
+                start = self._pending.find(THINK_OPEN)
+                if start == -1:
+                    keep = _partial_tag_length(self._pending, THINK_OPEN)
+                    emitted += self._pending[:len(self._pending) - keep]
+                    self._pending = self._pending[len(self._pending) - keep:]
+                    break
+                emitted += self._pending[:start]
+                self._pending = self._pending[start + len(THINK_OPEN):]
+                self._in_think = True
+
+        if emitted:
+            return self._append(emitted)
+        return ""
+
+    def finish(self) -> str:
+        """
+        Flush any held-back text at the end of the stream.
+
+        Returns:
+            The final answer.
+        """
+        if not self.done and not self._in_think and self._pending:
+            self._append(self._pending)
+        self._pending = ""
+        if self.stop.first_word:
+            match = re.match(r"^\s*([\w'-]+)", self._answer)
+            if match:
+                self._answer = self._answer[:match.end(1)]
+        self.done = True
+        return self.answer
+
+    def _append(self, text: str) -> str:
+        before = len(self._answer)
+        self._answer += text
+        if text.strip():
+            self._answer_tokens += 1
+
+        stop = self.stop
+        if stop.stop_pattern is not None:
+            match = stop.stop_pattern.search(self._answer)
+            if match:
+                self._answer = self._answer[:match.start()]
+                self.done = True
+        if stop.first_word and not self.done:
+            match = _FIRST_WORD.match(self._answer)
+            if match:
+                self._answer = self._answer[:match.end(1)]
+                self.done = True
+        if stop.max_answer_tokens is not None and self._answer_tokens >= stop.max_answer_tokens:
+            self.done = True
+        return self._answer[before:]
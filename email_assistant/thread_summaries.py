@@ -0,0 +1,264 @@
+"""
+Incremental summaries of email threads.
+
+Every thread keeps one rolling summary. When a message arrives the summary is
+updated from the previous summary plus that message only, both capped in
+size, so the cost of a new message does not depend on the thread length.
+
+A thread without a summary yet (or whose summary is for an older model or
+prompt) is summarized with a map-reduce pass: fixed groups of messages are
+summarized separately and combined. Partial summaries are stored per group in
+ThreadSummaryPart, so rebuilding a long thread only summarizes groups that
+were not seen before.
+
+Threads are identified by the Message-ID of their first email, which is the
+first entry of the References header stored in Email.thread_id.
+"""
+import logging
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from email_assistant.config import settings
+from email_assistant.llm_scheduler import DeadlineExceeded
+from email_assistant.models import Email, ThreadSummary, ThreadSummaryPart
+from email_assistant.near_duplicates import strip_quoted_text
+from email_assistant.rag_setup import (
+    CHARS_PER_TOKEN,
+    CONTEXT_BUDGET_TOKENS,
+    MODEL_NAME,
+    PROMPT_VERSION,
+    ask_rag_chain,
+    rag_chain_factory,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bump the suffix whenever the questions below change so summaries are rebuilt.
+THREAD_SUMMARY_VERSION = f"{PROMPT_VERSION}.1"
+
+# Longest text of a single message given to the model (after removing quoted replies).
+THREAD_MESSAGE_CHARS = getattr(settings, "THREAD_MESSAGE_CHARS", 1500)
+# Longest stored summary; longer answers are cut at a sentence boundary.
+THREAD_SUMMARY_CHARS = getattr(settings, "THREAD_SUMMARY_CHARS", 1200)
+THREAD_SUMMARY_WORDS = THREAD_SUMMARY_CHARS // 8
+
+UPDATE_QUESTION = (
+    "Update the summary of this email thread with the new message. Keep every decision, request, date "
+    f"and open question from the summary so far. Reply with the updated summary only, at most {THREAD_SUMMARY_WORDS} words."
+)
+MAP_QUESTION = (
+    "Summarize this part of an email thread: who asked for what, decisions, dates and open questions. "
+    f"Reply with the summary only, at most {THREAD_SUMMARY_WORDS} words."
+)
+REDUCE_QUESTION = (
+    "These are summaries of consecutive parts of one email thread. Combine them into one summary of the "
+    f"whole thread in chronological order. Reply with the summary only, at most {THREAD_SUMMARY_WORDS} words."
+)
+
+_MESSAGE_ID = re.compile(r"<[^<>\s]+>")
+
+
+def thread_key(thread_id: str) -> str:
+    """Return the Message-ID of the thread's first email from a stored thread_id."""
+    match = _MESSAGE_ID.search(thread_id or "")
+    return match.group(0) if match else (thread_id or "").strip()
+
+
+def _budget_chars() -> int:
+    # Leave room for the question and prompt template.
+    return CONTEXT_BUDGET_TOKENS * CHARS_PER_TOKEN - 600
+
+
+def _map_group_size() -> int:
+    """Number of messages summarized together in the map step."""
+    return max(1, _budget_chars() // (THREAD_MESSAGE_CHARS + 100))
+
+
+def _cap(text: str, limit: int) -> str:
+    """Cut text to limit characters, preferring a sentence boundary."""
+    text = (text or "").strip()
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    boundary = max(cut.rfind(". "), cut.rfind("\n"))
+    return cut[:boundary + 1].strip() if boundary > limit // 2 else cut.strip()
+
+
+def format_message(email: Email) -> str:
+    """Render one message of a thread, without quoted replies, capped in size."""
+    body = _cap(strip_quoted_text(email.body), THREAD_MESSAGE_CHARS)
+    return f"From: {email.sender}\nDate: {email.timestamp}\nSubject: {email.subject}\n{body}"
+
+
+def _ask(question: str, context: str) -> str:
+    return ask_rag_chain(rag_chain_factory([context]), question, context)
+
+
+def thread_emails(session, key: str) -> List[Email]:
+    """Return the emails of a thread in arrival order."""
+    return (
+        session.query(Email)
+        .filter(Email.thread_id.startswith(key, autoescape=True))
+        .order_by(Email.id)
+        .all()
+    )
+
+
+class ThreadSummarizer:
+    """Maintains rolling thread summaries in the database."""
+
+    def __init__(self, session):
+        """
+        Args:
+            session: The database session to read emails and store summaries with.
+        """
+        self.session = session
+        self.counters = {"updates": 0, "map_calls": 0, "cached_parts": 0, "reduce_calls": 0}
+
+    def summarize(self, key: str) -> Optional[str]:
+        """
+        Bring the summary of a thread up to date and return it.
+
+        Args:
+            key: Thread key (see thread_key).
+
+        Returns:
+            The thread summary, or None if the thread has no emails.
+        """
+        row = self._summary_row(key)
+        if row is None:
+            emails = thread_emails(self.session, key)
+            if not emails:
+                return None
+            summary = self._map_reduce(key, emails)
+            row = ThreadSummary(thread_key=key, model=MODEL_NAME, prompt_version=THREAD_SUMMARY_VERSION,
+                                summary=summary, last_email_id=emails[-1].id, message_count=len(emails))
+            self.session.add(row)
+        else:
+            new_emails = (
+                self.session.query(Email)
+                .filter(Email.thread_id.startswith(key, autoescape=True), Email.id > row.last_email_id)
+                .order_by(Email.id)
+                .all()
+            )
+            for email in new_emails:
+                row.summary = self._update(row.summary, email)
+                row.last_email_id = email.id
+                row.message_count = (row.message_count or 0) + 1
+        try:
+            self.session.commit()
+        except IntegrityError:
+            # Another worker stored the same thread first; its summary is as good as ours.
+            self.session.rollback()
+            row = self._summary_row(key)
+        return row.summary if row else None
+
+    def _summary_row(self, key: str) -> Optional[ThreadSummary]:
+        return self.session.query(ThreadSummary).filter_by(
+            thread_key=key, model=MODEL_NAME, prompt_version=THREAD_SUMMARY_VERSION
+        ).first()
+
+    def _update(self, summary: str, email: Email) -> str:
+        """Fold one new message into the summary: constant-size input per message."""
+        self.counters["updates"] += 1
+        context = f"Summary so far:\n{_cap(summary, THREAD_SUMMARY_CHARS)}\n\nNew message:\n{format_message(email)}"
+        return _cap(_ask(UPDATE_QUESTION, context), THREAD_SUMMARY_CHARS)
+
+    def _map_reduce(self, key: str, emails: List[Email]) -> str:
+        group_size = _map_group_size()
+        parts = [self._part(key, emails[start:start + group_size]) for start in range(0, len(emails), group_size)]
+        return self._reduce(parts)
+
+    def _part(self, key: str, group: List[Email]) -> str:
+        """Summary of one group of messages, from the cache when the same group was summarized before."""
+        first_id, last_id = group[0].id, group[-1].id
+        cached = self.session.query(ThreadSummaryPart).filter_by(
+            thread_key=key, model=MODEL_NAME, prompt_version=THREAD_SUMMARY_VERSION,
+            first_email_id=first_id, last_email_id=last_id,
+        ).first()
+        if cached:
+            self.counters["cached_parts"] += 1
+            return cached.summary
+
+        self.counters["map_calls"] += 1
+        context = "\n\n---\n\n".join(format_message(email) for email in group)
+        summary = _cap(_ask(MAP_QUESTION, context), THREAD_SUMMARY_CHARS)
+        # Only complete groups are cached: a partial last group changes as the thread grows.
+        if len(group) == _map_group_size():
+            self.session.add(ThreadSummaryPart(
+                thread_key=key, model=MODEL_NAME, prompt_version=THREAD_SUMMARY_VERSION,
+                first_email_id=first_id, last_email_id=last_id, summary=summary,
+            ))
+        return summary
+
+    def _reduce(self, parts: List[str]) -> str:
+        """Combine partial summaries, in several rounds if they do not fit one prompt."""
+        fan_in = max(2, _budget_chars() // (THREAD_SUMMARY_CHARS + 20))
+        while len(parts) > 1:
+            combined = []
+            for start in range(0, len(parts), fan_in):
+                group = parts[start:start + fan_in]
+                if len(group) == 1:
+                    combined.append(group[0])
+                    continue
+                self.counters["reduce_calls"] += 1
+                context = "\n\n".join(f"Part {number}:\n{part}" for number, part in enumerate(group, 1))
+                combined.append(_cap(_ask(REDUCE_QUESTION, context), THREAD_SUMMARY_CHARS))
+            parts = combined
+        return parts[0] if parts else ""
+
+
+def summarize_thread(session, email_id: int) -> Optional[str]:
+    """
+    Return the up-to-date summary of the thread an email belongs to.
+
+    Args:
+        session: The database session to use.
+        email_id: The ID of any email in the thread.
+
+    Returns:
+        The thread summary, or None if the email does not exist or summarizing failed.
+
+    Raises:
+        DeadlineExceeded: If the llm_context deadline passed before a model slot was free.
+    """
+    email = session.query(Email).filter_by(id=email_id).first()
+    if not email:
+        logger.error(f"❌ Email with ID {email_id} not found.")
+        return None
+    try:
+        return ThreadSummarizer(session).summarize(thread_key(email.thread_id))
+    except DeadlineExceeded:
+        session.rollback()
+        raise
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Error summarizing thread of email {email_id}: {str(e)}")
+        return None
+
+
+def update_thread_summaries(session, email_ids: Iterable[int]) -> Dict[str, int]:
+    """
+    Fold new emails into the summaries of their threads, one pass per thread.
+
+    Args:
+        session: The database session to use.
+        email_ids: IDs of newly stored emails.
+
+    Returns:
+        The summarizer counters (updates, map_calls, cached_parts, reduce_calls).
+    """
+    summarizer = ThreadSummarizer(session)
+    keys = OrderedDict()
+    for email in session.query(Email.thread_id).filter(Email.id.in_(list(email_ids))).all():
+        keys[thread_key(email.thread_id)] = None
+    for key in keys:
+        try:
+            summarizer.summarize(key)
+        except Exception as e:
+            session.rollback()
+            logger.error(f"❌ Error summarizing thread {key}: {str(e)}")
+    return summarizer.counters
@@ -0,0 +1,466 @@
+"""
+Configurable FAISS vector indexes for the mailbox.
+
+Supported index types:
+    flat      exact search on float32 vectors (IndexFlat)
+    flat16    exact search on float16 vectors
+    sq8       exact search on 8-bit scalar-quantized vectors
+    hnsw      HNSW graph over float32 vectors
+    hnsw_sq8  HNSW graph over 8-bit scalar-quantized vectors
+    ivf_flat  inverted lists over float32 vectors
+    ivf_pq    inverted lists over product-quantized vectors
+
+Types that need training (sq8, ivf_*) collect vectors in an exact staging
+index until there are enough to train on, then switch over transparently.
+IVF indexes are first trained once there are enough vectors for
+VECTOR_INDEX_NLIST lists, and retrained with more lists whenever the
+collection has grown VECTOR_INDEX_RETRAIN_GROWTH times past the size they
+were trained on; ivf_pq keeps the original float32 vectors for that, since
+retraining on its own approximate reconstructions would compound the
+quantization error.
+
+Searches restricted to a set of ids are exhaustive on the flat and
+scalar-quantized types. HNSW and IVF only visit part of the collection and
+would miss allowed ids, so small id sets (VECTOR_INDEX_EXACT_FILTER_MAX) are
+scored exactly and larger ones search with a proportionally wider nprobe or
+efSearch.
+
+Usage:
+    python -m email_assistant.vector_index rebuild --type ivf_pq
+    python -m email_assistant.vector_index report --queries 200 --k 10
+"""
+import argparse
+import logging
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from email_assistant.config import settings
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_TYPE = getattr(settings, "VECTOR_INDEX_TYPE", "flat")
+VECTOR_INDEX_NPROBE = getattr(settings, "VECTOR_INDEX_NPROBE", 16)
+VECTOR_INDEX_EF_SEARCH = getattr(settings, "VECTOR_INDEX_EF_SEARCH", 64)
+VECTOR_INDEX_PQ_M = getattr(settings, "VECTOR_INDEX_PQ_M", 64)
+# IVF lists of the first training, which waits for enough vectors to train them
+VECTOR_INDEX_NLIST = getattr(settings, "VECTOR_INDEX_NLIST", 64)
+# Retrain an IVF index once it holds this many times the vectors it was trained on
+VECTOR_INDEX_RETRAIN_GROWTH = getattr(settings, "VECTOR_INDEX_RETRAIN_GROWTH", 4)
+# Filtered HNSW/IVF searches over at most this many ids score the ids exactly
+VECTOR_INDEX_EXACT_FILTER_MAX = getattr(settings, "VECTOR_INDEX_EXACT_FILTER_MAX", 4096)
+VECTOR_INDEX_HNSW_M = 32
+
+INDEX_TYPES = ("flat", "flat16", "sq8", "hnsw", "hnsw_sq8", "ivf_flat", "ivf_pq")
+
+# FAISS recommends at least ~39 training points per IVF centroid.
+TRAINING_POINTS_PER_LIST = 39
+MIN_TRAINING_POINTS = 1000
+# PQ...x8 trains 256 centroids per sub-quantizer
+PQ_CENTROIDS = 256
+# Types whose reconstructed vectors are too lossy to retrain from; the originals are kept
+RAW_VECTOR_TYPES = ("ivf_pq",)
+APPROXIMATE_TYPES = ("hnsw", "hnsw_sq8", "ivf_flat", "ivf_pq")
+
+
+def _ivf_lists(num_vectors: int) -> int:
+    """Pick the number of IVF lists for a collection of num_vectors, no more than it can train."""
+    wanted = max(16, min(65536, int(4 * math.sqrt(max(num_vectors, 1)))))
+    return max(1, min(wanted, num_vectors // TRAINING_POINTS_PER_LIST))
+
+
+def _pq_subquantizers(dim: int, wanted: int = VECTOR_INDEX_PQ_M) -> int:
+    """Return the largest divisor of dim not above wanted."""
+    for m in range(min(wanted, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def factory_string(index_type: str, dim: int, num_vectors: int) -> str:
+    """
+    Return the faiss.index_factory description for an index type.
+
+    Args:
+        index_type: One of INDEX_TYPES.
+        dim: Vector dimensionality.
+        num_vectors: Expected number of vectors, used to size IVF lists.
+
+    Returns:
+        The index factory string.
+    """
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "flat16":
+        return "SQfp16"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "hnsw":
+        return f"HNSW{VECTOR_INDEX_HNSW_M}"
+    if index_type == "hnsw_sq8":
+        return f"HNSW{VECTOR_INDEX_HNSW_M},SQ8"
+    if index_type == "ivf_flat":
+        return f"IVF{_ivf_lists(num_vectors)},Flat"
+    if index_type == "ivf_pq":
+        return f"IVF{_ivf_lists(num_vectors)},PQ{_pq_subquantizers(dim)}x8"
+    raise ValueError(f"Unknown vector index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}")
+
+
+def training_points_needed(index_type: str) -> int:
+    """Return how many vectors must be collected before an index of this type is first trained."""
+    if index_type == "ivf_pq":
+        return TRAINING_POINTS_PER_LIST * max(VECTOR_INDEX_NLIST, PQ_CENTROIDS)
+    if index_type.startswith("ivf"):
+        return max(MIN_TRAINING_POINTS, TRAINING_POINTS_PER_LIST * VECTOR_INDEX_NLIST)
+    if index_type in ("sq8", "hnsw_sq8"):
+        return MIN_TRAINING_POINTS
+    return 0
+
+
+class VectorIndex:
+    """Inner-product FAISS index of a configurable type over L2-normalized vectors."""
+
+    def __init__(self, index_type: str = VECTOR_INDEX_TYPE, nprobe: int = VECTOR_INDEX_NPROBE,
+                 ef_search: int = VECTOR_INDEX_EF_SEARCH):
+        """
+        Args:
+            index_type: One of INDEX_TYPES.
+            nprobe: Number of IVF lists visited per query.
+            ef_search: HNSW search breadth.
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown vector index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}")
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.index = None
+        self.staging = None
+        # Number of vectors the index was trained on (0 while staging)
+        self.trained_on = 0
+        # Original vectors of RAW_VECTOR_TYPES indexes, as arrays concatenated on use
+        self._raw = []
+
+    @property
+    def ntotal(self) -> int:
+        """Number of vectors stored."""
+        if self.index is not None:
+            return self.index.ntotal
+        return self.staging.ntotal if self.staging is not None else 0
+
+    @property
+    def dim(self) -> Optional[int]:
+        active = self.index if self.index is not None else self.staging
+        return active.d if active is not None else None
+
+    def add(self, vectors: np.ndarray) -> None:
+        """
+        Add L2-normalized float32 vectors; their ids continue from ntotal.
+
+        Args:
+            vectors: Array of shape (n, dim).
+        """
+        if self.index is not None:
+            self.index.add(vectors)
+            if self.index_type in RAW_VECTOR_TYPES:
+                self._raw.append(np.array(vectors, dtype="float32"))
+            if self.index_type.startswith("ivf") and self.ntotal >= VECTOR_INDEX_RETRAIN_GROWTH * self.trained_on:
+                logger.info(f"Retraining {self.index_type} index: {self.ntotal} vectors, trained on {self.trained_on}")
+                self.rebuild()
+            return
+        if self.staging is None:
+            self.staging = faiss.IndexFlatIP(vectors.shape[1])
+        self.staging.add(vectors)
+        if self.staging.ntotal >= training_points_needed(self.index_type):
+            self._train_from(self.staging.reconstruct_n(0, self.staging.ntotal))
+            self.staging = None
+
+    def search(self, vectors: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search the index.
+
+        Args:
+            vectors: Query vectors of shape (n, dim).
+            k: Number of neighbours per query.
+            ids: Optional array of ids the results are restricted to.
+
+        Returns:
+            Tuple of (distances, ids) arrays of shape (n, k).
+        """
+        if self.index is None:
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(ids)) if ids is not None else None
+            return self.staging.search(vectors, k, params=params)
+        if ids is not None and self.index_type in APPROXIMATE_TYPES and len(ids) <= VECTOR_INDEX_EXACT_FILTER_MAX:
+            return self._search_exact(vectors, k, ids)
+        return self.index.search(vectors, k, params=self._search_params(ids))
+
+    def reconstruct_all(self) -> np.ndarray:
+        """Return all stored vectors (approximate for quantized index types)."""
+        if self.index is None:
+            if self.staging is None:
+                return np.zeros((0, 0), dtype="float32")
+            return self.staging.reconstruct_n(0, self.staging.ntotal)
+        ivf = self._ivf()
+        if ivf is not None:
+            ivf.make_direct_map()
+        return self.index.reconstruct_n(0, self.index.ntotal)
+
+    def reconstruct(self, ids: List[int]) -> np.ndarray:
+        """Return the stored vectors with the given ids (approximate for quantized index types)."""
+        raw = self._raw_vectors()
+        if raw is not None:
+            return raw[np.asarray(ids, dtype="int64")]
+        if self.index is None:
+            active = self.staging
+        else:
+            active = self.index
+            ivf = self._ivf()
+            if ivf is not None:
+                ivf.make_direct_map()
+        return np.vstack([active.reconstruct(int(vector_id)) for vector_id in ids])
+
+    def rebuild(self, index_type: Optional[str] = None, vectors: Optional[np.ndarray] = None) -> None:
+        """
+        Retrain the index, optionally switching its type.
+
+        Args:
+            index_type: New index type, defaults to the current one.
+            vectors: Vectors to rebuild from; defaults to the original vectors where they are
+                kept and the reconstructed stored vectors otherwise.
+        """
+        if vectors is None:
+            raw = self._raw_vectors()
+            vectors = raw if raw is not None else self.reconstruct_all()
+        if index_type:
+            if index_type not in INDEX_TYPES:
+                raise ValueError(f"Unknown vector index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}")
+            self.index_type = index_type
+        self.index = None
+        self.staging = None
+        self.trained_on = 0
+        self._raw = []
+        if len(vectors):
+            self.add(np.ascontiguousarray(vectors, dtype="float32"))
+
+    def memory_bytes(self) -> int:
+        """Return the serialized size of the index in bytes."""
+        active = self.index if self.index is not None else self.staging
+        return int(faiss.serialize_index(active).nbytes) if active is not None else 0
+
+    def save(self, path: str) -> None:
+        """Write the index to path, and the original vectors (if kept) to path + ".raw.npy"."""
+        active = self.index if self.index is not None else self.staging
+        if active is not None:
+            faiss.write_index(active, path)
+        raw = self._raw_vectors()
+        if raw is not None:
+            with open(f"{path}.raw.npy", "wb") as f:
+                np.save(f, raw)
+
+    @classmethod
+    def load(cls, path: str, index_type: str = VECTOR_INDEX_TYPE) -> "VectorIndex":
+        """
+        Read an index written by save().
+
+        Args:
+            path: File written by save().
+            index_type: Type the index was built as.
+
+        Returns:
+            The loaded VectorIndex.
+        """
+        vector_index = cls(index_type)
+        loaded = faiss.read_index(path)
+        if training_points_needed(index_type) and isinstance(loaded, faiss.IndexFlat):
+            vector_index.staging = loaded
+        else:
+            vector_index.index = loaded
+            # The training size is not saved; count growth from the loaded size
+            vector_index.trained_on = loaded.ntotal
+            if index_type in RAW_VECTOR_TYPES:
+                raw_path = f"{path}.raw.npy"
+                if os.path.exists(raw_path) and len(np.load(raw_path, mmap_mode="r")) == loaded.ntotal:
+                    vector_index._raw = [np.load(raw_path)]
+                else:
+                    logger.warning(f"⚠️ No original vectors saved with {path}, later retraining uses reconstructions")
+                    vector_index._raw = [vector_index.reconstruct_all()]
+        return vector_index
+
+    def _train_from(self, vectors: np.ndarray) -> None:
+        description = factory_string(self.index_type, vectors.shape[1], len(vectors))
+        index = faiss.index_factory(vectors.shape[1], description, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            started = time.perf_counter()
+            index.train(vectors)
+            logger.info(f"✅ Trained {description} index on {len(vectors)} vectors in {time.perf_counter() - started:.1f}s")
+        index.add(vectors)
+        self.index = index
+        self.trained_on = len(vectors)
+        self._raw = [np.array(vectors, dtype="float32")] if self.index_type in RAW_VECTOR_TYPES else []
+
+    def _raw_vectors(self) -> Optional[np.ndarray]:
+        if not self._raw:
+            return None
+        if len(self._raw) > 1:
+            self._raw = [np.concatenate(self._raw)]
+        return self._raw[0]
+
+    def _search_exact(self, vectors: np.ndarray, k: int, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Score every allowed id against the queries, shaped like a FAISS search result."""
+        ids = np.asarray(ids, dtype="int64")
+        scores = vectors @ self.reconstruct(ids.tolist()).T if len(ids) else np.zeros((len(vectors), 0), "float32")
+        distances = np.full((len(vectors), k), -np.inf, dtype="float32")
+        labels = np.full((len(vectors), k), -1, dtype="int64")
+        top = min(k, len(ids))
+        if top:
+            best = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+            order = np.take_along_axis(-scores, best, axis=1).argsort(axis=1)
+            best = np.take_along_axis(best, order, axis=1)
+            distances[:, :top] = np.take_along_axis(scores, best, axis=1)
+            labels[:, :top] = ids[best]
+        return distances, labels
+
+    def _ivf(self):
+        try:
+            return faiss.extract_index_ivf(self.index)
+        except RuntimeError:
+            return None
+
+    def _search_params(self, ids: Optional[np.ndarray]):
+        selector = faiss.IDSelectorBatch(ids) if ids is not None else None
+        # Visit more of the index in proportion to the ids filtered out
+        widen = self.ntotal / max(len(ids), 1) if ids is not None else 1.0
+        if self.index_type.startswith("ivf"):
+            nlist = self._ivf().nlist
+            return faiss.SearchParametersIVF(sel=selector, nprobe=min(nlist, math.ceil(self.nprobe * widen)))
+        if self.index_type.startswith("hnsw"):
+            return faiss.SearchParametersHNSW(sel=selector,
+                                              efSearch=min(max(self.ntotal, 1), math.ceil(self.ef_search * widen)))
+        return faiss.SearchParameters(sel=selector) if selector is not None else None
+
+
+def evaluate_index(vector_index: VectorIndex, queries: np.ndarray, ground_truth: np.ndarray, k: int) -> Dict[str, float]:
+    """
+    Measure recall@k and query latency of an index against exact results.
+
+    Args:
+        vector_index: The index to evaluate.
+        queries: Query vectors of shape (n, dim).
+        ground_truth: Exact neighbour ids of shape (n, k).
+        k: Number of neighbours.
+
+    Returns:
+        Dictionary with recall, mean and p95 latency in milliseconds.
+    """
+    latencies = []
+    hits = 0
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        _, ids = vector_index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(set(ids[0].tolist()) & set(ground_truth[i].tolist()))
+    latencies.sort()
+    return {
+        "recall": hits / float(len(queries) * k) if len(queries) else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+    }
+
+
+def recall_latency_report(vectors: np.ndarray, index_types: List[str], num_queries: int = 200,
+                          k: int = 10) -> List[Dict[str, float]]:
+    """
+    Build each index type over vectors and report recall versus latency.
+
+    Queries are stored vectors with a little noise; ground truth comes from
+    exact inner-product search. IVF types are swept over nprobe and HNSW
+    types over efSearch.
+
+    Args:
+        vectors: L2-normalized vectors of shape (n, dim).
+        index_types: Index types to evaluate.
+        num_queries: Number of queries.
+        k: Number of neighbours.
+
+    Returns:
+        One row per (index type, search setting).
+    """
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + rng.normal(scale=0.01, size=(len(picks), vectors.shape[1])).astype("float32")
+    faiss.normalize_L2(queries)
+
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, k)
+
+    rows = []
+    for index_type in index_types:
+        vector_index = VectorIndex(index_type)
+        started = time.perf_counter()
+        vector_index.rebuild(vectors=vectors)
+        build_seconds = time.perf_counter() - started
+        if index_type.startswith("ivf"):
+            settings_to_try = [("nprobe", value) for value in (1, 4, 16, 64)]
+        elif index_type.startswith("hnsw"):
+            settings_to_try = [("efSearch", value) for value in (16, 64, 256)]
+        else:
+            settings_to_try = [("-", 0)]
+        for name, value in settings_to_try:
+            if name == "nprobe":
+                vector_index.nprobe = value
+            elif name == "efSearch":
+                vector_index.ef_search = value
+            row = {"index_type": index_type, "param": f"{name}={value}" if value else "-",
+                   "build_s": build_seconds,
+                   "bytes_per_vector": vector_index.memory_bytes() / max(vector_index.ntotal, 1)}
+            row.update(evaluate_index(vector_index, queries, ground_truth, k))
+            rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the mailbox vector index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="Train and rebuild the mailbox vector index")
+    rebuild_parser.add_argument("--type", choices=INDEX_TYPES, default=VECTOR_INDEX_TYPE)
+    rebuild_parser.add_argument("--reembed", action="store_true",
+                                help="Re-embed every email instead of reusing stored (possibly quantized) vectors")
+
+    report_parser = subparsers.add_parser("report", help="Report recall versus latency for each index type")
+    report_parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    report_parser.add_argument("--queries", type=int, default=200)
+    report_parser.add_argument("--k", type=int, default=10)
+
+    args = parser.parse_args()
+
+    from email_assistant.models import db
+    from email_assistant.rag_setup import get_mailbox_index
+
+    mailbox_index = get_mailbox_index()
+    if args.command == "rebuild" and args.reembed:
+        mailbox_index.reset(index_type=args.type)
+    mailbox_index.refresh(db)
+
+    if args.command == "rebuild":
+        if not args.reembed:
+            mailbox_index.rebuild_vectors(args.type)
+        mailbox_index.save()
+        print(f"Rebuilt {args.type} index with {mailbox_index.vectors.ntotal} vectors "
+              f"({mailbox_index.vectors.memory_bytes() / 1e6:.1f} MB)")
+    else:
+        vectors = mailbox_index.vectors.reconstruct_all()
+        print(f"{'index':<10} {'param':<14} {'recall@' + str(args.k):>10} {'mean ms':>9} {'p95 ms':>9} "
+              f"{'B/vector':>9} {'build s':>8}")
+        for row in recall_latency_report(vectors, args.types, args.queries, args.k):
+            print(f"{row['index_type']:<10} {row['param']:<14} {row['recall']:>10.3f} {row['mean_ms']:>9.3f} "
+                  f"{row['p95_ms']:>9.3f} {row['bytes_per_vector']:>9.0f} {row['build_s']:>8.2f}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
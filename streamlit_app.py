@@ -1,17 +1,22 @@
 import streamlit as st
-from email_assistant.rag_setup import chat_model,extract_meeting_details,chatbot_interaction
-from email_assistant.models import db
+from datetime import datetime
+from email_assistant.models import Email, db
 from sqlalchemy.sql import text
-from email_assistant.store_emails import store_emails,start_email_monitor
-from email_assistant.slack_operations import SlackOperations
-
-from email_assistant.save_draft_email import save_draft_if_needed
-from email_assistant.web_search_service import WebSearchService
+from email_assistant.stream_filter import YES_NO
+from email_assistant.ollama_models import start_model_warmup
+# Feature modules (LLM, Google, Slack, web search) are imported by the page that
+# uses them so Streamlit reruns of the other pages do not load them.
 # from email_assistant.process_meeting_email import process_email_to_calendar
 # from .store_emails import store_emails , start_email_monitor
 
 # Initialize AI Service
 
+@st.cache_resource
+def model_warmup():
+    """Load and pin the Ollama models once per Streamlit server process."""
+    return start_model_warmup()
+
+warmup = model_warmup()
 
 # Streamlit App Title
 st.title("AI-Powered Email Assistant")
@@ -32,6 +37,10 @@ options = st.sidebar.radio(
         "Chat with Chatbot",
     ],
 )
+if warmup.is_ready():
+    st.sidebar.success("Models ready")
+else:
+    st.sidebar.info("Models warming up, the first answer may be slow")
 
 # Home Page
 if options == "Home":
@@ -52,6 +61,7 @@ if options == "Home":
 elif options == "Fetch Emails":
     st.header("Fetch Emails from Gmail")
     if st.button("Fetch Emails"):
+        from email_assistant.store_emails import store_emails
         try:
             st.write("Fetching emails...")
             store_emails()
@@ -81,17 +91,32 @@ elif options == "View Emails":
 elif options == "Summarize Email":
     st.header("Summarize Email")
     email_id = st.number_input("Enter Email ID to Summarize", min_value=1, step=1)
+    whole_thread = st.checkbox("Summarize the whole thread")
     if st.button("Summarize Email"):
+        from email_assistant.enrichment import get_stored_analysis
+        from email_assistant.llm_scheduler import LLM_INTERACTIVE_TIMEOUT, DeadlineExceeded, llm_context
+        from email_assistant.rag_setup import chat_model
+        from email_assistant.thread_summaries import summarize_thread
         try:
             session = db()  # Use the scoped session
             email_data = session.execute(text(f"SELECT body FROM emails WHERE id = {email_id}")).fetchone()
             if email_data:
 
-                summary = chat_model(email_id,"Summarize the email content")
+                # Use the precomputed summary when the email has been analysed already
+                analysis = get_stored_analysis(session, email_id)
+                with llm_context(timeout=LLM_INTERACTIVE_TIMEOUT):
+                    if whole_thread:
+                        summary = summarize_thread(session, email_id) or "Error summarizing thread"
+                    elif analysis and analysis["summary"]:
+                        summary = analysis["summary"]
+                    else:
+                        summary = chat_model(email_id,"Summarize the email content")
                 st.write("### Email Summary")
                 st.write(summary)
             else:
                 st.warning(f"No email found with ID {email_id}.")
+        except DeadlineExceeded:
+            st.warning("The assistant is busy with other requests. Please try again in a moment.")
         except Exception as e:
             st.error(f"Error summarizing email: {str(e)}")
 
@@ -100,19 +125,25 @@ elif options == "Draft Reply":
     st.header("Draft Reply to an Email")
     email_id = st.number_input("Enter Email ID to Draft Reply", min_value=1, step=1)
     if st.button("Draft Reply"):
+        from email_assistant.llm_scheduler import LLM_INTERACTIVE_TIMEOUT, DeadlineExceeded, llm_context
+        from email_assistant.rag_setup import chat_model
+        from email_assistant.save_draft_email import save_draft_if_needed
         try:
             session = db()  # Use the scoped session
             email_data,sender = session.execute(text(f"SELECT body, sender FROM emails WHERE id = {email_id}")).fetchone()
 
             if email_data:
 
-                draft = chat_model(email_id,"Draft a reply of the email or acknowledgement of the mail to the email to the sender. Understand the email context, what type of reply is sender asking for or what type of reply needed.Draft mail by adressing sender name in original as receipent of drafted reply mail.")
+                with llm_context(timeout=LLM_INTERACTIVE_TIMEOUT):
+                    draft = chat_model(email_id,"Draft a reply of the email or acknowledgement of the mail to the email to the sender. Understand the email context, what type of reply is sender asking for or what type of reply needed.Draft mail by adressing sender name in original as receipent of drafted reply mail.")
                 st.write("### Drafted Reply")
                 st.text_area("Drafted Email", value=draft, height=200)
                 save_draft_if_needed("Reply to your email", draft, sender)
                 st.success("Draft saved to Gmail successfully!")
             else:
                 st.warning(f"No email found with ID {email_id}.")
+        except DeadlineExceeded:
+            st.warning("The assistant is busy with other requests. Please try again in a moment.")
         except Exception as e:
             st.error(f"Error drafting reply: {str(e)}")
 
@@ -121,6 +152,8 @@ elif options == "Web Search":
     st.header("Perform Web Search Based on Email Content")
     email_id = st.number_input("Enter Email ID to Analyze for Web Search", min_value=1, step=1)
     if st.button("Analyze and Search"):
+        from email_assistant.rag_setup import chat_model
+        from email_assistant.web_search_service import WebSearchService
         try:
             # Retrieve email content from the database
             session = db()  # Use the scoped session
@@ -131,7 +164,7 @@ elif options == "Web Search":
 
                 # Use chat_model to determine if a web search is needed
                 st.write("Analyzing email content to determine if a web search is required...")
-                search_needed = chat_model(email_id, "Does this email include a question or request for information that is not provided in the email itself, and would require searching the web to answer? or Does this email include a question or request for information that is not provided in the email itself, and would require searching the web to answer?  Respond with 'Yes' or 'No' - onw word only.")
+                search_needed = chat_model(email_id, "Does this email include a question or request for information that is not provided in the email itself, and would require searching the web to answer? or Does this email include a question or request for information that is not provided in the email itself, and would require searching the web to answer?  Respond with 'Yes' or 'No' - onw word only.", stop=YES_NO)
 
                 if search_needed.strip().lower() == "yes":
                     st.write("Web search is required. Performing search...")
@@ -172,33 +205,49 @@ elif options == "Slack Integration":
 
 
     if st.button("Check and Forward to Slack"):
+        from email_assistant.classifier import get_cascade
+        from email_assistant.enrichment import get_stored_analysis
+        from email_assistant.rag_setup import chat_model
+        from email_assistant.slack_operations import SlackOperations
         try:
             # Retrieve email content from the database
             session = db()  # Use the scoped session
-            email_data = session.execute(text(f"SELECT body FROM emails WHERE id = {email_id}")).fetchone()
+            email_data = session.execute(text(f"SELECT body, subject FROM emails WHERE id = {email_id}")).fetchone()
 
             if email_data:
 
-                # Check if the email is important using chat_model
+                # Check if the email is important, using the precomputed analysis when available
                 st.write("Analyzing email to determine if it is important...")
-                is_important = chat_model(email_id, "Is this email important? Respond with 'Yes' or 'No'.")
+                analysis = get_stored_analysis(session, email_id)
+                if analysis:
+                    is_important = analysis["is_important"]
+                else:
+                    is_important, _ = get_cascade().classify(
+                        "is_important", email_data[1], email_data[0],
+                        lambda: chat_model(email_id, "Is this email important? Respond with 'Yes' or 'No'.", stop=YES_NO),
+                    )
 
-                if is_important.strip().lower() == "yes":
+                if is_important:
                     st.write("The email is marked as important.")
 
                     # Extract the summary of the email
                     st.write("Extracting summary of the email...")
-                    email_summary = chat_model(email_id, "Summarize the email content.")
+                    if analysis and analysis["summary"]:
+                        email_summary = analysis["summary"]
+                    else:
+                        email_summary = chat_model(email_id, "Summarize the email content.")
                     st.write(f"Email Summary: {email_summary}")
 
-                    # Send the summary to Slack
+                    # Send the summary to Slack (through the outbox, so rate limits only delay it)
                     slack_service = SlackOperations()
-                    success = slack_service.send_message(email_summary)
+                    status = slack_service.forward_email(email_id, email_data[1] or "", email_summary)
 
-                    if success:
+                    if status == "sent":
                         st.success(f"Email summary forwarded to Slack channel  successfully!")
-                    else:
+                    elif status == "failed":
                         st.error("Failed to forward email to Slack. Please check the Slack token and channel.")
+                    else:
+                        st.info("Email summary queued; the Slack delivery worker will forward it shortly.")
                 else:
                     st.info("The email is not marked as important. No action taken.")
             else:
@@ -211,24 +260,35 @@ elif options == "Schedule Meeting":
     st.header("Schedule a Meeting")
     email_id = st.number_input("Enter Email ID to Schedule Meeting", min_value=1, step=1)
     if st.button("Schedule Meeting"):
+        from email_assistant.classifier import get_cascade
+        from email_assistant.enrichment import get_stored_analysis
+        from email_assistant.rag_setup import chat_model, extract_meeting_details
         try:
             # Retrieve email content from the database
             session = db()  # Use the scoped session
-            email_data = session.execute(text(f"SELECT body FROM emails WHERE id = {email_id}")).fetchone()
+            email_data = session.execute(text(f"SELECT body, subject, message_id FROM emails WHERE id = {email_id}")).fetchone()
 
             if email_data:
                 email_body = email_data[0]
 
                 # Check if the email is about meeting scheduling
                 st.write("Analyzing email to determine if it contains meeting details...")
-                is_meeting_email = chat_model(email_id, "Does the contain word - meeting? Respond with 'Yes' or 'No'.")
+                analysis = get_stored_analysis(session, email_id)
+                if analysis:
+                    is_meeting_email = analysis["has_meeting"]
+                else:
+                    is_meeting_email, _ = get_cascade().classify(
+                        "has_meeting", email_data[1], email_body,
+                        lambda: chat_model(email_id, "Does the contain word - meeting? Respond with 'Yes' or 'No'.", stop=YES_NO),
+                    )
 
-                if is_meeting_email.strip().lower() == "yes":
+                if is_meeting_email:
                     st.write("Meeting details detected in the email.")
 
-                    # Extract meeting details using extract_meeting_details
+                    # Extract meeting details, reading "tomorrow" or "next Friday" from when the email was sent
 
-                    meeting_details = extract_meeting_details(email_body)
+                    sent_at = session.get(Email, email_id).timestamp
+                    meeting_details = extract_meeting_details(email_body, source_id=email_data[2], reference=sent_at)
 
                     if meeting_details:
                         st.write("### Extracted Meeting Details")
@@ -260,14 +320,36 @@ elif options == "Chat with Chatbot":
     # User input
     user_input = st.text_input("You:", placeholder="Type your message here...")
 
+    # Optional filters on the emails the assistant answers from
+    with st.expander("Filter emails"):
+        sender_filter = st.text_input("Sender contains", value="")
+        priority_filter = st.selectbox("Priority", ["Any", "high", "normal"])
+        use_dates = st.checkbox("Limit to a date range")
+        date_from = date_to = None
+        if use_dates:
+            date_from = datetime.combine(st.date_input("From"), datetime.min.time())
+            date_to = datetime.combine(st.date_input("To"), datetime.max.time())
+
     if st.button("Send"):
+        from email_assistant.llm_scheduler import LLM_INTERACTIVE_TIMEOUT, DeadlineExceeded, llm_context
+        from email_assistant.rag_setup import chatbot_interaction
         if user_input.strip():
             # Add user input to chat history
             st.session_state.chat_history.append({"sender": "You", "message": user_input})
 
             # Get chatbot response
             with st.spinner("AI Assistant is typing..."):
-                chatbot_response = chatbot_interaction(user_input)
+                try:
+                    with llm_context(timeout=LLM_INTERACTIVE_TIMEOUT):
+                        chatbot_response = chatbot_interaction(
+                            user_input,
+                            sender=sender_filter.strip() or None,
+                            date_from=date_from,
+                            date_to=date_to,
+                            priority=None if priority_filter == "Any" else priority_filter,
+                        )
+                except DeadlineExceeded:
+                    chatbot_response = "I'm busy with other requests right now. Please ask again in a moment."
 
             # Add chatbot response to chat history
             st.session_state.chat_history.append({"sender": "AI Assistant", "message": chatbot_response})